@@ -43,13 +43,13 @@ setup(
     package_data={
         'shortstop': [
             'demo_data/*',
+            'demo_data/synthetic/*',
             'standard_prediction_model/*',
         ],
     },
     install_requires=[
         'Bio==1.6.2',
         'biopython==1.80',
-        'eli5==0.13.0',
         'joblib==1.2.0',
         'keras==2.11.0',
         'matplotlib==3.6.3',
@@ -9,43 +9,68 @@ from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import confusion_matrix, precision_score, recall_score, f1_score
 import joblib
 import random
+import gzip
+import shutil
 import pathlib
 import urllib.request
+from Bio import bgzf
 
-from shortstop.pipeline import Pipeline
+from shortstop.pipeline import Pipeline, STAGES
+from shortstop.utils import RUN_REPORT, PROGRESS
+from shortstop.training.train_model import SEARCH_MODES
+from shortstop.training.external_memory import BLOCK_ROWS
+from shortstop.prediction.distiller import STUDENT_TREES, STUDENT_DEPTH
+from shortstop.prediction.cascade import DEFAULT_BAND, FIRST_TIER_MODEL
 
 # Locate where the package was installed
 BASE_DIR = pathlib.Path(__file__).resolve().parent
 DEMO_DIR = BASE_DIR / 'demo_data'
 MODEL_DIR = BASE_DIR / 'standard_prediction_model'
+# Miniature synthetic reference the demo runs on by default (written by benchmarks/synthetic.py --demo)
+SYNTHETIC_DIR = DEMO_DIR / 'synthetic'
+
+GTF_URL = "https://ftp.ebi.ac.uk/pub/databases/gencode/Gencode_human/release_43/gencode.v43.primary_assembly.basic.annotation.gtf.gz"
+GENOME_URL = "https://ftp.ebi.ac.uk/pub/databases/gencode/Gencode_human/release_43/GRCh38.primary_assembly.genome.fa.gz"
+
+
+def demo_reference(name):
+    """Returns the path of a demo reference file: its uncompressed copy if there is one, else the .gz."""
+    path = DEMO_DIR / name
+    return str(path if path.exists() else DEMO_DIR / f'{name}.gz')
+
 
 # Auto-download if missing
 def download_demo_data():
     DEMO_DIR.mkdir(exist_ok=True)
-    gtf_path = DEMO_DIR / 'gencode.v43.primary_assembly.basic.annotation.gtf'
-    fa_path = DEMO_DIR / 'hg_38_primary.fa'
+    gtf_path = pathlib.Path(demo_reference('gencode.v43.primary_assembly.basic.annotation.gtf'))
+    fa_path = pathlib.Path(demo_reference('hg_38_primary.fa'))
 
     if not gtf_path.exists():
         print("⬇️ Downloading GTF...")
-        urllib.request.urlretrieve(
-            "https://ftp.ebi.ac.uk/pub/databases/gencode/Gencode_human/release_43/gencode.v43.primary_assembly.basic.annotation.gtf.gz",
-            DEMO_DIR / "temp.gtf.gz"
-        )
-        os.system(f"gunzip -f {DEMO_DIR}/temp.gtf.gz")
-        os.system(f"grep -v '^#' {DEMO_DIR}/temp.gtf > {gtf_path}")
-        os.remove(DEMO_DIR / 'temp.gtf')
+        # Kept compressed: the GTF reader decompresses it and skips its header lines
+        urllib.request.urlretrieve(GTF_URL, gtf_path)
         print(f"GTF downloaded to: {gtf_path}")
 
     if not fa_path.exists():
         print("⬇️ Downloading genome FASTA...")
-        urllib.request.urlretrieve(
-            "https://ftp.ebi.ac.uk/pub/databases/gencode/Gencode_human/release_43/GRCh38.primary_assembly.genome.fa.gz",
-            DEMO_DIR / "temp.fa.gz"
-        )
-        os.system(f"gunzip -f {DEMO_DIR}/temp.fa.gz")
-        os.rename(DEMO_DIR / 'temp.fa', fa_path)
+        temp_path = DEMO_DIR / 'temp.fa.gz'
+        urllib.request.urlretrieve(GENOME_URL, temp_path)
+        # GENCODE ships plain gzip; recompressed to BGZF so chunked and region runs read it at random
+        with gzip.open(temp_path, 'rb') as source, bgzf.BgzfWriter(fa_path, 'wb') as target:
+            shutil.copyfileobj(source, target, 1 << 20)
+        os.remove(temp_path)
         print(f"Hg38 reference genome FASTA downloaded to: {fa_path}")
 
+def parse_shard(value):
+    """Parses a --shard value of the form i/N (1 <= i <= N) into an (i, N) tuple."""
+    try:
+        index, n_shards = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"--shard must look like i/N, e.g. 3/16, not '{value}'")
+    if not 1 <= index <= n_shards:
+        raise argparse.ArgumentTypeError(f"--shard index must be between 1 and {n_shards}, not {index}")
+    return index, n_shards
+
 class ShortStop:
     def __init__(self):
         self.args = self.__get_args()
@@ -59,7 +84,7 @@ class ShortStop:
         self.mode_parser = self.main_parser.add_argument_group("Mode input options")
         self.mode_parser.add_argument("mode", metavar="Mode", help=(
             "Mode to run the pipeline for.\nList of Modes: "
-            "train, generate_insilico_decoy_sequences, feature_extract, predict, train_with_custom_features, demo"
+            "train, retrain, generate_insilico_decoy_sequences, feature_extract, predict, distill, merge, train_with_custom_features, demo"
         ))
 
         # Parse first positional arg to determine mode
@@ -77,21 +102,51 @@ class ShortStop:
         self.general_args.add_argument("mode", metavar=self.mode)
         self.general_args.add_argument("--outdir", "-o", help="Inform the output directory", default="shortstop_output")
         self.general_args.add_argument("--threads", "-p", help="Number of threads to be used.", default=1)
+        self.general_args.add_argument("--resume", action="store_true", help=(
+            "Skip the stages whose input files, parameters and outputs are unchanged since they last completed in --outdir, "
+            "as recorded in <outdir>/stage_manifest.json."
+        ))
+        self.general_args.add_argument("--force_stage", "--force-stage", action="append", choices=STAGES, metavar="STAGE", help=(
+            f"Re-run this stage even with --resume. Can be repeated. One of: {', '.join(STAGES)}"
+        ))
+        self.general_args.add_argument("--progress_events", "--progress-events", metavar="PATH|fd:N", help=(
+            "Also write progress as JSON-lines events (stage and task start, progress with ETA, finish) to this file, "
+            "or to an inherited file descriptor given as fd:N, for workflow managers to monitor"
+        ))
+        self.general_args.add_argument("--no_plots", "--no-plots", action="store_true", help=(
+            "Do not draw any figure. Figures are otherwise drawn from the saved results in a background process, off the critical path"
+        ))
+        self.general_args.add_argument("--html_report", "--html-report", action="store_true", help=(
+            "Also bundle the figures and metric tables of the run into a single <outdir>/plots/report.html"
+        ))
+        self.general_args.add_argument("--profile", action="store_true", help=(
+            "Dump cProfile stats of every stage to <outdir>/profiles/<stage>.prof, next to the run_report.json/csv timing report"
+        ))
 
         # Define mode-specific args
         self.__configure_mode()
 
         # NOW parse everything (after mode args are defined)
         self.args = self.parser.parse_args()
+        if self.mode == 'predict':
+            self.__check_predict_args()
 
-        # Conditionally download demo data (after args are available)
+        # Fill in the demo references (after args are available); only the full-data demo downloads
         if self.mode == 'demo':
-            if not self.args.positive_gtf or not pathlib.Path(self.args.positive_gtf).exists() \
-            or not self.args.genome or not pathlib.Path(self.args.genome).exists():
-                download_demo_data()
+            self.__set_demo_references()
 
         return self.args
 
+    def __check_predict_args(self):
+
+        """Rejects the predict options that cannot be combined, rather than silently ignoring one of them."""
+
+        if self.args.chunk_size is not None:
+            if self.args.cascade:
+                self.parser.error("--chunk_size cannot be combined with --cascade, which scores every ORF at once")
+            if self.args.sequences:
+                self.parser.error("--chunk_size cannot be combined with --sequences, which are read at once")
+
     def __configure_mode(self):
         if self.mode == 'train' or self.mode == 'insilico' or self.mode == 'feature_extract':
             self.__set_train_mode()
@@ -99,54 +154,213 @@ class ShortStop:
             self.__set_predict_mode()
         elif self.mode == 'demo':
             self.__set_demo_mode()
+        elif self.mode == 'merge':
+            self.__set_merge_mode()
+        elif self.mode == 'retrain':
+            self.__set_train_mode()
+            self.__set_retrain_mode()
+        elif self.mode == 'distill':
+            self.__set_distill_mode()
             
     def __set_train_mode(self):
         self.modeArguments = self.parser.add_argument_group("Training mode options")
-        self.modeArguments.add_argument("--positive_gtf", help="Reference gtf file", default=str(DEMO_DIR / 'gencode.v43.primary_assembly.basic.annotation.gtf'))
+        self.modeArguments.add_argument("--positive_gtf", help="Reference gtf file", default=demo_reference('gencode.v43.primary_assembly.basic.annotation.gtf'))
         self.modeArguments.add_argument("--positive_ids", help="Positive ORF ID file", default=str(DEMO_DIR / 'uniprot_entry_ensembl_ids.csv'))
         self.modeArguments.add_argument("--positive_functions", help="Protein function CSV", default=str(DEMO_DIR / 'shortstop_train_cc.csv'))
-        self.modeArguments.add_argument("--genome", help="Genome fasta file", default=str(DEMO_DIR / 'hg_38_primary.fa'))
+        self.modeArguments.add_argument("--genome", help="Genome fasta file", default=demo_reference('hg_38_primary.fa'))
         self.modeArguments.add_argument("--putative_smorfs_gtf", help="smORF GTF", default=str(DEMO_DIR / 'gencode_smorfs.gtf'))
         self.modeArguments.add_argument("--utr_length", default=25)
         self.modeArguments.add_argument("--n_insilico_smORFs", default=1000)
+        self.modeArguments.add_argument("--seed", type=int, default=None, help=(
+            "Seed of the decoy generator. The same seed gives the same decoys for any number of --threads. "
+            "Defaults to a fresh seed, which is printed"
+        ))
         self.modeArguments.add_argument("--kmer", default=4)
+        self.modeArguments.add_argument("--search", choices=SEARCH_MODES, default="exhaustive", help=(
+            "Hyperparameter search: the exhaustive grid search, or successive halving, with tree count as the resource "
+            "and early stopping for XGBoost"
+        ))
+        self.modeArguments.add_argument("--skip_umap", "--skip-umap", action="store_true", help=(
+            "Skip the UMAP diagnostic plot of the feature space; training does not depend on it"
+        ))
+        self.modeArguments.add_argument("--umap_sample", "--umap-sample", type=int, default=20000, help=(
+            "Fit UMAP on a label-stratified subsample of at most this many ORFs and project the others onto it"
+        ))
+        self.modeArguments.add_argument("--umap_pca", "--umap-pca", type=int, default=50, help=(
+            "Reduce the scaled features to this many principal components before UMAP. 0 disables the PCA"
+        ))
+        self.modeArguments.add_argument("--umap_batch", "--umap-batch", type=int, default=50000, help=(
+            "ORFs projected onto the fitted UMAP embedding per transform call"
+        ))
+        self.modeArguments.add_argument("--external_memory", "--external-memory", action="store_true", help=(
+            "Train only the XGBoost model, out of core: the feature table is streamed into on-disk blocks and "
+            "XGBoost builds its trees from external-memory matrices, for training sets that do not fit in memory"
+        ))
+        self.modeArguments.add_argument("--block_rows", "--block-rows", type=int, default=BLOCK_ROWS, help=(
+            "Rows of the feature table per on-disk block with --external_memory"
+        ))
+        self.__add_region_arguments()
+
+    def __add_region_arguments(self):
+        self.modeArguments.add_argument("--regions", default=None, help=(
+            "Restrict the run to the ORFs overlapping these regions, e.g. chr1:1-5000000,chrX (1-based, inclusive). "
+            "Only their GTF records are kept and only their bases are read from the genome, through its .fai index"
+        ))
+        self.modeArguments.add_argument("--regions_bed", "--regions-bed", default=None, help=(
+            "BED file of regions to restrict the run to, combined with --regions"
+        ))
+
+    def __set_retrain_mode(self):
+        self.retrainArguments = self.parser.add_argument_group("Retrain mode options")
+        self.retrainArguments.add_argument("--previous_outdir", "--previous-outdir", required=True, help=(
+            "Output directory of the training run to update. Its decoys, features, scaler and train/test split are reused, "
+            "and its XGBoost model keeps boosting on the extended training set"
+        ))
+        self.retrainArguments.add_argument("--boost_rounds", "--boost-rounds", type=int, default=100, help=(
+            "Boosting rounds added to the previous XGBoost model"
+        ))
 
     def __set_predict_mode(self):
         self.modeArguments = self.parser.add_argument_group("Predict mode options")
-        self.modeArguments.add_argument("--genome", default=str(DEMO_DIR / 'hg_38_primary.fa'))
+        self.modeArguments.add_argument("--genome", default=demo_reference('hg_38_primary.fa'))
         self.modeArguments.add_argument("--putative_smorfs_gtf", default=str(DEMO_DIR / 'chr1_smorfs.gtf'))
         self.modeArguments.add_argument("--utr_length", default=25)
         self.modeArguments.add_argument("--kmer", default=4)
         self.modeArguments.add_argument("--orfs_features_in_train_model", default=str(MODEL_DIR / 'orfs_features_in_train_model.csv'))
-        self.modeArguments.add_argument("--orfs_to_be_predicted", default='shortstop_output/features/extracted_features_of_smorfs.csv')
+        self.modeArguments.add_argument("--orfs_to_be_predicted", default=None, help="Extracted features to predict. Defaults to <outdir>/features/extracted_features_of_smorfs.csv")
+        self.modeArguments.add_argument("--sequences", default=None, help=(
+            "Pre-extracted sequences to predict instead of --genome and --putative_smorfs_gtf: a CSV or Parquet table "
+            "with orf_id and aa_seq (or cds_seq) and optional cds_seq, utr_5 and utr_3 columns (e.g. the "
+            "sequences/unknown_sequences.csv of an earlier run), or a protein or CDS FASTA. Missing flanks and CDSs are "
+            "filled with X"
+        ))
         self.modeArguments.add_argument("--model_scaler", default=str(MODEL_DIR / 'scaler.save'))
         self.modeArguments.add_argument("--model", default=str(MODEL_DIR / 'best_xgb_model.model'))
+        self.modeArguments.add_argument("--shard", type=parse_shard, default=None, help=(
+            "Predict only shard i of N (e.g. 3/16), a deterministic hash-balanced subset of the ORFs. "
+            "Results go to <outdir>/shard_i_of_N; combine all shards with `shortstop merge --outdir <outdir>`."
+        ))
+        self.modeArguments.add_argument("--cache_dir", default=os.path.join("~", ".cache", "shortstop"), help=(
+            "Directory of the on-disk prediction cache shared across runs and samples. ORFs whose sequences, "
+            "flanks and model bundle match a cached entry are neither featurised nor scored again."
+        ))
+        self.modeArguments.add_argument("--cache_max_entries", type=int, default=5000000, help="Least recently used cache entries beyond this are evicted")
+        self.modeArguments.add_argument("--no_cache", "--no-cache", action="store_true", help="Do not read or write the prediction cache")
+        self.modeArguments.add_argument("--chunk_size", "--chunk-size", type=int, default=None, help=(
+            "Stream the putative GTF in chunks of this many ORFs, appending results to the prediction CSVs. "
+            "Bounds peak memory by the chunk size; the feature table is not written in this mode. Not combined with "
+            "--cascade or --sequences"
+        ))
+        self.modeArguments.add_argument("--explain", action="store_true", help=(
+            "Write the contributions behind each classification to predictions/explanations.csv: exact XGBoost "
+            "tree-path contributions summed per feature block (5' and 3' UTR k-mers, kozak, first 50 nt k-mers, CKSAAP, "
+            "CTDD, APAAC) and the top contributing features. Needs an XGBoost model and bypasses the prediction cache"
+        ))
+        self.modeArguments.add_argument("--explain_top_k", "--explain-top-k", type=int, default=5, help="Features listed per ORF with --explain")
+        self.__add_region_arguments()
+        self.modeArguments.add_argument("--cascade", action="store_true", help=(
+            "Two-tier prediction: a small first-tier model scores every ORF on cheap features (length, amino acid "
+            "composition, kozak score, first 50 nt dinucleotides) and only ORFs whose SAM probability falls inside "
+            "--cascade_band are fully featurised and scored by --model. The tier column of the classifications "
+            "records which tier decided each call. Not combined with --chunk_size, --explain or the prediction cache"
+        ))
+        self.modeArguments.add_argument("--cascade_band", "--cascade-band", type=float, nargs=2, metavar=('LOW', 'HIGH'),
+                                        default=list(DEFAULT_BAND), help="Uncertainty band of the first-tier SAM probability")
+        self.modeArguments.add_argument("--first_tier_model", "--first-tier-model", default=None, help=(
+            f"First-tier model of the cascade. Defaults to {FIRST_TIER_MODEL} next to --model, written by `shortstop train`"
+        ))
+        self.modeArguments.add_argument("--cascade_report", "--cascade-report", action="store_true", help=(
+            "Also score every ORF with the full model and write the accuracy/throughput trade-off of a range of "
+            "bands to predictions/cascade_tradeoff.csv"
+        ))
+
+    def __set_distill_mode(self):
+        self.modeArguments = self.parser.add_argument_group("Distill mode options")
+        self.modeArguments.add_argument("--genome", default=demo_reference('hg_38_primary.fa'))
+        self.modeArguments.add_argument("--putative_smorfs_gtf", default=str(DEMO_DIR / 'chr1_smorfs.gtf'), help=(
+            "Unlabelled smORFs the student learns the teacher's probabilities on; the larger the better"
+        ))
+        self.modeArguments.add_argument("--utr_length", default=25)
+        self.modeArguments.add_argument("--kmer", default=4)
+        self.modeArguments.add_argument("--orfs_to_be_predicted", default=None, help=(
+            "Already extracted features of the unlabelled smORFs (e.g. <outdir>/features/extracted_features_of_smorfs.csv "
+            "of a predict run), instead of extracting them from --putative_smorfs_gtf"
+        ))
+        self.modeArguments.add_argument("--orfs_features_in_train_model", default=str(MODEL_DIR / 'orfs_features_in_train_model.csv'))
+        self.modeArguments.add_argument("--model_scaler", default=str(MODEL_DIR / 'scaler.save'))
+        self.modeArguments.add_argument("--model", default=str(MODEL_DIR / 'best_xgb_model.model'), help="Teacher model")
+        self.modeArguments.add_argument("--student_trees", "--student-trees", type=int, default=STUDENT_TREES, help="Trees of the student model")
+        self.modeArguments.add_argument("--student_depth", "--student-depth", type=int, default=STUDENT_DEPTH, help="Maximum depth of the student's trees")
+        self.modeArguments.add_argument("--seed", type=int, default=None, help="Seed of the held-out split and of the student")
 
     def __set_demo_mode(self):
         self.modeArguments = self.parser.add_argument_group("Demo mode options")
-        self.modeArguments.add_argument("--positive_gtf", default=str(DEMO_DIR / 'gencode.v43.primary_assembly.basic.annotation.gtf'))
-        self.modeArguments.add_argument("--positive_ids", default=str(DEMO_DIR / 'uniprot_entry_ensembl_ids.csv'))
-        self.modeArguments.add_argument("--positive_functions", default=str(DEMO_DIR / 'shortstop_train_cc.csv'))
-        self.modeArguments.add_argument("--genome", default=str(DEMO_DIR / 'hg_38_primary.fa'))
-        self.modeArguments.add_argument("--putative_smorfs_gtf", default=str(DEMO_DIR / 'chr1_smorfs.gtf'))
+        self.modeArguments.add_argument("--full_data", "--full-data", action="store_true", help=(
+            "Run the demo on GENCODE v43 and GRCh38 (downloaded on first use, ~1 GB) instead of the bundled "
+            "miniature synthetic reference, which runs offline in well under a minute"
+        ))
+        # References default to the miniature reference, or to the full data with --full_data
+        self.modeArguments.add_argument("--positive_gtf", default=None)
+        self.modeArguments.add_argument("--positive_ids", default=None)
+        self.modeArguments.add_argument("--positive_functions", default=None)
+        self.modeArguments.add_argument("--genome", default=None)
+        self.modeArguments.add_argument("--putative_smorfs_gtf", default=None)
         self.modeArguments.add_argument("--utr_length", default=25)
         self.modeArguments.add_argument("--n_insilico_smORFs", default=200)
+        self.modeArguments.add_argument("--seed", type=int, default=None, help=(
+            "Seed of the decoy generator. The same seed gives the same decoys for any number of --threads. "
+            "Defaults to a fresh seed, which is printed"
+        ))
         self.modeArguments.add_argument("--kmer", default=2)
         self.modeArguments.add_argument("--orfs_features_in_train_model", default=str(MODEL_DIR / 'orfs_features_in_train_model.csv'))
-        self.modeArguments.add_argument("--orfs_to_be_predicted", default='shortstop_output/features/extracted_features_of_smorfs.csv')
+        self.modeArguments.add_argument("--orfs_to_be_predicted", default=None, help="Extracted features to predict. Defaults to <outdir>/features/extracted_features_of_smorfs.csv")
         self.modeArguments.add_argument("--model_scaler", default=str(MODEL_DIR / 'scaler.save'))
         self.modeArguments.add_argument("--model", default=str(MODEL_DIR / 'best_xgb_model.model'))
+        self.__add_region_arguments()
+
+    def __set_demo_references(self):
+        if self.args.full_data:
+            defaults = {'positive_gtf': demo_reference('gencode.v43.primary_assembly.basic.annotation.gtf'),
+                        'positive_ids': str(DEMO_DIR / 'uniprot_entry_ensembl_ids.csv'),
+                        'positive_functions': str(DEMO_DIR / 'shortstop_train_cc.csv'),
+                        'genome': demo_reference('hg_38_primary.fa'),
+                        'putative_smorfs_gtf': str(DEMO_DIR / 'chr1_smorfs.gtf')}
+        else:
+            defaults = {'positive_gtf': str(SYNTHETIC_DIR / 'reference.gtf'),
+                        'positive_ids': str(SYNTHETIC_DIR / 'uniprot_ids.csv'),
+                        'positive_functions': str(SYNTHETIC_DIR / 'functions.csv'),
+                        'genome': str(SYNTHETIC_DIR / 'genome.fa'),
+                        'putative_smorfs_gtf': str(SYNTHETIC_DIR / 'smorfs.gtf')}
+        for name, default in defaults.items():
+            if getattr(self.args, name) is None:
+                setattr(self.args, name, default)
+
+        if self.args.full_data and (not pathlib.Path(self.args.positive_gtf).exists() or not pathlib.Path(self.args.genome).exists()):
+            download_demo_data()
+
+    def __set_merge_mode(self):
+        # Merge only needs --outdir: the directory the sharded predict runs wrote their shard_i_of_N folders to
+        self.modeArguments = self.parser.add_argument_group("Merge mode options")
 
     def execute(self):
-        if self.mode in ['train', 'insilico', 'feature_extract']:
-            pipeline = Pipeline(args=self.args)
-            pipeline.train()
-        elif self.mode == 'predict':
-            pipeline = Pipeline(args=self.args)
-            pipeline.predict()
-        elif self.mode == 'demo':
-            pipeline = Pipeline(args=self.args)
-            pipeline.demo()
+        pipeline = Pipeline(args=self.args)
+        try:
+            if self.mode in ['train', 'insilico', 'feature_extract']:
+                pipeline.train()
+            elif self.mode == 'retrain':
+                pipeline.retrain()
+            elif self.mode == 'predict':
+                pipeline.predict()
+            elif self.mode == 'distill':
+                pipeline.distill()
+            elif self.mode == 'demo':
+                pipeline.demo()
+            elif self.mode == 'merge':
+                pipeline.merge()
+        finally:
+            # Written even when a stage fails, to show where the time went up to that point
+            RUN_REPORT.write()
+            PROGRESS.close()
             
 
 
@@ -1,2 +1,4 @@
-from .gtf_to_seq import GTFtoSeq
+from .gtf_to_seq import GTFtoSeq, FaidxGenome, split_gtf_by_orf, orf_shard, read_gtf, load_genome, open_text, open_indexed_genome
+from .regions import Regions
 from .feature_extraction import FeatureExtraction
+from .sequence_table import read_sequence_table
@@ -6,6 +6,8 @@ import time
 from collections import Counter
 import math
 
+from ..utils import measure, PROGRESS
+
 
 class FeatureExtraction:
     def __init__(self, ids, types, labels, aa_seqs, cds_seqs, upstream_seqs, downstream_seqs, utr_length, k):
@@ -127,57 +129,70 @@ class FeatureExtraction:
 
         features_list = []
         labels_list = []
+        # Each block is one vectorised call over all ORFs, so progress is reported per block
+        task = PROGRESS.task('featurisation', total=7, unit='feature blocks')
 
         for method in [ctdd, cksaap, apaac]:
+            with measure(method.__name__, rows=len(self.aa_seq)):
             
-            if method == apaac:
-                features, labels = method(self.aa_seq, lambda_=8)
-                features = features.astype(np.float64)
-            elif method == cksaap:
-                features, labels = method(self.aa_seq)
-                # Add prefix ctd to the labels
-                labels = [f'cksaap{label}' for label in labels]
-                # Convert features to float64
-                features = features.astype(np.float64)
-            else:
-                features, labels = method(self.aa_seq)
-                # Convert features to float64
-                features = features.astype(np.float64)
+                if method == apaac:
+                    features, labels = method(self.aa_seq, lambda_=8)
+                    features = features.astype(np.float64)
+                elif method == cksaap:
+                    features, labels = method(self.aa_seq)
+                    # Add prefix ctd to the labels
+                    labels = [f'cksaap{label}' for label in labels]
+                    # Convert features to float64
+                    features = features.astype(np.float64)
+                else:
+                    features, labels = method(self.aa_seq)
+                    # Convert features to float64
+                    features = features.astype(np.float64)
             
-            labels = [str(i) for i in labels]
-            features_list.append(features)
-            labels_list += labels
+                labels = [str(i) for i in labels]
+                features_list.append(features)
+                labels_list += labels
+            task.advance()
 
         features = np.concatenate(features_list, axis=1)
         aa_df = pd.DataFrame(features, columns=labels_list)
         aa_df['orf_id'] = self.ids
         
-        upstream_sequences = [seq.upper() for seq in self.upstream_seq]
-        upstream_freq = self.kmer_frequency_list(upstream_sequences)
-        cds_upstream_kmer = pd.DataFrame(upstream_freq)
-        cds_upstream_kmer = cds_upstream_kmer.add_prefix('5_prime_')
-        cds_upstream_kmer['orf_id'] = self.ids
+        with measure('5_prime_kmers', rows=len(self.ids)):
+            upstream_sequences = [seq.upper() for seq in self.upstream_seq]
+            upstream_freq = self.kmer_frequency_list(upstream_sequences)
+            cds_upstream_kmer = pd.DataFrame(upstream_freq)
+            cds_upstream_kmer = cds_upstream_kmer.add_prefix('5_prime_')
+            cds_upstream_kmer['orf_id'] = self.ids
+        task.advance()
         
-        downstream_sequences = [seq.upper() for seq in self.downstream_seq]
-        downstream_freq = self.kmer_frequency_list(downstream_sequences)
-        cds_downstream_kmer = pd.DataFrame(downstream_freq)
-        cds_downstream_kmer = cds_downstream_kmer.add_prefix('3_prime_')
-        cds_downstream_kmer['orf_id'] = self.ids
+        with measure('3_prime_kmers', rows=len(self.ids)):
+            downstream_sequences = [seq.upper() for seq in self.downstream_seq]
+            downstream_freq = self.kmer_frequency_list(downstream_sequences)
+            cds_downstream_kmer = pd.DataFrame(downstream_freq)
+            cds_downstream_kmer = cds_downstream_kmer.add_prefix('3_prime_')
+            cds_downstream_kmer['orf_id'] = self.ids
+        task.advance()
         
         kmer_df = pd.merge(cds_upstream_kmer, cds_downstream_kmer, on='orf_id')
         kmer_df = kmer_df.fillna(0)
         
-        kozak_context = [seq[-6:] + seq2[:4] for seq, seq2 in zip(self.upstream_seq, self.cds_seq)]
-        kozak_score = self.kozak_score(kozak_context)
-        kozak_df = pd.DataFrame(kozak_score, columns=['kozak_score'])
-        kozak_df['orf_id'] = self.ids
-
-        first_50 = [seq[:50] for seq in self.cds_seq]
-        first_50_kmer = self.kmer_frequency_list(first_50)
-        first_50_kmer = pd.DataFrame(first_50_kmer)
-        first_50_kmer = first_50_kmer.add_prefix('first_50_')
-        first_50_kmer['orf_id'] = self.ids
-        first_50_kmer = first_50_kmer.fillna(0)
+        with measure('kozak', rows=len(self.ids)):
+            kozak_context = [seq[-6:] + seq2[:4] for seq, seq2 in zip(self.upstream_seq, self.cds_seq)]
+            kozak_score = self.kozak_score(kozak_context)
+            kozak_df = pd.DataFrame(kozak_score, columns=['kozak_score'])
+            kozak_df['orf_id'] = self.ids
+        task.advance()
+
+        with measure('first_50_kmers', rows=len(self.ids)):
+            first_50 = [seq[:50] for seq in self.cds_seq]
+            first_50_kmer = self.kmer_frequency_list(first_50)
+            first_50_kmer = pd.DataFrame(first_50_kmer)
+            first_50_kmer = first_50_kmer.add_prefix('first_50_')
+            first_50_kmer['orf_id'] = self.ids
+            first_50_kmer = first_50_kmer.fillna(0)
+        task.advance()
+        task.close()
 
         # Merge all features
         df = pd.merge(kmer_df, kozak_df, on='orf_id')
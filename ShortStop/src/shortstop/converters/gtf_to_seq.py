@@ -1,10 +1,16 @@
+import os
+import gzip
+import bisect
+import hashlib
+import numpy as np
 import pandas as pd
-from Bio import SeqIO
+from Bio import SeqIO, bgzf
 from Bio.Seq import Seq
 import re
 from protlearn.preprocessing import remove_unnatural
 
 from ..pipeline import PipelineStructure
+from ..utils import measure, PROGRESS, PROGRESS_BATCH
 
 # Define the sorting function somewhere in the file
 def sort_gtf_by_strand_and_position(gtf_df):
@@ -17,12 +23,290 @@ def sort_gtf_by_strand_and_position(gtf_df):
     cds_sorted = cds.groupby('attribute', group_keys=False).apply(sort_cds)
     return pd.concat([others, cds_sorted], ignore_index=True)
 
+GTF_COLUMNS = ['seqname', 'source', 'feature', 'start', 'end', 'score', 'strand', 'frame', 'attribute']
+ORF_ID_PATTERN = re.compile('gene_id (.+?);')
+
+
+def is_gzip(path):
+
+    """Returns True for a gzip-compressed file (including BGZF), from its magic bytes."""
+
+    with open(path, 'rb') as handle:
+        return handle.read(2) == b'\x1f\x8b'
+
+
+def is_bgzf(path):
+
+    """Returns True for a BGZF file (e.g. compressed with bgzip), whose blocks allow random access."""
+
+    with open(path, 'rb') as handle:
+        header = handle.read(18)
+    return header[:4] == b'\x1f\x8b\x08\x04' and header[12:14] == b'BC'
+
+
+def open_text(path):
+
+    """Opens a plain or gzip/BGZF-compressed text file for streaming."""
+
+    return gzip.open(path, 'rt') if is_gzip(path) else open(path)
+
+
+def read_gtf(gtf_file):
+
+    """
+    Reads a GTF, plain or gzip/BGZF-compressed, into a DataFrame with GTF_COLUMNS. Comment lines (#), such as
+    the header of GENCODE GTFs, are skipped.
+    """
+
+    with open_text(gtf_file) as handle:
+        n_header = 0
+        for line in handle:
+            if not line.startswith('#'):
+                break
+            n_header += 1
+    with open_text(gtf_file) as handle:
+        gtf = pd.read_csv(handle, sep='\t', header=None, names=GTF_COLUMNS, skiprows=n_header, dtype={'seqname': str})
+    comments = gtf['seqname'].str.startswith('#')
+    if comments.any():
+        # Comment lines inside the body (e.g. ### separators) are read as rows with a single field, which
+        # also turn the coordinates into floats
+        gtf = gtf[~comments].reset_index(drop=True)
+        gtf[['start', 'end']] = gtf[['start', 'end']].astype(int)
+    return gtf
+
+
+def load_genome(fasta_file):
+
+    """Reads a whole genome FASTA, plain or gzip/BGZF-compressed, into a dictionary of SeqRecords."""
+
+    with measure('genome_load') as stage, open_text(fasta_file) as handle:
+        genome = SeqIO.to_dict(SeqIO.parse(handle, "fasta"))
+        stage.rows = len(genome)
+    return genome
+
+
+def open_indexed_genome(fasta_file):
+
+    """
+    Returns a FaidxGenome of fasta_file, or the whole genome in memory when it is gzipped without BGZF
+    blocks and so cannot be read at random.
+    """
+
+    if is_gzip(fasta_file) and not is_bgzf(fasta_file):
+        print(f"🔔: {fasta_file} is gzipped without BGZF blocks, so it is read whole. Recompress it with `bgzip` for random access.")
+        return load_genome(fasta_file)
+    return FaidxGenome(fasta_file)
+
+
+class FaidxGenome:
+    """
+    Random access to slices of a genome FASTA through a samtools-style .fai index, so that only the bases
+    of the requested features are read from disk. The index is read from <fasta>.fai, or built with one
+    pass over the FASTA (and saved next to it when the directory is writable). BGZF-compressed FASTAs (bgzip)
+    are read block by block, through the .gzi block index of bgzip, built the same way.
+
+    Dictionary-like, as the output of SeqIO.to_dict: genome[seqname].seq[start:end] is a Bio.Seq.Seq.
+    """
+
+    def __init__(self, fasta_file):
+        self.fastaFile = fasta_file
+        self.bgzf = is_gzip(fasta_file)
+        if self.bgzf and not is_bgzf(fasta_file):
+            raise ValueError(f"🚨 {fasta_file} is gzipped without BGZF blocks and cannot be read at random; recompress it with `bgzip`.")
+        with measure('genome_index', rows=1):
+            self.index = self.__read_index()
+            if self.bgzf:
+                self.rawStarts, self.dataStarts = self.__read_block_index()
+        self.handle = bgzf.BgzfReader(fasta_file, 'rb') if self.bgzf else open(fasta_file, 'rb')
+
+    def __current(self, path):
+        return os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(self.fastaFile)
+
+    def __read_block_index(self):
+
+        """Returns the compressed and uncompressed start offsets of the BGZF blocks, from or into <fasta>.gzi."""
+
+        gzi = f'{self.fastaFile}.gzi'
+        if self.__current(gzi):
+            entries = np.fromfile(gzi, dtype='<u8')[1:].reshape(-1, 2)
+        else:
+            with open(self.fastaFile, 'rb') as handle:
+                entries = np.array([(raw_start, data_start) for raw_start, _, data_start, _ in bgzf.BgzfBlocks(handle)],
+                                   dtype='<u8').reshape(-1, 2)[1:]
+            try:
+                # bgzip's format: the number of entries, then (compressed, uncompressed) offsets of every block but the first
+                np.concatenate([np.array([len(entries)], dtype='<u8'), entries.ravel()]).tofile(gzi)
+            except OSError:
+                print(f"🔔: {gzi} could not be written; the block index is kept in memory for this run.")
+        return [0] + entries[:, 0].tolist(), [0] + entries[:, 1].tolist()
+
+    def __read_index(self):
+        fai = f'{self.fastaFile}.fai'
+        if self.__current(fai):
+            index = pd.read_csv(fai, sep='\t', header=None, usecols=[0, 1, 2, 3, 4], dtype={0: str})
+            return {name: (length, offset, line_bases, line_width)
+                    for name, length, offset, line_bases, line_width in index.itertuples(index=False)}
+
+        index = {}
+        name = None
+        # Offsets are in the uncompressed FASTA, as in samtools faidx
+        with (gzip.open(self.fastaFile, 'rb') if self.bgzf else open(self.fastaFile, 'rb')) as fasta:
+            offset = 0
+            for line in fasta:
+                if line.startswith(b'>'):
+                    name = line[1:].split()[0].decode()
+                    index[name] = [0, offset + len(line), 0, 0]
+                elif name is not None and line.strip():
+                    entry = index[name]
+                    if entry[2] == 0:
+                        entry[2], entry[3] = len(line.rstrip(b'\r\n')), len(line)
+                    entry[0] += len(line.rstrip(b'\r\n'))
+                offset += len(line)
+        try:
+            with open(fai, 'w') as handle:
+                for name, (length, offset, line_bases, line_width) in index.items():
+                    handle.write(f'{name}\t{length}\t{offset}\t{line_bases}\t{line_width}\n')
+        except OSError:
+            print(f"🔔: {fai} could not be written; the FASTA index is kept in memory for this run.")
+        return {name: tuple(entry) for name, entry in index.items()}
+
+    def fetch(self, seqname, start, end):
+
+        """Returns the bases [start, end) (0-based) of seqname as a string."""
+
+        length, offset, line_bases, line_width = self.index[seqname]
+        start, end = max(0, start), min(length, end)
+        if end <= start:
+            return ''
+        first = offset + (start // line_bases) * line_width + start % line_bases
+        last = offset + ((end - 1) // line_bases) * line_width + (end - 1) % line_bases
+        if self.bgzf:
+            block = bisect.bisect_right(self.dataStarts, first) - 1
+            self.handle.seek(bgzf.make_virtual_offset(self.rawStarts[block], first - self.dataStarts[block]))
+        else:
+            self.handle.seek(first)
+        return self.handle.read(last - first + 1).replace(b'\n', b'').replace(b'\r', b'').decode()
+
+    def __getitem__(self, seqname):
+        if seqname not in self.index:
+            raise KeyError(seqname)
+        return _IndexedRecord(self, seqname)
+
+    def __contains__(self, seqname):
+        return seqname in self.index
+
+    def close(self):
+        self.handle.close()
+
+
+class _IndexedRecord:
+    def __init__(self, genome, seqname):
+        self.seq = _IndexedSequence(genome, seqname)
+
+
+class _IndexedSequence:
+    def __init__(self, genome, seqname):
+        self.genome = genome
+        self.seqname = seqname
+
+    def __getitem__(self, bounds):
+        if not isinstance(bounds, slice) or bounds.step not in (None, 1):
+            raise TypeError("Indexed genome sequences only support contiguous slices.")
+        length = self.genome.index[self.seqname][0]
+        start, end, _ = bounds.indices(length)
+        return Seq(self.genome.fetch(self.seqname, start, end))
+
+    def __len__(self):
+        return self.genome.index[self.seqname][0]
+
+
+def orf_shard(orf_id, n_shards):
+    """
+    Returns the 1-based shard of an ORF. The shard is derived from a hash of the ORF ID, so it is
+    deterministic across runs and machines and spreads ORFs evenly over the shards.
+    """
+    return int(hashlib.md5(orf_id.encode()).hexdigest(), 16) % n_shards + 1
+
+
+def split_gtf_by_orf(gtf_file, chunk_size, chunk_dir, shard=None):
+    """
+    Splits a GTF into ORF-complete chunk files without loading it into memory.
+
+    Every row of an ORF (its transcript and all of its CDS rows) is written to the same chunk,
+    even when the rows are not contiguous in the input. ORFs are assigned to chunks in order of
+    first appearance, chunk_size ORFs per chunk.
+
+    Args:
+        gtf_file (str): Path to the putative smORF GTF.
+        chunk_size (int): Number of ORFs per chunk.
+        chunk_dir (str): Directory where the chunk GTFs are written.
+        shard (tuple): Optional (shard index, number of shards); ORFs of other shards are skipped.
+
+    Returns:
+        list: Paths of the chunk GTF files, in order.
+    """
+    chunk_size = int(chunk_size)
+    os.makedirs(chunk_dir, exist_ok=True)
+    orf_to_chunk = {}
+    buffers = {}
+    buffered_lines = 0
+    chunk_files = []
+
+    def flush():
+        for chunk, lines in buffers.items():
+            if lines:
+                with open(chunk_files[chunk], 'a') as handle:
+                    handle.writelines(lines)
+                buffers[chunk] = []
+
+    with open_text(gtf_file) as gtf:
+        for line in gtf:
+            if line.startswith('#') or not line.strip():
+                continue
+            orf_id = ORF_ID_PATTERN.findall(line.split('\t')[-1])
+            if not orf_id:
+                continue
+            if shard is not None and orf_shard(orf_id[0], shard[1]) != shard[0]:
+                continue
+            chunk = orf_to_chunk.get(orf_id[0])
+            if chunk is None:
+                chunk = orf_to_chunk[orf_id[0]] = len(orf_to_chunk) // chunk_size
+                if chunk == len(chunk_files):
+                    chunk_files.append(os.path.join(chunk_dir, f'chunk_{chunk:06d}.gtf'))
+                    open(chunk_files[chunk], 'w').close()
+                    buffers[chunk] = []
+            buffers[chunk].append(line)
+            buffered_lines += 1
+            if buffered_lines >= 100000:  # Bound memory by the number of GTF lines held at once
+                flush()
+                buffered_lines = 0
+
+    flush()
+    print(f"     {len(orf_to_chunk)} ORFs split into {len(chunk_files)} chunks of up to {chunk_size} ORFs.")
+    return chunk_files
+
+
 class GTFtoSeq(PipelineStructure):
 
-    def __init__(self, gtf_file=None, fasta_file=None, utr_length=25, cds_order = 'First'):
-        self.gtf =  pd.read_csv(gtf_file, sep='\t', header=None)
-        self.gtf.columns = ['seqname', 'source', 'feature', 'start', 'end', 'score', 'strand', 'frame', 'attribute']
-        self.fasta_dict = SeqIO.to_dict(SeqIO.parse(fasta_file, "fasta"))
+    def __init__(self, gtf_file=None, fasta_file=None, utr_length=25, cds_order = 'First', fasta_dict=None, shard=None, regions=None):
+        with measure('gtf_parse') as stage:
+            self.gtf = read_gtf(gtf_file)
+            if shard is not None:
+                # Keep only the ORFs of this shard; all rows of an ORF share its ID and so its shard
+                orf_ids = self.gtf['attribute'].str.extract(ORF_ID_PATTERN, expand=False)
+                self.gtf = self.gtf[orf_ids.map(lambda orf_id: isinstance(orf_id, str) and orf_shard(orf_id, shard[1]) == shard[0])]
+            if regions is not None:
+                # Keep only the ORFs overlapping the regions (a converters.Regions), with all of their rows
+                self.gtf = regions.filter_gtf(self.gtf, self.gtf['attribute'].str.extract(ORF_ID_PATTERN, expand=False))
+            stage.rows = len(self.gtf)
+        # A pre-loaded genome (e.g. a FaidxGenome shared across chunks) avoids re-reading the FASTA
+        if fasta_dict is not None:
+            self.fasta_dict = fasta_dict
+        elif regions is not None:
+            # Only the bases of the ORFs kept are read, through the FASTA index
+            self.fasta_dict = open_indexed_genome(fasta_file)
+        else:
+            self.fasta_dict = load_genome(fasta_file)
         self.cds_order = cds_order
         self.utr_length = utr_length
 
@@ -72,22 +356,25 @@ class GTFtoSeq(PipelineStructure):
         cds_ends = []
         cds_strands = []
 
-        for _, row in self.gtf.iterrows():
-            if row["feature"] == "transcript":
-                transcript_id = re.findall('gene_id (.+?);', row["attribute"])[0]
-                transcript_ids.append(transcript_id)
-                transcript_chr.append(row["seqname"])
-                transcript_starts.append(row['start'])
-                transcript_ends.append(row['end'])
-
-            elif row["feature"] == "CDS":
-                cds_id = re.findall('gene_id (.+?);', row["attribute"])[0]
-                cds_ids.append(cds_id)
-                cds_seqs.append(dna_converter(row["seqname"], row["start"], row["end"], row["strand"], self.fasta_dict))
-                cds_chr.append(row["seqname"])
-                cds_starts.append(row['start'])
-                cds_ends.append(row['end'])
-                cds_strands.append(row['strand'])
+        with measure('cds_extraction', rows=len(self.gtf)), PROGRESS.task('cds_extraction', len(self.gtf), 'GTF rows') as task:
+            for n_row, (_, row) in enumerate(self.gtf.iterrows()):
+                if n_row % PROGRESS_BATCH == 0:
+                    task.update(n_row)
+                if row["feature"] == "transcript":
+                    transcript_id = re.findall('gene_id (.+?);', row["attribute"])[0]
+                    transcript_ids.append(transcript_id)
+                    transcript_chr.append(row["seqname"])
+                    transcript_starts.append(row['start'])
+                    transcript_ends.append(row['end'])
+
+                elif row["feature"] == "CDS":
+                    cds_id = re.findall('gene_id (.+?);', row["attribute"])[0]
+                    cds_ids.append(cds_id)
+                    cds_seqs.append(dna_converter(row["seqname"], row["start"], row["end"], row["strand"], self.fasta_dict))
+                    cds_chr.append(row["seqname"])
+                    cds_starts.append(row['start'])
+                    cds_ends.append(row['end'])
+                    cds_strands.append(row['strand'])
 
         transcript_df = pd.DataFrame({"orf_id": transcript_ids ,"transcript_starts": transcript_starts, "transcript_ends": transcript_ends})
         cds_df = pd.DataFrame({"orf_id": cds_ids, "cds_seq": cds_seqs, "cds_chr": cds_chr, "cds_strand": cds_strands, "cds_starts": cds_starts, "cds_ends": cds_ends})
@@ -124,9 +411,10 @@ class GTFtoSeq(PipelineStructure):
 
         cds_df = pd.concat([csd_df_forward, cds_df_reverse], ignore_index=True)
     
-        cds_df['cds_protein_seq'] = cds_df['cds_seq'].apply(lambda x: Seq(x).translate()) # Transale cds_seq into protein sequence
-        cds_df['cds_protein_seq'] = cds_df['cds_protein_seq'].astype(str)
-        cds_df['cds_protein_seq'] = cds_df['cds_protein_seq'].str.replace('*', '', regex=False)
+        with measure('translation', rows=len(cds_df)):
+            cds_df['cds_protein_seq'] = cds_df['cds_seq'].apply(lambda x: Seq(x).translate()) # Transale cds_seq into protein sequence
+            cds_df['cds_protein_seq'] = cds_df['cds_protein_seq'].astype(str)
+            cds_df['cds_protein_seq'] = cds_df['cds_protein_seq'].str.replace('*', '', regex=False)
         
         # Only keep the sequence if it starts with M
         cds_df = cds_df[cds_df['cds_protein_seq'].str.startswith('M')]
@@ -163,14 +451,17 @@ class GTFtoSeq(PipelineStructure):
         cds_and_transcript['utr_5'] = ""
         cds_and_transcript['utr_3'] = ""
 
-        for row in range(len(cds_and_transcript)):
-            if cds_and_transcript.iloc[row]['cds_strand'] == '+':
-                cds_and_transcript.iloc[row, cds_and_transcript.columns.get_loc('utr_5')] = dna_converter(cds_and_transcript.iloc[row]['cds_chr'], cds_and_transcript.iloc[row]['transcript_starts'], cds_and_transcript.iloc[row]['cds_starts']-1, cds_and_transcript.iloc[row]['cds_strand'], self.fasta_dict)
-                cds_and_transcript.iloc[row, cds_and_transcript.columns.get_loc('utr_3')] = dna_converter(cds_and_transcript.iloc[row]['cds_chr'], cds_and_transcript.iloc[row]['cds_ends']+4, cds_and_transcript.iloc[row]['transcript_ends'], cds_and_transcript.iloc[row]['cds_strand'], self.fasta_dict)
-            else:
-                cds_and_transcript.iloc[row, cds_and_transcript.columns.get_loc('utr_5')] = dna_converter(cds_and_transcript.iloc[row]['cds_chr'], cds_and_transcript.iloc[row]['cds_starts']+1, cds_and_transcript.iloc[row]['transcript_ends'], cds_and_transcript.iloc[row]['cds_strand'], self.fasta_dict)
-                cds_and_transcript.iloc[row, cds_and_transcript.columns.get_loc('utr_3')] = dna_converter(cds_and_transcript.iloc[row]['cds_chr'], cds_and_transcript.iloc[row]['transcript_starts'], cds_and_transcript.iloc[row]['cds_ends']-4, cds_and_transcript.iloc[row]['cds_strand'], self.fasta_dict)
-        
+        with measure('utr_extraction', rows=len(cds_and_transcript)), PROGRESS.task('utr_extraction', len(cds_and_transcript), 'ORFs') as task:
+            for row in range(len(cds_and_transcript)):
+                if row % PROGRESS_BATCH == 0:
+                    task.update(row)
+                if cds_and_transcript.iloc[row]['cds_strand'] == '+':
+                    cds_and_transcript.iloc[row, cds_and_transcript.columns.get_loc('utr_5')] = dna_converter(cds_and_transcript.iloc[row]['cds_chr'], cds_and_transcript.iloc[row]['transcript_starts'], cds_and_transcript.iloc[row]['cds_starts']-1, cds_and_transcript.iloc[row]['cds_strand'], self.fasta_dict)
+                    cds_and_transcript.iloc[row, cds_and_transcript.columns.get_loc('utr_3')] = dna_converter(cds_and_transcript.iloc[row]['cds_chr'], cds_and_transcript.iloc[row]['cds_ends']+4, cds_and_transcript.iloc[row]['transcript_ends'], cds_and_transcript.iloc[row]['cds_strand'], self.fasta_dict)
+                else:
+                    cds_and_transcript.iloc[row, cds_and_transcript.columns.get_loc('utr_5')] = dna_converter(cds_and_transcript.iloc[row]['cds_chr'], cds_and_transcript.iloc[row]['cds_starts']+1, cds_and_transcript.iloc[row]['transcript_ends'], cds_and_transcript.iloc[row]['cds_strand'], self.fasta_dict)
+                    cds_and_transcript.iloc[row, cds_and_transcript.columns.get_loc('utr_3')] = dna_converter(cds_and_transcript.iloc[row]['cds_chr'], cds_and_transcript.iloc[row]['transcript_starts'], cds_and_transcript.iloc[row]['cds_ends']-4, cds_and_transcript.iloc[row]['cds_strand'], self.fasta_dict)
+
         # Ensure 5' and 3' upstream regions are utr_lengths long and add Xs if it is not
         utr_length = self.utr_length 
         utr_length = int(utr_length)
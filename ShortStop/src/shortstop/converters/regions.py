@@ -0,0 +1,123 @@
+import re
+import numpy as np
+
+from ..utils import measure
+from .gtf_to_seq import open_text
+
+REGION_PATTERN = re.compile(r'^(?P<seqname>[^:]+?)(?::(?P<start>[\d_]+)-(?P<end>[\d_]+))?$')
+
+
+class Regions:
+    """
+    Genomic regions a run is restricted to, as sorted, merged 1-based closed intervals per sequence name.
+    A sequence name without coordinates covers the whole sequence.
+    """
+
+    def __init__(self, intervals):
+
+        """
+        Args:
+            intervals (list): (seqname, start, end) tuples, 1-based and closed; end None for a whole sequence.
+        """
+
+        self.intervals = {}
+        by_seqname = {}
+        for seqname, start, end in intervals:
+            by_seqname.setdefault(seqname, []).append((start, np.inf if end is None else end))
+        for seqname, spans in by_seqname.items():
+            merged = []
+            for start, end in sorted(spans):
+                if merged and start <= merged[-1][1] + 1:
+                    merged[-1][1] = max(merged[-1][1], end)
+                else:
+                    merged.append([start, end])
+            merged = np.array(merged, dtype=float)
+            self.intervals[seqname] = (merged[:, 0], merged[:, 1])
+
+    @classmethod
+    def parse(cls, spec):
+
+        """Parses a comma-separated region list, e.g. 'chr1:1-5000000,chrX'."""
+
+        intervals = []
+        for region in filter(None, (region.strip() for region in spec.split(','))):
+            match = REGION_PATTERN.match(region)
+            if match is None:
+                raise ValueError(f"🚨 Region '{region}' is not of the form seqname or seqname:start-end.")
+            start, end = match.group('start'), match.group('end')
+            if start is None:
+                intervals.append((match.group('seqname'), 1, None))
+            else:
+                start, end = int(start.replace('_', '')), int(end.replace('_', ''))
+                if end < start:
+                    raise ValueError(f"🚨 Region '{region}' ends before it starts.")
+                intervals.append((match.group('seqname'), start, end))
+        return cls(intervals)
+
+    @classmethod
+    def read_bed(cls, bed_file):
+
+        """Reads the regions of a BED file (0-based, half-open), skipping track, browser and comment lines."""
+
+        intervals = []
+        with open_text(bed_file) as bed:
+            for line in bed:
+                if not line.strip() or line.startswith(('#', 'track', 'browser')):
+                    continue
+                seqname, start, end = line.split()[:3]
+                intervals.append((seqname, int(start) + 1, int(end)))
+        return cls(intervals)
+
+    @classmethod
+    def from_args(cls, args):
+
+        """Returns the regions of --regions and --regions_bed combined, or None if the run is not restricted."""
+
+        intervals = []
+        if getattr(args, 'regions', None):
+            intervals += cls.parse(args.regions).to_list()
+        if getattr(args, 'regions_bed', None):
+            intervals += cls.read_bed(args.regions_bed).to_list()
+        return cls(intervals) if intervals else None
+
+    def to_list(self):
+        return [(seqname, int(start), None if np.isinf(end) else int(end))
+                for seqname, (starts, ends) in self.intervals.items() for start, end in zip(starts, ends)]
+
+    def overlaps(self, seqnames, starts, ends):
+
+        """
+        Returns the mask of the features (e.g. GTF rows) that overlap a region.
+
+        Args:
+            seqnames, starts, ends (pandas.Series): Sequence name and 1-based closed coordinates of each feature.
+        """
+
+        mask = np.zeros(len(seqnames), dtype=bool)
+        seqnames = seqnames.astype(str).to_numpy()
+        starts, ends = starts.to_numpy(dtype=float), ends.to_numpy(dtype=float)
+        for seqname, (region_starts, region_ends) in self.intervals.items():
+            rows = np.flatnonzero(seqnames == seqname)
+            # The last region starting at or before the end of a feature is the only one that can overlap it,
+            # since the regions are merged and sorted
+            candidate = np.searchsorted(region_starts, ends[rows], side='right') - 1
+            hit = candidate >= 0
+            hit[hit] = region_ends[candidate[hit]] >= starts[rows[hit]]
+            mask[rows[hit]] = True
+        return mask
+
+    def filter_gtf(self, gtf, orf_ids):
+
+        """
+        Keeps the ORFs with a row (transcript or CDS) that overlaps a region, with all of their rows.
+
+        Args:
+            gtf (pandas.DataFrame): GTF with seqname, start and end columns.
+            orf_ids (pandas.Series): ORF ID of each row.
+        """
+
+        with measure('region_filter', rows=len(gtf)):
+            overlapping = self.overlaps(gtf['seqname'], gtf['start'], gtf['end'])
+            kept = gtf[orf_ids.isin(set(orf_ids[overlapping])).to_numpy()]
+        print(f"     {orf_ids[overlapping].nunique()} ORFs overlap the {sum(len(starts) for starts, _ in self.intervals.values())} regions.")
+        return kept
@@ -0,0 +1,98 @@
+import pandas as pd
+from Bio import SeqIO
+from Bio.Seq import Seq
+from protlearn.preprocessing import remove_unnatural
+
+from ..utils import measure
+from .gtf_to_seq import orf_shard, open_text
+
+FASTA_EXTENSIONS = ('.fa', '.fasta', '.faa', '.fna', '.pep', '.cds')
+PARQUET_EXTENSIONS = ('.parquet', '.pq')
+SEQUENCE_COLUMNS = ['orf_id', 'aa_seq', 'cds_seq', 'utr_5', 'utr_3']
+NUCLEOTIDES = set('ACGTUN')
+
+
+def translate(cds_seq):
+
+    """Translates a CDS, without its stop codons, as GTFtoSeq does."""
+
+    return str(Seq(cds_seq).translate()).replace('*', '')
+
+
+def read_fasta_sequences(fasta_file):
+
+    """
+    Reads a FASTA of ORFs, keyed by the first word of each header: nucleotide records (e.g. TransDecoder .cds)
+    are CDSs, translated to their protein, other records (e.g. .pep or the output of scripts/fastear.py) are
+    proteins without a CDS.
+    """
+
+    rows = []
+    with open_text(fasta_file) as handle:
+        records = list(SeqIO.parse(handle, 'fasta'))
+    for record in records:
+        sequence = str(record.seq).upper()
+        if set(sequence) <= NUCLEOTIDES:
+            rows.append({'orf_id': record.id, 'aa_seq': translate(sequence), 'cds_seq': sequence.replace('U', 'T')})
+        else:
+            rows.append({'orf_id': record.id, 'aa_seq': sequence.replace('*', ''), 'cds_seq': None})
+    return pd.DataFrame(rows, columns=['orf_id', 'aa_seq', 'cds_seq'])
+
+
+def read_sequence_table(path, utr_length=25, shard=None):
+
+    """
+    Reads pre-extracted ORF sequences, to be featurised without a genome or a GTF.
+
+    CSV and Parquet tables need an orf_id column and an aa_seq or a cds_seq column; cds_seq, utr_5 and utr_3
+    are optional (e.g. the unknown_sequences.csv of an earlier run has them all). FASTA files give one ORF
+    per record. Missing proteins are translated from their CDS; missing CDSs and UTR flanks are filled with X,
+    so the features computed from them carry no information, and the flanks are padded with X to utr_length
+    like the ones extracted from a genome.
+
+    Args:
+        path (str): CSV, Parquet or FASTA file.
+        utr_length (int): Length of the UTR flanks.
+        shard (tuple): Optional (shard index, number of shards); ORFs of other shards are dropped.
+
+    Returns:
+        pandas.DataFrame: orf_id, aa_seq, cds_seq, utr_5 and utr_3 of the ORFs with natural amino acids only.
+    """
+
+    name = path.lower()
+    if name.endswith('.gz'):
+        name = name[:-3]
+    with measure('sequence_table_loading', rows=1):
+        if name.endswith(FASTA_EXTENSIONS):
+            sequences = read_fasta_sequences(path)
+        elif name.endswith(PARQUET_EXTENSIONS):
+            sequences = pd.read_parquet(path)
+        else:
+            sequences = pd.read_csv(path, sep='\t' if name.endswith('.tsv') else ',')
+
+    if 'orf_id' not in sequences.columns or not {'aa_seq', 'cds_seq'} & set(sequences.columns):
+        raise ValueError(f"🚨 {path} needs an orf_id column and an aa_seq or cds_seq column; it has {list(sequences.columns)}.")
+    sequences = sequences.reindex(columns=SEQUENCE_COLUMNS)
+    sequences['orf_id'] = sequences['orf_id'].astype(str)
+    if shard is not None:
+        sequences = sequences[sequences['orf_id'].map(lambda orf_id: orf_shard(orf_id, shard[1]) == shard[0])]
+
+    for column in ['aa_seq', 'cds_seq', 'utr_5', 'utr_3']:
+        sequences[column] = sequences[column].fillna('').astype(str).str.upper()
+    missing_proteins = sequences['aa_seq'] == ''
+    sequences.loc[missing_proteins, 'aa_seq'] = sequences.loc[missing_proteins, 'cds_seq'].map(translate)
+    missing_cds = sequences['cds_seq'] == ''
+    sequences.loc[missing_cds, 'cds_seq'] = sequences.loc[missing_cds, 'aa_seq'].map(lambda aa_seq: 'X' * (3 * len(aa_seq) + 3))
+
+    utr_length = int(utr_length)
+    # Padded on the same sides as in GTFtoSeq.extract_sequences, so the flanks line up with the training ones
+    sequences['utr_5'] = sequences['utr_5'].str.pad(width=utr_length, side='right', fillchar='X').str[-utr_length:]
+    sequences['utr_3'] = sequences['utr_3'].str.pad(width=utr_length, side='left', fillchar='X').str[:utr_length]
+
+    natural = sequences['aa_seq'].isin(remove_unnatural(sequences['aa_seq'].tolist()))
+    if (~natural).any():
+        print(f"🚨 {(~natural).sum()} sequences with unnatural amino acids were removed.")
+    n_missing = int(missing_cds[natural].sum())
+    if n_missing:
+        print(f"🔔: {n_missing} ORFs have no CDS; their DNA features (kozak, k-mers) are filled with X.")
+    return sequences[natural].reset_index(drop=True)
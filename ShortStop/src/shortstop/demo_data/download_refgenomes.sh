@@ -6,17 +6,14 @@ cd demo_data
 GTF_URL="https://ftp.ebi.ac.uk/pub/databases/gencode/Gencode_human/release_43/gencode.v43.primary_assembly.basic.annotation.gtf.gz"
 FA_URL="https://ftp.ebi.ac.uk/pub/databases/gencode/Gencode_human/release_43/GRCh38.primary_assembly.genome.fa.gz"
 
-# Download the .gtf file
+# Download the .gtf file; ShortStop reads it gzipped, header lines included
 curl -O $GTF_URL
 
-# Decompress the .gtf file
-gunzip -f gencode.v43.primary_assembly.basic.annotation.gtf.gz
-grep -v '^#' gencode.v43.primary_assembly.basic.annotation.gtf > temp_file.gtf 
-mv temp_file.gtf gencode.v43.primary_assembly.basic.annotation.gtf
-
 # Download the .fa file
-curl -O $FA_URL
+curl -o hg_38_primary.fa.gz $FA_URL
 
-# Decompress the .fa file
-gunzip -f GRCh38.primary_assembly.genome.fa.gz
-mv GRCh38.primary_assembly.genome.fa hg_38_primary.fa
+# Recompress the .fa file to BGZF, so chunked and region runs read it at random
+if command -v bgzip > /dev/null; then
+    gunzip -c hg_38_primary.fa.gz | bgzip -c > hg_38_primary.fa.bgz
+    mv hg_38_primary.fa.bgz hg_38_primary.fa.gz
+fi
@@ -1,2 +1,3 @@
 from .pipeline_structure import PipelineStructure
+from .stage_manifest import StageManifest, STAGES
 from .pipeline import Pipeline
@@ -1,13 +1,21 @@
 import os
 import shutil
+import pandas as pd
 from ..training import SequenceExtractor, NegativeSet, DatabaseCombiner, FeatureExtractor, UMAPVisualizer
-from ..prediction import smORFPredictor
+from ..prediction import smORFPredictor, ShardMerger, ModelDistiller, CascadePredictor, PredictionCache
+from ..prediction.cascade import FIRST_TIER_MODEL
+from ..utils import collapse_identical_orfs, measure, RUN_REPORT, PROGRESS
+from ..utils.training_split import split_files, SPLITS
+from .stage_manifest import StageManifest
+from ..report import Report
 
 class Pipeline:
     def __init__(self, args):
         self.args = args
         self.outdir = args.outdir
-    
+        self.manifest = None
+        self.report = None
+
     def train(self):
         if self.args.mode == 'train':
             print("▶️ You have initiated training...")
@@ -15,100 +23,394 @@ class Pipeline:
             print("▶️ You have initiated insilico sequence generation...")
         elif self.args.mode == 'feature_extract':
             print("▶️ You have initiated feature extraction...")
-            
-        seq_extractor = SequenceExtractor(args=self.args)
-        seq_extractor.create_positive_gtf()
-        print("✅ GTF for positive ORFs completed.")
-        seq_extractor.extract_sequences()
-        print("✅ Amino acids and DNA for each ORF extracted.")
 
-        print("⏳Generating pseudo-insilico sequences based on your putative smORFs...")
-        decoy = NegativeSet(args=self.args)
-        decoy.turn_two()
-        decoy.combine_databases()
-        print("✅ Pseudo-insilico decoy sequences generated.")
-        
-        if self.args.mode == 'train' or self.args.mode == 'feature_extract': 
-            print("Extracting features...")
-            feature_extractor = FeatureExtractor(args=self.args)
-            feature_extractor.extract_features()
-            print("⏳ Initiating UMAP for visualization of your classes prior to training...")
-            umap_data = UMAPVisualizer(args=self.args)
-            umap_data.reduce_features()
-            umap_data.plot_3d_scatter()
-            umap_data.create_original_data_frame()
-            print("✅ UMAP completed.")
+        self.__start_run()
+        self.__run_sequences_stage()
+        self.__run_decoys_stage()
+        self.report.submit('sequence_lengths')
+
+        if self.args.mode == 'train' or self.args.mode == 'feature_extract':
+            self.__run_features_stage()
+            if getattr(self.args, 'external_memory', False):
+                # UMAP needs the whole feature table in memory, which out-of-core training is there to avoid
+                print("⏭️ UMAP visualization skipped with --external_memory.")
+            elif getattr(self.args, 'skip_umap', False):
+                print("⏭️ UMAP visualization skipped with --skip_umap.")
+            else:
+                self.manifest.run_stage('umap', self.__umap,
+                                        inputs=[self.manifest.orfsFeatures],
+                                        outputs=[self.manifest.umapDF],
+                                        params={'umap_sample': self.args.umap_sample, 'umap_pca': self.args.umap_pca,
+                                                'seed': getattr(self.args, 'seed', None)})
+                self.report.submit('umap')
             if self.args.mode == 'train':
-                print("⏳Starting model training...")
-                from ..training import TrainModel  
-                tm = TrainModel(args=self.args)
-                tm.clean_data()
-                tm.a2000()
-                print("Starting hyperparameter tuning...")
-                tm.tune_hyperparameters()
-                tm.test_model()
-                tm.feature_importance()
-                print("✅ Model training completed.")
-            else:  
+                models_dir = self.manifest.modelsDir
+                if getattr(self.args, 'external_memory', False):
+                    self.manifest.run_stage('training', self.__train_external_memory,
+                                            inputs=[self.manifest.orfsFeatures],
+                                            outputs=[f'{models_dir}/scaler.save', f'{models_dir}/best_xgb_model.model',
+                                                     f'{models_dir}/metrics.csv', f'{models_dir}/{FIRST_TIER_MODEL}'],
+                                            params={'seed': getattr(self.args, 'seed', None), 'external_memory': True,
+                                                    'block_rows': self.args.block_rows})
+                else:
+                    self.manifest.run_stage('training', self.__train_models,
+                                            inputs=[self.manifest.orfsFeatures],
+                                            outputs=[f'{models_dir}/scaler.save', f'{models_dir}/best_xgb_model.model',
+                                                     f'{models_dir}/best_rf_model.pkl', f'{models_dir}/metrics.csv',
+                                                     f'{models_dir}/{FIRST_TIER_MODEL}'],
+                                            params={'seed': getattr(self.args, 'seed', None),
+                                                    'search': getattr(self.args, 'search', None)})
+                self.report.submit('training_history', 'nn_architecture', 'roc', 'feature_importance')
+            else:
                 print("✅ ORF feature extraction completed.")
         else :
             print("✅ Pseudo-insilico sequences generation complete.")
-        
+        self.__finish_report()
+
+    def retrain(self):
+        print("▶️ You have initiated retraining...")
+
+        self.__start_run()
+        self.__run_sequences_stage()
+        # The decoys and features of the previous run are reused; only new positives are featurised
+        self.manifest.run_stage('decoys', self.__reuse_decoys,
+                                inputs=[self.manifest.sequencesWithFunctions, self.manifest.previousCombinedDatabaseDF],
+                                outputs=[self.manifest.combinedDatabaseDF],
+                                params={'previous_outdir': self.args.previous_outdir})
+        self.report.submit('sequence_lengths')
+        self.manifest.run_stage('features', self.__extract_features,
+                                inputs=[self.manifest.combinedDatabaseDF, self.manifest.previousOrfsFeatures],
+                                outputs=[self.manifest.orfsFeatures, self.manifest.orfs_features_in_train_model],
+                                params={'utr_length': self.args.utr_length, 'kmer': self.args.kmer})
+        models_dir = self.manifest.modelsDir
+        previous_models_dir = self.manifest.previousModelsDir
+        self.manifest.run_stage('training', self.__retrain_models,
+                                inputs=[self.manifest.orfsFeatures, f'{previous_models_dir}/scaler.save',
+                                        f'{previous_models_dir}/best_xgb_model.model']
+                                       + [path for split in SPLITS for path in split_files(previous_models_dir, split)],
+                                outputs=[f'{models_dir}/scaler.save', f'{models_dir}/best_xgb_model.model',
+                                         f'{models_dir}/retrain_comparison.csv', f'{models_dir}/{FIRST_TIER_MODEL}'],
+                                params={'seed': getattr(self.args, 'seed', None), 'boost_rounds': self.args.boost_rounds})
+        print("✅ Retraining completed.")
+        self.__finish_report()
+
     def predict(self):
-        
+
+        self.__start_run()
+        if getattr(self.args, 'cascade', False):
+            self.__run_cascade()
+            return
+        if getattr(self.args, 'chunk_size', None):
+            # Streaming runs extract, featurise and predict in one pass, so they are recorded as one stage
+            self.__run_prediction_stage(self.__predict_in_chunks, inputs=[self.args.putative_smorfs_gtf, self.args.genome, self.args.regions_bed])
+            return
+
+        self.__run_unknown_sequences_stage()
+        outputs = [self.manifest.orfsFeatures, self.manifest.orfDedupMap]
+        params = {'utr_length': self.args.utr_length, 'kmer': self.args.kmer,
+                  'no_cache': self.args.no_cache, 'explain': self.args.explain}
+        caching = PredictionCache.enabled(self.args)
+        if caching:
+            # The ORFs skipped as cached depend on the model bundle and on the cache itself
+            outputs.append(self.manifest.cachedPredictions)
+            params.update({'model_key': PredictionCache.model_key_from_args(self.args),
+                           'cache_dir': os.path.abspath(os.path.expanduser(self.args.cache_dir))})
+        self.manifest.run_stage('features', self.__extract_unknown_features,
+                                inputs=[self.manifest.unknown_sequences],
+                                outputs=outputs,
+                                params=params)
+        inputs = [self.args.orfs_to_be_predicted or self.manifest.orfsFeatures]
+        if self.args.orfs_to_be_predicted is None:
+            inputs.append(self.manifest.orfDedupMap)
+            if caching:
+                inputs.append(self.manifest.cachedPredictions)
+        self.__run_prediction_stage(self.__predict_smorfs, inputs=inputs)
+
+    def distill(self):
+        print("▶️ You have initiated model distillation...")
+
+        self.__start_run()
+        if self.args.orfs_to_be_predicted is None:
+            self.manifest.run_stage('sequences', self.__extract_unknown_sequences,
+                                    inputs=[self.args.putative_smorfs_gtf, self.args.genome],
+                                    outputs=[self.manifest.unknown_sequences],
+                                    params={'utr_length': self.args.utr_length})
+            self.manifest.run_stage('features', self.__extract_unknown_features,
+                                    inputs=[self.manifest.unknown_sequences],
+                                    outputs=[self.manifest.orfsFeatures, self.manifest.orfDedupMap],
+                                    params={'utr_length': self.args.utr_length, 'kmer': self.args.kmer})
+        bundle_dir = f'{self.manifest.outdir}/distilled_model'
+        self.manifest.run_stage('distillation', self.__distill,
+                                inputs=[self.args.orfs_to_be_predicted or self.manifest.orfsFeatures, self.args.model,
+                                        self.args.model_scaler, self.args.orfs_features_in_train_model],
+                                outputs=[f'{bundle_dir}/best_xgb_model.model', f'{bundle_dir}/scaler.save',
+                                         f'{bundle_dir}/distillation_report.csv'],
+                                params={'student_trees': self.args.student_trees, 'student_depth': self.args.student_depth,
+                                        'seed': self.args.seed})
+
+    def __distill(self):
+        print("⏳Distilling the model into a compact student...")
+        distiller = ModelDistiller(args=self.args)
+        distiller.distill()
+
+    def __run_unknown_sequences_stage(self):
+        if self.args.sequences:
+            # Pre-extracted sequences: neither the genome nor the GTF is read
+            self.manifest.run_stage('sequences', self.__load_unknown_sequences,
+                                    inputs=[self.args.sequences],
+                                    outputs=[self.manifest.unknown_sequences],
+                                    params={'utr_length': self.args.utr_length, 'shard': self.args.shard, 'sequences': True})
+        else:
+            self.manifest.run_stage('sequences', self.__extract_unknown_sequences,
+                                    inputs=[self.args.putative_smorfs_gtf, self.args.genome, self.args.regions_bed],
+                                    outputs=[self.manifest.unknown_sequences],
+                                    params={'utr_length': self.args.utr_length, 'shard': self.args.shard,
+                                            'regions': self.args.regions})
+
+    def __load_unknown_sequences(self):
+        print("⏳Loading the pre-extracted sequences...")
+        seq_extractor = SequenceExtractor(args=self.args)
+        seq_extractor.load_unknown_sequences()
+        print("✅ Sequences loaded.")
+
+    def __extract_unknown_sequences(self):
         print("⏳Sequences are being fielded...")
         seq_extractor = SequenceExtractor(args=self.args)
         seq_extractor.extract_unknown_sequences()
         print("✅ Sequences fielded.")
 
+    def __extract_unknown_features(self):
         print("⏳Extracting features...")
         feature_extractor = FeatureExtractor(args=self.args)
         feature_extractor.extract_features()
         print("✅ Feature extractions are set and completed.")
-        
+
+    def __predict_smorfs(self):
         print("⏳Throwing features into the prediction algorithm...")
         predictions = smORFPredictor(args=self.args)
         predictions.dansby()
         print("✅ Predictions out and completed!")
-        
+
+    def __run_cascade(self):
+
+        """Extracts the sequences, then scores them with the first tier and only the uncertain ones in full."""
+
+        self.__run_unknown_sequences_stage()
+        predictions_dir = self.manifest.predictionsDir
+        outputs = [f'{predictions_dir}/sams.csv', f'{predictions_dir}/shortstop_classifications.csv']
+        if self.args.cascade_report:
+            outputs.append(f'{predictions_dir}/cascade_tradeoff.csv')
+        self.manifest.run_stage('prediction', self.__predict_cascade,
+                                inputs=[self.manifest.unknown_sequences, self.args.model, self.args.model_scaler,
+                                        self.args.orfs_features_in_train_model,
+                                        self.args.first_tier_model or os.path.join(os.path.dirname(self.args.model), FIRST_TIER_MODEL)],
+                                outputs=outputs,
+                                params={'utr_length': self.args.utr_length, 'kmer': self.args.kmer,
+                                        'shard': self.args.shard, 'cascade_band': self.args.cascade_band,
+                                        'cascade_report': self.args.cascade_report})
+
+    def __predict_cascade(self):
+        print("⏳Scoring with the first tier, and the uncertain ORFs with the full model...")
+        cascade = CascadePredictor(args=self.args)
+        cascade.predict()
+        print("✅ Predictions out and completed!")
+
+    def __cascade_demo(self):
+        cascade = CascadePredictor(args=self.args)
+        cascade.demo_tradeoff()
+
+    def __predict_in_chunks(self):
+
+        """
+        Streams the putative GTF through extraction, featurisation and prediction in ORF-complete chunks,
+        appending the results to the prediction CSVs so peak memory is set by the chunk size.
+        """
+
+        print(f"⏳Sequences are being fielded, featurised and predicted in chunks of {self.args.chunk_size} ORFs...")
+        seq_extractor = SequenceExtractor(args=self.args)
+        feature_extractor = FeatureExtractor(args=self.args)
+        predictions = smORFPredictor(args=self.args)
+        task = PROGRESS.task('chunked_prediction', unit='ORFs')
+
+        for n_chunk, unknown_smorfs in enumerate(seq_extractor.iter_unknown_sequences(self.args.chunk_size), start=1):
+            if len(unknown_smorfs) > 0:
+                unique_smorfs, orf_map = collapse_identical_orfs(unknown_smorfs)
+                if predictions.cache is not None:
+                    unique_smorfs = predictions.cache.drop_cached(unique_smorfs)
+                if len(unique_smorfs) > 0:
+                    with measure('features', rows=len(unique_smorfs)):
+                        orfs_features = feature_extractor.extract_unknown_features(unique_smorfs)
+                else:
+                    orfs_features = pd.DataFrame(columns=['orf_id'])
+                predictions.dansby_chunk(orfs_features, orf_map)
+            print(f"     Chunk {n_chunk}: {len(unknown_smorfs)} ORFs predicted.")
+            task.advance(len(unknown_smorfs))
+
+        task.close()
+        predictions.finalise_chunks()
+        print("✅ Predictions out and completed!")
+
+    def merge(self):
+        print("⏳Merging the shards of a sharded prediction run...")
+        merger = ShardMerger(args=self.args)
+        merger.merge()
+        print("✅ Shards merged into the standard prediction files!")
+
     def demo(self):
         print("▶️ You have initiated the demo...")
-        
+
+        self.__start_run()
+        self.__run_sequences_stage()
+        self.__run_decoys_stage()
+        self.report.submit('sequence_lengths')
+        self.__run_features_stage()
+        print("✅ ORF feature extraction completed.")
+
+        print("⏳Initiating UMAP visualization...")
+        umap_data = UMAPVisualizer(args=self.args)
+        print("🛑 Early termination of UMAP visualization for demo purposes.")
+
+        print("⏳Starting custom model training...")
+        from ..training import TrainModel
+        tm = TrainModel(args=self.args)
+        print("🛑 Early termination of hyperparameter tuning for demo purposes.")
+
+        print("⏳Throwing features into the standard Miller et al., 2025 ShortStop prediction algorithm...")
+        self.__run_prediction_stage(self.__predict_smorfs, inputs=[self.args.orfs_to_be_predicted or self.manifest.orfsFeatures])
+
+        self.manifest.run_stage('cascade', self.__cascade_demo,
+                                inputs=[self.manifest.combinedDatabaseDF, self.args.model, self.args.model_scaler],
+                                outputs=[f'{self.manifest.predictionsDir}/cascade_tradeoff.csv'],
+                                params={'utr_length': self.args.utr_length, 'kmer': self.args.kmer,
+                                        'seed': getattr(self.args, 'seed', None)})
+
+        #self.__cleanup_output_directory(self.outdir)  # Replace "--outdir" with the actual variable holding the output directory path
+
+        self.__finish_report()
+        print("✅ Demo completed.")
+
+    def __start_run(self):
+
+        """Opens the stage manifest and the run report of this run's output directory."""
+
+        self.manifest = StageManifest(args=self.args)
+        RUN_REPORT.configure(self.manifest.outdir, profile=getattr(self.args, 'profile', False))
+        PROGRESS.configure(events=getattr(self.args, 'progress_events', None))
+        self.report = Report(args=self.args)
+
+    def __finish_report(self):
+
+        """Waits for the figures drawn in the background and writes the HTML report if requested."""
+
+        if self.report.futures:
+            print("⏳Finishing the figures...")
+        self.report.finish(html_report=getattr(self.args, 'html_report', False))
+
+    def __run_sequences_stage(self):
+        self.manifest.run_stage('sequences', self.__extract_sequences,
+                                inputs=[self.args.positive_ids, self.args.positive_gtf, self.args.positive_functions,
+                                        self.args.putative_smorfs_gtf, self.args.genome, getattr(self.args, 'regions_bed', None)],
+                                outputs=[self.manifest.positiveMicroproteinsGTF, self.manifest.unknown_sequences,
+                                         self.manifest.sequencesWithFunctions],
+                                params={'utr_length': self.args.utr_length, 'regions': getattr(self.args, 'regions', None)})
+
+    def __run_decoys_stage(self):
+        self.manifest.run_stage('decoys', self.__generate_decoys,
+                                inputs=[self.manifest.sequencesWithFunctions],
+                                outputs=[self.manifest.combinedDatabaseDF],
+                                params={'n_insilico_smORFs': self.args.n_insilico_smORFs,
+                                        'utr_length': self.args.utr_length,
+                                        'seed': getattr(self.args, 'seed', None)})
+
+    def __run_features_stage(self):
+        self.manifest.run_stage('features', self.__extract_features,
+                                inputs=[self.manifest.combinedDatabaseDF],
+                                outputs=[self.manifest.orfsFeatures, self.manifest.orfs_features_in_train_model],
+                                params={'utr_length': self.args.utr_length, 'kmer': self.args.kmer})
+
+    def __run_prediction_stage(self, run, inputs):
+        predictions_dir = self.manifest.predictionsDir
+        self.manifest.run_stage('prediction', run,
+                                inputs=inputs + [self.args.model, self.args.model_scaler, self.args.orfs_features_in_train_model],
+                                outputs=[f'{predictions_dir}/sams.csv', f'{predictions_dir}/shortstop_classifications.csv'],
+                                params={'utr_length': self.args.utr_length, 'kmer': self.args.kmer,
+                                        'shard': getattr(self.args, 'shard', None),
+                                        'chunk_size': getattr(self.args, 'chunk_size', None),
+                                        'regions': getattr(self.args, 'regions', None),
+                                        'explain': getattr(self.args, 'explain', False)})
+
+    def __extract_sequences(self):
         seq_extractor = SequenceExtractor(args=self.args)
         seq_extractor.create_positive_gtf()
         print("✅ GTF for positive ORFs completed.")
         seq_extractor.extract_sequences()
         print("✅ Amino acids and DNA for each ORF extracted.")
 
-        print("⏳Generating insilico decoy sequences based on your putative smORFs...")
+    def __generate_decoys(self):
+        if self.args.mode == 'demo':
+            print("⏳Generating insilico decoy sequences based on your putative smORFs...")
+        else:
+            print("⏳Generating pseudo-insilico sequences based on your putative smORFs...")
         decoy = NegativeSet(args=self.args)
         decoy.turn_two()
         decoy.combine_databases()
-        print("✅ Random decoy sequences generated.")
-        
-        print("⏳Extracting features...")
+        if self.args.mode == 'demo':
+            print("✅ Random decoy sequences generated.")
+        else:
+            print("✅ Pseudo-insilico decoy sequences generated.")
+
+    def __reuse_decoys(self):
+        print("⏳Reusing the decoy sequences of the previous run...")
+        decoy = NegativeSet(args=self.args)
+        decoy.reuse_decoys()
+        decoy.combine_databases()
+
+    def __extract_features(self):
+        if self.args.mode == 'demo':
+            print("⏳Extracting features...")
+        else:
+            print("Extracting features...")
         feature_extractor = FeatureExtractor(args=self.args)
         feature_extractor.extract_features()
-        print("✅ ORF feature extraction completed.")
 
-        print("⏳Initiating UMAP visualization...")
+    def __umap(self):
+        print("⏳ Initiating UMAP for visualization of your classes prior to training...")
         umap_data = UMAPVisualizer(args=self.args)
-        print("🛑 Early termination of UMAP visualization for demo purposes.")
+        umap_data.reduce_features()
+        umap_data.create_original_data_frame()
+        print("✅ UMAP completed.")
 
-        print("⏳Starting custom model training...")
-        from ..training import TrainModel  
+    def __train_models(self):
+        print("⏳Starting model training...")
+        from ..training import TrainModel
         tm = TrainModel(args=self.args)
-        print("🛑 Early termination of hyperparameter tuning for demo purposes.")
-        
-        print("⏳Throwing features into the standard Miller et al., 2025 ShortStop prediction algorithm...")
-        predictions = smORFPredictor(args=self.args)
-        predictions.dansby()
-        print("✅ Predictions out and completed!")
-        
-        #self.__cleanup_output_directory(self.outdir)  # Replace "--outdir" with the actual variable holding the output directory path
-        
-        print("✅ Demo completed.")
-        
+        tm.clean_data()
+        tm.a2000()
+        print("Starting hyperparameter tuning...")
+        tm.tune_hyperparameters()
+        tm.test_model()
+        tm.feature_importance()
+        tm.train_first_tier()
+        print("✅ Model training completed.")
+
+    def __train_external_memory(self):
+        print("⏳Starting out-of-core XGBoost training...")
+        from ..training import TrainModel
+        tm = TrainModel(args=self.args)
+        tm.train_external_memory()
+        tm.feature_importance()
+        tm.train_first_tier()
+        print("✅ Model training completed.")
+
+    def __retrain_models(self):
+        print("⏳Retraining the XGBoost model of the previous run...")
+        from ..training import TrainModel
+        tm = TrainModel(args=self.args)
+        tm.clean_data()
+        tm.a2000()
+        tm.retrain_xgb()
+        tm.train_first_tier()
+
     def __cleanup_output_directory(self, outdir):
         """Removes all directories and files in the specified output directory and recreates the directory."""
         try:
@@ -118,4 +420,4 @@ class Pipeline:
         except Exception as e:
             print(f"Error cleaning up output directory '{outdir}': {e}")
 
-        
\ No newline at end of file
+        import sys
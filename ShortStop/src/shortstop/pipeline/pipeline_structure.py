@@ -12,6 +12,10 @@ class PipelineStructure:
         """
         
         self.outdir = args.outdir
+        if getattr(args, 'shard', None):
+            # Each shard of a sharded run writes to its own sub-directory, combined later by the merge mode
+            check_dir(self.outdir)
+            self.outdir = f'{self.outdir}/shard_{args.shard[0]}_of_{args.shard[1]}'
         self.databaseDir = f'{self.outdir}/sequences'
         self.plotsDir = f'{self.outdir}/plots'
         self.featuresDir = f'{self.outdir}/features'
@@ -44,13 +48,20 @@ class PipelineStructure:
         Defines the attributes for the input files provided by the user.
         """
 
-        if self.args.mode == 'train' or self.args.mode == 'insilico' or self.args.mode == 'feature_extract':
+        if self.args.mode == 'train' or self.args.mode == 'insilico' or self.args.mode == 'feature_extract' or self.args.mode == 'retrain':
             self.positiveFunction = self.args.positive_functions
             self.positiveDF = self.args.positive_ids
             self.positiveGTF = self.args.positive_gtf
             self.toBePredictedGTF = self.args.putative_smorfs_gtf
             self.genome = self.args.genome
-        elif self.args.mode == 'predict':
+            if self.args.mode == 'retrain':
+                # Output directory of the training run being updated
+                self.previousOutdir = self.args.previous_outdir
+                self.previousModelsDir = f'{self.previousOutdir}/models'
+                self.previousCombinedDatabaseDF = f'{self.previousOutdir}/sequences/positive_unknown_insilico_sequences.csv'
+                self.previousOrfsFeatures = f'{self.previousOutdir}/features/extracted_features_of_smorfs.csv'
+                self.previousManifest = f'{self.previousOutdir}/stage_manifest.json'
+        elif self.args.mode == 'predict' or self.args.mode == 'distill':
             self.genome = self.args.genome
             self.toBePredictedGTF = self.args.putative_smorfs_gtf
             self.orfs_features_in_train_model = self.args.orfs_features_in_train_model
@@ -79,6 +90,8 @@ class PipelineStructure:
         self.positiveMicroproteinsGTF = f"{self.databaseDir}/positive_proteins.gtf"
         self.positive_and_unknown_sequences = f'{self.databaseDir}/positive_and_unknown_sequences.csv'
         self.unknown_sequences = f'{self.databaseDir}/unknown_sequences.csv'
+        self.orfDedupMap = f'{self.databaseDir}/orf_dedup_map.csv'
+        self.cachedPredictions = f'{self.databaseDir}/cached_predictions.csv'
         self.insilicoSequencesDF = f'{self.databaseDir}/insilico_sequences.csv'
         self.combinedDatabaseDF = f'{self.databaseDir}/positive_unknown_insilico_sequences.csv'
 
@@ -0,0 +1,131 @@
+import os
+import json
+import hashlib
+from datetime import datetime
+
+from .pipeline_structure import PipelineStructure
+from ..utils import measure, PROGRESS
+
+STAGES = ['sequences', 'decoys', 'features', 'umap', 'training', 'prediction', 'cascade', 'distillation']
+
+
+def file_sha256(path):
+
+    """Returns the SHA-256 of a file, read in 1 MB blocks."""
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class StageManifest(PipelineStructure):
+    """
+    Records, for every completed pipeline stage, the hashes of its input and output files and the
+    parameters it ran with, in <outdir>/stage_manifest.json.
+
+    With --resume, a stage whose inputs, parameters and outputs still match its record is skipped.
+    Files are only re-hashed when their size or modification time changed since they were last hashed.
+    """
+
+    def __init__(self, args):
+        super().__init__(args=args)
+        self.set_train_attributes()
+        self.manifestFile = f'{self.outdir}/stage_manifest.json'
+        self.resume = getattr(args, 'resume', False)
+        self.forcedStages = set(getattr(args, 'force_stage', None) or [])
+        self.manifest = {'stages': {}, 'files': {}}
+        if os.path.exists(self.manifestFile):
+            with open(self.manifestFile) as handle:
+                self.manifest = json.load(handle)
+
+    def file_hash(self, path):
+
+        """Returns the hash of path, reusing the recorded one while the file's size and mtime are unchanged."""
+
+        if not os.path.exists(path):
+            return None
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        known = self.manifest['files'].get(path)
+        if known and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+            return known['sha256']
+        sha256 = file_sha256(path)
+        self.manifest['files'][path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha256}
+        return sha256
+
+    def __hashes(self, files):
+        return {os.path.abspath(path): self.file_hash(path) for path in files if path}
+
+    @staticmethod
+    def __params(params):
+        return {name: str(value) for name, value in sorted(params.items())}
+
+    def is_current(self, stage, inputs, outputs, params):
+
+        """
+        Returns True when --resume is set, the stage is not forced and its recorded inputs,
+        parameters and outputs all match the current ones.
+        """
+
+        if not self.resume or stage in self.forcedStages:
+            return False
+        record = self.manifest['stages'].get(stage)
+        if record is None or record['params'] != self.__params(params):
+            return False
+        if record['inputs'] != self.__hashes(inputs):
+            return False
+        for path in filter(None, outputs):
+            current = self.file_hash(path)
+            if current is None or record['outputs'].get(os.path.abspath(path)) != current:
+                return False
+        return True
+
+    def record(self, stage, inputs, outputs, params):
+
+        """Records a completed stage and writes the manifest."""
+
+        self.manifest['stages'][stage] = {
+            'params': self.__params(params),
+            'inputs': self.__hashes(inputs),
+            'outputs': self.__hashes(outputs),
+            'completed': datetime.now().isoformat(timespec='seconds'),
+        }
+        self.__write()
+
+    def __write(self):
+        tmp_file = f'{self.manifestFile}.tmp'
+        with open(tmp_file, 'w') as handle:
+            json.dump(self.manifest, handle, indent=2)
+        os.replace(tmp_file, self.manifestFile)
+
+    def run_stage(self, stage, run, inputs, outputs, params):
+
+        """
+        Runs a stage unless it is current, then records it.
+
+        Args:
+            stage (str): Stage name, one of STAGES.
+            run (callable): Runs the stage.
+            inputs (list): Files the stage reads.
+            outputs (list): Files the stage writes.
+            params (dict): Parameters that change the stage outputs.
+
+        Returns:
+            bool: Whether the stage ran.
+        """
+
+        if self.is_current(stage, inputs, outputs, params):
+            print(f"⏭️ Skipping the {stage} stage: its inputs and parameters are unchanged since the last run.")
+            PROGRESS.stage_finished(stage, skipped=True)
+            return False
+        # A stage that crashes part way must not look complete on the next --resume
+        if self.manifest['stages'].pop(stage, None) is not None:
+            self.__write()
+        PROGRESS.stage_started(stage)
+        with measure(stage):
+            run()
+        PROGRESS.stage_finished(stage)
+        self.record(stage, inputs, outputs, params)
+        return True
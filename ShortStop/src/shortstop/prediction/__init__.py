@@ -1 +1,5 @@
-from .predict_smorfs import smORFPredictor 
\ No newline at end of file
+from .predict_smorfs import smORFPredictor
+from .shard_merger import ShardMerger
+from .prediction_cache import PredictionCache
+from .distiller import ModelDistiller
+from .cascade import CascadePredictor
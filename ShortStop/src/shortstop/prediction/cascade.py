@@ -0,0 +1,250 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from sklearn.metrics import accuracy_score, f1_score
+
+from ..pipeline import PipelineStructure
+from ..utils import collapse_identical_orfs, broadcast_to_orfs, check_dir, measure, LABEL_ENCODING
+from .predict_smorfs import smORFPredictor
+
+AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+# Dinucleotides counted over the first 50 nt of the CDS, the only k-mers of the first tier
+FIRST_TIER_KMERS = [a + b for a in 'ACGT' for b in 'ACGT']
+FIRST_TIER_TREES = 100
+FIRST_TIER_DEPTH = 4
+# File name of the first-tier model, saved next to the full model by training runs
+FIRST_TIER_MODEL = 'first_tier_model.model'
+# ORFs whose first-tier SAM probability lies strictly inside the band are escalated to the full model
+DEFAULT_BAND = (0.1, 0.9)
+# Bands of the trade-off report, from the first tier alone to every ORF escalated
+TRADEOFF_BANDS = [(0.5, 0.5), (0.4, 0.6), (0.3, 0.7), (0.2, 0.8), (0.1, 0.9), (0.05, 0.95), (0.01, 0.99), (0.0, 1.0)]
+
+
+def first_tier_features(sequences):
+
+    """
+    Cheap features of the first tier of the cascade: protein length, amino acid composition, kozak score
+    and the dinucleotide frequencies of the first 50 nt of the CDS. Vectorised over all ORFs.
+
+    Args:
+        sequences (pandas.DataFrame): Sequences with aa_seq, cds_seq and utr_5 columns.
+
+    Returns:
+        pandas.DataFrame: One row per ORF, in the order of sequences.
+    """
+
+    aa_seqs = sequences['aa_seq'].fillna('').str.upper().str.rstrip('*')
+    lengths = aa_seqs.str.len().to_numpy()
+    features = {'length': lengths}
+    for amino_acid in AMINO_ACIDS:
+        features[f'aa_{amino_acid}'] = aa_seqs.str.count(amino_acid).to_numpy() / np.maximum(lengths, 1)
+
+    # Same positions and weights as FeatureExtraction.kozak_score: 6 nt upstream and the first 4 nt of the CDS
+    cds_seqs = sequences['cds_seq'].fillna('').str.upper()
+    context = sequences['utr_5'].fillna('').str.upper().str[-6:].str.rjust(6, 'X') + cds_seqs.str[:4].str.ljust(4, 'X')
+    features['kozak_score'] = (3 * (context.str[0] == 'G') + (context.str[1] == 'C') + (context.str[2] == 'C') +
+                               3 * context.str[3].isin(['A', 'G']) + (context.str[4] == 'C') + (context.str[5] == 'C') +
+                               3 * (context.str[9] == 'G')).to_numpy()
+
+    first_50 = cds_seqs.str[:50].str.ljust(50, 'N')
+    codes = np.full(256, -1, dtype=np.int8)
+    codes[np.frombuffer(b'ACGT', dtype=np.uint8)] = np.arange(4)
+    nucleotides = codes[np.frombuffer(''.join(first_50).encode('ascii', 'replace'), dtype=np.uint8).reshape(-1, 50)]
+    valid = (nucleotides[:, :-1] >= 0) & (nucleotides[:, 1:] >= 0)
+    dinucleotides = nucleotides[:, :-1] * 4 + nucleotides[:, 1:]
+    rows = np.broadcast_to(np.arange(len(first_50))[:, None], dinucleotides.shape)
+    counts = np.zeros((len(first_50), len(FIRST_TIER_KMERS)))
+    np.add.at(counts, (rows[valid], dinucleotides[valid]), 1)
+    counts /= np.maximum(valid.sum(axis=1), 1)[:, None]
+    for i, kmer in enumerate(FIRST_TIER_KMERS):
+        features[f'first_50_{kmer}'] = counts[:, i]
+
+    return pd.DataFrame(features, index=sequences.index)
+
+
+def train_first_tier(sequences, labels, model_file, seed=None, threads=1):
+
+    """
+    Trains the first tier of the cascade on the cheap features and saves it to model_file.
+
+    Args:
+        sequences (pandas.DataFrame): Training sequences (aa_seq, cds_seq, utr_5).
+        labels (np.ndarray): Encoded label of each sequence (0 Random, 1 Cytoplasm, 2 Secreted).
+        model_file (str): Path the model is saved to.
+
+    Returns:
+        xgb.XGBClassifier: The trained first tier.
+    """
+
+    classifier = xgb.XGBClassifier(objective='multi:softprob', n_estimators=FIRST_TIER_TREES, max_depth=FIRST_TIER_DEPTH,
+                                   tree_method='hist', n_jobs=int(threads), random_state=seed or 0)
+    features = first_tier_features(sequences)
+    with measure('first_tier_training', rows=len(features)):
+        classifier.fit(features.to_numpy(), np.asarray(labels).astype(int))
+    classifier.save_model(model_file)
+    return classifier
+
+
+def escalated(probabilities, band):
+
+    """Returns the mask of the ORFs whose SAM probability (intracellular + secreted) lies inside the band."""
+
+    low, high = band
+    sam_probability = probabilities[:, 1] + probabilities[:, 2]
+    return (sam_probability > low) & (sam_probability < high)
+
+
+class CascadePredictor(PipelineStructure):
+    """
+    Two-tier prediction. Every ORF is scored by a small first-tier model on cheap features (length, amino
+    acid composition, kozak score, first 50 nt dinucleotides); only the ORFs it is unsure about, whose SAM
+    probability falls inside the uncertainty band, go through the full featurisation and the full model.
+    """
+
+    def __init__(self, args):
+        super().__init__(args=args)
+        self.set_prediction_attributes()
+        self.band = tuple(float(bound) for bound in (getattr(args, 'cascade_band', None) or DEFAULT_BAND))
+        self.firstTierModel = getattr(args, 'first_tier_model', None) or os.path.join(os.path.dirname(self.model), FIRST_TIER_MODEL)
+        self.firstTier = None
+        self.fullPredictor = smORFPredictor(args=args)
+
+    def load_first_tier(self):
+        if self.firstTier is not None:
+            return
+        if not os.path.exists(self.firstTierModel):
+            raise FileNotFoundError(f"🚨 First-tier model {self.firstTierModel} not found. Models trained by `shortstop train` "
+                                    f"include one; otherwise pass it with --first_tier_model.")
+        self.firstTier = xgb.XGBClassifier()
+        self.firstTier.load_model(self.firstTierModel)
+
+    def first_tier_probabilities(self, sequences):
+        self.load_first_tier()
+        with measure('first_tier_features', rows=len(sequences)):
+            features = first_tier_features(sequences)
+        with measure('first_tier_inference', rows=len(features)):
+            return self.firstTier.predict_proba(features.to_numpy())
+
+    def full_probabilities(self, sequences):
+
+        """Extracts the full features of the sequences and scores them with the full model."""
+
+        if len(sequences) == 0:
+            return np.empty((0, 3))
+        from ..training import FeatureExtractor
+        features = FeatureExtractor(args=self.args).extract_unknown_features(sequences.copy())
+        self.fullPredictor.orfs_to_be_predicted = self.fullPredictor.align_features(features)
+        return self.fullPredictor.predict_probabilities()
+
+    def cascade(self, sequences):
+
+        """
+        Returns:
+            tuple: Class probabilities of the sequences, and the mask of those decided by the full model.
+        """
+
+        probabilities = self.first_tier_probabilities(sequences)
+        to_full_model = escalated(probabilities, self.band)
+        probabilities[to_full_model] = self.full_probabilities(sequences[to_full_model])
+        return probabilities, to_full_model
+
+    def predict(self):
+
+        """
+        Predicts the extracted unknown sequences. shortstop_classifications.csv gets a tier column: 1 for
+        the calls of the first tier, 2 for the ORFs escalated to the full model.
+        """
+
+        if getattr(self.args, 'explain', False):
+            print("🚨 --explain is not available with --cascade; no explanations are written.")
+        unknown_smorfs = pd.read_csv(self.unknown_sequences)
+        unique_smorfs, orf_map = collapse_identical_orfs(unknown_smorfs)
+        unique_smorfs = unique_smorfs.reset_index(drop=True)
+        orf_map.to_csv(self.orfDedupMap, index=False)
+
+        probabilities, to_full_model = self.cascade(unique_smorfs)
+        n_full = int(to_full_model.sum())
+        print(f"     First tier decided {len(unique_smorfs) - n_full} ORFs; {n_full} ORFs with a SAM probability in "
+              f"({self.band[0]}, {self.band[1]}) went through the full model.")
+
+        representative_ids = unique_smorfs['orf_id']
+        orf_ids, probabilities = broadcast_to_orfs(representative_ids, probabilities, orf_map)
+        _, tiers = broadcast_to_orfs(representative_ids, np.where(to_full_model, 2, 1), orf_map)
+
+        with measure('output_writing', rows=len(orf_ids)):
+            self.fullPredictor.write_sams(orf_ids, probabilities)
+            predicted_classes = smORFPredictor.classify(orf_ids, probabilities)
+            predicted_classes['tier'] = tiers
+            self.fullPredictor.write_classifications(predicted_classes)
+
+        if getattr(self.args, 'cascade_report', False):
+            self.tradeoff_report(unique_smorfs)
+
+    def tradeoff_report(self, sequences, labels=None):
+
+        """
+        Scores the sequences with both tiers and writes, for each band of TRADEOFF_BANDS, the fraction of
+        ORFs escalated, the throughput of the cascade, its agreement with the full model and, given the true
+        labels, its accuracy and macro F1, to predictions/cascade_tradeoff.csv.
+
+        The throughput counts first-tier featurisation and inference for every ORF plus the measured full
+        featurisation and inference time per ORF for the escalated ones.
+        """
+
+        print("⏳Measuring the accuracy/throughput trade-off of the cascade...")
+        start = time.perf_counter()
+        first_tier = self.first_tier_probabilities(sequences)
+        first_tier_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        full = self.full_probabilities(sequences)
+        full_seconds = time.perf_counter() - start
+        full_classes = full.argmax(axis=1)
+
+        def summary(name, low, high, probabilities, escalated_fraction, seconds):
+            classes = probabilities.argmax(axis=1)
+            row = {'cascade': name, 'band_low': low, 'band_high': high, 'escalated_fraction': escalated_fraction,
+                   'rows_per_s': len(sequences) / seconds, 'speedup': full_seconds / seconds,
+                   'agreement_with_full': np.mean(classes == full_classes),
+                   'sam_agreement_with_full': np.mean((classes > 0) == (full_classes > 0))}
+            if labels is not None:
+                row['accuracy'] = accuracy_score(labels, classes)
+                row['f1_macro'] = f1_score(labels, classes, average='macro')
+            return row
+
+        rows = [summary('full_model', np.nan, np.nan, full, 1.0, full_seconds)]
+        for low, high in TRADEOFF_BANDS:
+            to_full_model = escalated(first_tier, (low, high))
+            probabilities = np.where(to_full_model[:, None], full, first_tier)
+            rows.append(summary(f'{low}-{high}', low, high, probabilities, to_full_model.mean(),
+                                first_tier_seconds + to_full_model.mean() * full_seconds))
+
+        report = pd.DataFrame(rows)
+        path = f'{self.predictionsDir}/cascade_tradeoff.csv'
+        report.to_csv(path, index=False, float_format='%.4g')
+        print(report.to_string(index=False, float_format=lambda value: f'{value:.3g}'))
+        print(f"     Cascade trade-off report written to {path}")
+        return report
+
+    def demo_tradeoff(self, test_size=0.2):
+
+        """
+        Trade-off of the cascade on the labelled ORFs of the demo (positives and decoys): a first tier is
+        trained on a random 80% of them, and both tiers are compared on the held-out rest, with the standard
+        model as the full model.
+        """
+
+        sequences = pd.read_csv(self.combinedDatabaseDF)
+        sequences = sequences[sequences['local'].isin(LABEL_ENCODING)].reset_index(drop=True)
+        labels = sequences['local'].map(LABEL_ENCODING).to_numpy()
+        held_out = np.random.default_rng(getattr(self.args, 'seed', None)).random(len(sequences)) < test_size
+        if held_out.sum() == 0 or len(np.unique(labels[~held_out])) < 3:
+            print("🚨 Too few labelled ORFs to train a first tier; the cascade trade-off report is skipped.")
+            return None
+
+        check_dir(self.modelsDir)
+        self.firstTierModel = f'{self.modelsDir}/{FIRST_TIER_MODEL}'
+        self.firstTier = train_first_tier(sequences[~held_out], labels[~held_out], self.firstTierModel,
+                                          seed=getattr(self.args, 'seed', None), threads=self.args.threads)
+        return self.tradeoff_report(sequences[held_out].reset_index(drop=True), labels[held_out])
@@ -0,0 +1,94 @@
+import os
+import time
+import shutil
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from sklearn.metrics import roc_auc_score
+
+from ..pipeline import PipelineStructure
+from ..utils import check_dir, measure
+from .predict_smorfs import smORFPredictor
+
+# Default size of the student: a tenth of the trees of the standard model, at less than half its depth
+STUDENT_TREES = 50
+STUDENT_DEPTH = 4
+# Fraction of the unlabelled ORFs held out to compare the student with its teacher
+HELDOUT_SIZE = 0.2
+
+
+class ModelDistiller(PipelineStructure):
+    """
+    Distils a prediction model (the teacher) into a small XGBoost classifier (the student) trained on the
+    teacher's class probabilities over a set of unlabelled ORFs, and exports it as a model bundle that
+    predict mode loads like any other (--model, --model_scaler, --orfs_features_in_train_model).
+    """
+
+    def __init__(self, args):
+        super().__init__(args=args)
+        self.set_prediction_attributes()
+        self.bundleDir = f'{self.outdir}/distilled_model'
+        check_dir(self.bundleDir)
+
+    def distill(self):
+        teacher = smORFPredictor(args=self.args)
+        teacher.align_and_confirm_features()
+        teacher_probs = teacher.predict_probabilities()
+        data = teacher.data
+        if len(data) < 10:
+            raise ValueError(f"🚨 Only {len(data)} ORFs to distil from; the student needs a larger unlabelled set.")
+
+        rng = np.random.default_rng(self.args.seed)
+        heldout = rng.random(len(data)) < HELDOUT_SIZE
+        train_data, train_probs = data[~heldout], teacher_probs[~heldout]
+
+        # Each ORF appears once per class, weighted by the teacher's probability of that class, so the
+        # softmax loss of the student is its cross-entropy against the teacher's soft labels
+        n_classes = train_probs.shape[1]
+        soft_data = np.tile(train_data, (n_classes, 1))
+        soft_labels = np.repeat(np.arange(n_classes), len(train_data))
+        soft_weights = train_probs.T.ravel()
+
+        student = xgb.XGBClassifier(objective='multi:softprob', n_estimators=int(self.args.student_trees),
+                                    max_depth=int(self.args.student_depth), tree_method='hist',
+                                    n_jobs=int(self.args.threads), random_state=self.args.seed or 0)
+        with measure('distillation', rows=len(train_data)):
+            student.fit(soft_data, soft_labels, sample_weight=soft_weights)
+        print(f"     Student of {self.args.student_trees} trees of depth {self.args.student_depth} trained on {len(train_data)} ORFs.")
+
+        student_file = f'{self.bundleDir}/best_xgb_model.model'
+        student.save_model(student_file)
+        shutil.copy(self.args.model_scaler, f'{self.bundleDir}/scaler.save')
+        pd.read_csv(self.args.orfs_features_in_train_model, nrows=0).to_csv(f'{self.bundleDir}/orfs_features_in_train_model.csv', index=False)
+
+        self.__report(teacher, student, data[heldout], teacher_probs[heldout], student_file)
+        print(f"✅ Distilled model bundle written to {self.bundleDir}")
+
+    def __report(self, teacher, student, heldout_data, teacher_probs, student_file):
+
+        """
+        Compares the student with the teacher on the held-out ORFs: agreement of their classes, ROC AUC of the
+        student against the teacher's classes, mean absolute difference of their probabilities, inference
+        throughput and model size. Written to distillation_report.csv in the bundle.
+        """
+
+        rows = {}
+        for name, model, model_file in [('teacher', teacher.classifier, self.args.model), ('student', student, student_file)]:
+            start = time.perf_counter()
+            probs = model.predict(heldout_data) if model_file.endswith('.h5') else model.predict_proba(heldout_data)
+            elapsed = time.perf_counter() - start
+            rows[name] = {'model': name, 'file': model_file, 'size_bytes': os.path.getsize(model_file),
+                          'rows_per_s': len(heldout_data) / elapsed if elapsed > 0 else np.nan, 'probs': probs}
+
+        teacher_classes = teacher_probs.argmax(axis=1)
+        student_probs = rows['student'].pop('probs')
+        rows['teacher'].pop('probs')
+        agreement = np.mean(student_probs.argmax(axis=1) == teacher_classes)
+        auc = (roc_auc_score(teacher_classes, student_probs, multi_class='ovr', average='macro', labels=[0, 1, 2])
+               if len(np.unique(teacher_classes)) == 3 else np.nan)
+        rows['student'].update({'heldout_orfs': len(heldout_data), 'agreement': agreement, 'auc_vs_teacher': auc,
+                                'mean_abs_prob_diff': np.abs(student_probs - teacher_probs).mean()})
+
+        report = pd.DataFrame(list(rows.values()))
+        report.to_csv(f'{self.bundleDir}/distillation_report.csv', index=False)
+        print(report.drop(columns='file').to_string(index=False))
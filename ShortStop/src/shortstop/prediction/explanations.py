@@ -0,0 +1,105 @@
+import re
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from ..utils import measure, PROGRESS
+
+# Feature blocks the per-ORF contributions are summed over, in the order of the explanation columns
+FEATURE_BLOCKS = ['5_prime_kmer', '3_prime_kmer', 'kozak', 'first_50_kmer', 'cksaap', 'ctdd', 'apaac']
+# Rows explained per call; the contributions of a batch take rows x classes x features floats
+EXPLAIN_BATCH = 4096
+
+
+def feature_block(name):
+
+    """Returns the feature block of a feature column, one of FEATURE_BLOCKS."""
+
+    for prefix, block in [('5_prime', '5_prime_kmer'), ('3_prime', '3_prime_kmer'), ('kozak', 'kozak'),
+                          ('first_50', 'first_50_kmer'), ('cksaap', 'cksaap')]:
+        if name.startswith(prefix):
+            return block
+    # CTDD distribution descriptors are named <property>-G<group>D<percentile>
+    if re.search(r'-G\d+D', name):
+        return 'ctdd'
+    # Amino acid composition and hydrophobicity/hydrophilicity correlation factors
+    return 'apaac'
+
+
+class FeatureExplainer:
+    """
+    Per-ORF explanations of an XGBoost classifier from its exact tree-path (TreeSHAP) feature contributions,
+    computed natively by XGBoost with pred_contribs in batches.
+
+    Each ORF is explained for the class it was assigned: the contributions to that class's margin are summed
+    per feature block, and its top_k features with the largest absolute contributions are listed.
+    """
+
+    def __init__(self, classifier, feature_names, class_names, top_k=5):
+
+        """
+        Args:
+            classifier (xgb.XGBClassifier): The loaded classifier.
+            feature_names (list): Names of the columns of the scaled matrix the classifier is given.
+            class_names (list): Name of each class, in the order of the classifier outputs.
+            top_k (int): Features listed per ORF.
+        """
+
+        self.booster = classifier.get_booster()
+        best_iteration = getattr(classifier, 'best_iteration', None)
+        # Explain the trees predict_proba uses
+        self.iterationRange = (0, best_iteration + 1) if best_iteration is not None else (0, 0)
+        self.featureNames = np.asarray(feature_names)
+        self.classNames = np.asarray(class_names)
+        self.topK = min(int(top_k), len(self.featureNames))
+        blocks = np.array([FEATURE_BLOCKS.index(feature_block(name)) for name in self.featureNames])
+        # Feature -> block one-hot matrix, so block sums are one matrix product per batch
+        self.blockMatrix = np.zeros((len(self.featureNames), len(FEATURE_BLOCKS)), dtype=np.float32)
+        self.blockMatrix[np.arange(len(blocks)), blocks] = 1
+
+    def explain(self, orf_ids, data, predictions):
+
+        """
+        Args:
+            orf_ids (pandas.Series): ORF ID of each row.
+            data (np.ndarray): Scaled feature matrix given to the classifier.
+            predictions (np.ndarray): Class probabilities of each row.
+
+        Returns:
+            pandas.DataFrame: orf_id, explained_class, bias, one contribution column per feature block and
+                top_features ('name:contribution' pairs separated by ';').
+        """
+
+        classes = np.argmax(predictions, axis=1)
+        bias, block_contributions, top_features = [], [], []
+        with measure('explanations', rows=len(data)), PROGRESS.task('explanations', len(data), 'ORFs') as task:
+            for start in range(0, len(data), EXPLAIN_BATCH):
+                batch = data[start:start + EXPLAIN_BATCH]
+                batch_classes = classes[start:start + EXPLAIN_BATCH]
+                contributions = self.booster.predict(xgb.DMatrix(batch), pred_contribs=True,
+                                                     iteration_range=self.iterationRange)
+                # rows x classes x (features + bias) -> the assigned class of each row
+                contributions = contributions[np.arange(len(batch)), batch_classes]
+                bias.append(contributions[:, -1])
+                contributions = contributions[:, :-1]
+                block_contributions.append(contributions @ self.blockMatrix)
+                top_features += self.__top_features(contributions)
+                task.update(start + len(batch))
+
+        explanations = pd.DataFrame(np.concatenate(block_contributions) if block_contributions else np.empty((0, len(FEATURE_BLOCKS))),
+                                    columns=FEATURE_BLOCKS)
+        explanations.insert(0, 'orf_id', np.asarray(orf_ids))
+        explanations.insert(1, 'explained_class', self.classNames[classes])
+        explanations.insert(2, 'bias', np.concatenate(bias) if bias else np.empty(0))
+        explanations['top_features'] = top_features
+        return explanations
+
+    def __top_features(self, contributions):
+        top = np.argpartition(-np.abs(contributions), self.topK - 1, axis=1)[:, :self.topK]
+        rows = np.arange(len(contributions))[:, None]
+        # Largest absolute contribution first
+        order = np.argsort(-np.abs(contributions[rows, top]), axis=1)
+        top = top[rows, order]
+        names, values = self.featureNames[top], contributions[rows, top]
+        return [';'.join(f'{name}:{value:+.4f}' for name, value in zip(row_names, row_values))
+                for row_names, row_values in zip(names, values)]
@@ -3,104 +3,253 @@ import pandas as pd
 import numpy as np
 import joblib
 import xgboost as xgb
- 
+
 
 from ..pipeline import PipelineStructure
-from ..utils import check_dir
+from ..utils import check_dir, broadcast_to_orfs, measure, PROGRESS
+from .prediction_cache import PredictionCache
+from .explanations import FeatureExplainer
+
+CLASS_NAMES = ['prisms', 'sam_intracellular', 'sam_secreted']
+
+# Rows scored per classifier call, so inference progress can be reported
+INFERENCE_BATCH = 65536
+
+
+def write_classifications(predicted_classes, predictions_dir):
+
+    """
+    Sorts the classifications by probability and writes them, together with one CSV per class.
+    """
+
+    predicted_classes = predicted_classes.sort_values(by=['probability'], ascending=False)
+    # Save the predicted classes to a CSV file
+    predicted_classes.to_csv(f'{predictions_dir}/shortstop_classifications.csv', index=False)
+
+    for class_name in CLASS_NAMES:
+        class_data = predicted_classes[predicted_classes['classification'] == class_name]
+        class_data.to_csv(f'{predictions_dir}/{class_name}.csv', index=False)
+
 
 class smORFPredictor(PipelineStructure):
     def __init__(self, args):
         super().__init__(args=args)
         self.set_prediction_attributes()
-        
+        self.trainColumns = None
+        self.classifier = None
+        self.scaler = None
+        self.chunksWritten = 0
+        self.cache = PredictionCache.from_args(args)
+        self.explain = getattr(args, 'explain', False)
+        self.explainer = None
+        self.featureNames = None
+
     def align_and_confirm_features(self):
-        self.orfs_features_in_train_model = pd.read_csv(self.args.orfs_features_in_train_model)
-        self.orfs_to_be_predicted = pd.read_csv(self.args.orfs_to_be_predicted)
-        
-        missing_features = set(self.orfs_features_in_train_model.columns) - set(self.orfs_to_be_predicted.columns)
-        
-        missing_features_df = pd.DataFrame(0.0, index=self.orfs_to_be_predicted.index, columns=list(missing_features), dtype=float)
-        
-        self.orfs_to_be_predicted = pd.concat([self.orfs_to_be_predicted, missing_features_df], axis=1)
-        
+        orfs_to_be_predicted = self.args.orfs_to_be_predicted or self.orfsFeatures
+        self.orfs_to_be_predicted = self.align_features(pd.read_csv(orfs_to_be_predicted))
+
+    def align_features(self, orfs_to_be_predicted):
+
+        """
+        Adds the training features missing from orfs_to_be_predicted (filled with 0), drops the extra ones
+        and orders the columns as in the trained model.
+        """
+
+        if self.trainColumns is None:
+            self.trainColumns = pd.read_csv(self.args.orfs_features_in_train_model, nrows=0).columns
+
+        missing_features = set(self.trainColumns) - set(orfs_to_be_predicted.columns)
+
+        missing_features_df = pd.DataFrame(0.0, index=orfs_to_be_predicted.index, columns=list(missing_features), dtype=float)
+
+        orfs_to_be_predicted = pd.concat([orfs_to_be_predicted, missing_features_df], axis=1)
+
         # Drop features not present in the train model and ensure column order matches the train model
-        missing_features_two = set(self.orfs_to_be_predicted.columns) - set(self.orfs_features_in_train_model.columns)
-        self.orfs_to_be_predicted = self.orfs_to_be_predicted.drop(columns=missing_features_two)
-        self.orfs_to_be_predicted = self.orfs_to_be_predicted[self.orfs_features_in_train_model.columns]
-        
+        missing_features_two = set(orfs_to_be_predicted.columns) - set(self.trainColumns)
+        orfs_to_be_predicted = orfs_to_be_predicted.drop(columns=missing_features_two)
+        orfs_to_be_predicted = orfs_to_be_predicted[self.trainColumns]
+
         # Make a copy to defragment the DataFrame
-        self.orfs_to_be_predicted = self.orfs_to_be_predicted.copy()
+        return orfs_to_be_predicted.copy()
 
-        
-    def dansby(self):
-        self.align_and_confirm_features()
-        orf_ids = self.orfs_to_be_predicted['orf_id']
-                
+    def load_model(self):
+
+        """Loads the classifier and the scaler once, so they can be reused across chunks."""
+
+        if self.classifier is not None:
+            return
         if self.model.endswith('.h5'): # Neural Net
-            model = tf.keras.models.load_model(self.model)
-            self.__scaler() 
-            predictions = model.predict(self.data) 
-            print(predictions)
+            import tensorflow as tf
+            self.classifier = tf.keras.models.load_model(self.model)
         elif self.model.endswith('.model'):
-            model = xgb.XGBClassifier() 
-            model.load_model(self.model)
-            self.__scaler()
-            predictions = model.predict_proba(self.data)
-            print(predictions)
+            self.classifier = xgb.XGBClassifier()
+            self.classifier.load_model(self.model)
         elif self.model.endswith('.pkl'):
-            model = joblib.load(self.model)
+            self.classifier = joblib.load(self.model)
+        self.scaler = joblib.load(self.args.model_scaler)
+
+    def predict_probabilities(self):
+
+        """Returns the class probabilities of the aligned orfs_to_be_predicted."""
+
+        self.load_model()
+        if len(self.orfs_to_be_predicted) == 0:
+            return np.empty((0, 3))
+        with measure('scaling', rows=len(self.orfs_to_be_predicted)):
             self.__scaler()
-            predictions = model.predict_proba(self.data)
-            print(predictions)
+        with measure('inference', rows=len(self.data)), PROGRESS.task('inference', len(self.data), 'ORFs') as task:
+            predictions = []
+            for start in range(0, len(self.data), INFERENCE_BATCH):
+                batch = self.data[start:start + INFERENCE_BATCH]
+                if self.model.endswith('.h5'):
+                    predictions.append(self.classifier.predict(batch))
+                else:
+                    predictions.append(self.classifier.predict_proba(batch))
+                task.update(start + len(batch))
+            return np.concatenate(predictions)
+
+    def dansby(self):
+        self.align_and_confirm_features()
+        orf_ids = self.orfs_to_be_predicted['orf_id']
+
+        predictions = self.predict_probabilities()
+        print(predictions)
+
+        # Features of this run were extracted once per unique ORF: broadcast back to every orf_id
+        orf_map = None
+        if self.args.mode == 'predict' and self.args.orfs_to_be_predicted is None:
+            orf_map = pd.read_csv(self.orfDedupMap)
+        self.write_explanations(orf_ids, predictions, orf_map)
+        if orf_map is not None:
+            if self.cache is not None:
+                # The cache hits were found by the features stage
+                self.cache.load_hits(self.cachedPredictions)
+                orf_ids, predictions = self.cache.complete(orf_ids, predictions, orf_map)
+                self.cache.close()
+            orf_ids, predictions = broadcast_to_orfs(orf_ids, predictions, orf_map)
+
+        with measure('output_writing', rows=len(orf_ids)):
+            self.write_sams(orf_ids, predictions)
+            predicted_classes = self.classify(orf_ids, predictions)
+            self.write_classifications(predicted_classes)
+
+    def dansby_chunk(self, orfs_features, orf_map=None):
+
+        """
+        Predicts one chunk of extracted features and appends the results to the prediction CSVs.
+        The first chunk written truncates the CSVs and writes their headers.
+
+        Args:
+            orfs_features (pandas.DataFrame): Extracted features of the chunk.
+            orf_map (pandas.DataFrame): Optional orf_id -> representative_id map of the chunk.
+        """
+
+        self.orfs_to_be_predicted = self.align_features(orfs_features)
+        orf_ids = self.orfs_to_be_predicted['orf_id']
+
+        predictions = self.predict_probabilities()
+        self.write_explanations(orf_ids, predictions, orf_map, append=self.chunksWritten > 0)
+        if orf_map is not None:
+            if self.cache is not None:
+                orf_ids, predictions = self.cache.complete(orf_ids, predictions, orf_map)
+            orf_ids, predictions = broadcast_to_orfs(orf_ids, predictions, orf_map)
+        if len(orf_ids) == 0:
+            return
+
+        append = self.chunksWritten > 0
+        with measure('output_writing', rows=len(orf_ids)):
+            self.write_sams(orf_ids, predictions, append=append)
+            predicted_classes = self.classify(orf_ids, predictions)
+            predicted_classes.to_csv(f'{self.predictionsDir}/shortstop_classifications.csv', index=False, mode='a' if append else 'w', header=not append)
+        self.chunksWritten += 1
+
+    def finalise_chunks(self):
+
+        """
+        Sorts the incrementally written classifications and splits them per class, as dansby does.
+
+        Only the three-column classification table is read back, never the features.
+        """
 
+        if self.cache is not None:
+            self.cache.report()
+            self.cache.close()
+        if self.chunksWritten == 0:
+            print("🚨 No ORFs passed sequence extraction, so there is nothing to predict.")
+            self.write_sams(pd.Series([], dtype=object), np.empty((0, 3)))
+            predicted_classes = self.classify(pd.Series([], dtype=object), np.empty((0, 3)))
+        else:
+            predicted_classes = pd.read_csv(f'{self.predictionsDir}/shortstop_classifications.csv')
+        self.write_classifications(predicted_classes)
+
+    def write_explanations(self, orf_ids, predictions, orf_map=None, append=False):
+
+        """
+        With --explain, writes the feature-block contributions and top features behind the classification of
+        each ORF to explanations.csv. ORFs sharing their feature inputs share the explanation of their
+        representative.
+        """
+
+        if not self.explain or len(orf_ids) == 0:
+            return
+        if self.explainer is None:
+            if not isinstance(self.classifier, xgb.XGBClassifier):
+                print("🚨 --explain needs an XGBoost model (.model); no explanations are written.")
+                self.explain = False
+                return
+            self.explainer = FeatureExplainer(self.classifier, self.featureNames, CLASS_NAMES, top_k=self.args.explain_top_k)
+
+        explanations = self.explainer.explain(orf_ids, self.data, predictions)
+        if orf_map is not None:
+            explanations = orf_map[['orf_id', 'representative_id']].merge(
+                explanations.rename(columns={'orf_id': 'representative_id'}), on='representative_id')
+            explanations = explanations.drop(columns='representative_id')
+        with measure('output_writing', rows=len(explanations)):
+            explanations.to_csv(f'{self.predictionsDir}/explanations.csv', index=False,
+                                mode='a' if append else 'w', header=not append, float_format='%.4f')
+
+    def write_sams(self, orf_ids, predictions, append=False):
         predictions_df = pd.DataFrame(predictions, columns=['prism_probability', 'intracellular', 'extracellular_secreted'])
         predictions_df['sam_probability'] = predictions_df['intracellular'] + predictions_df['extracellular_secreted']
-        predictions_df['orf_id'] = orf_ids
+        predictions_df['orf_id'] = orf_ids.values
         predictions_df = predictions_df[['orf_id','prism_probability', 'sam_probability']]
-        predictions_df.to_csv(f'{self.predictionsDir}/sams.csv', index=False)
+        predictions_df.to_csv(f'{self.predictionsDir}/sams.csv', index=False, mode='a' if append else 'w', header=not append)
 
+    @staticmethod
+    def classify(orf_ids, predictions):
         labels = np.argmax(predictions, axis=1)
         percentages = np.max(predictions, axis=1)
 
         # Map integer labels to string class names BEFORE creating the DataFrame
-        label_names = np.array([
-            'prisms' if l == 0 else
-            'sam_intracellular' if l == 1 else
-            'sam_secreted' for l in labels
-        ])
-
-        predicted_classes = pd.DataFrame({
-            'orf_id': orf_ids,
+        label_names = np.array(CLASS_NAMES)[labels]
+
+        return pd.DataFrame({
+            'orf_id': orf_ids.values,
             'classification': label_names,
             'probability': percentages
         })
-    
-        predicted_classes = predicted_classes.sort_values(by=['probability'], ascending=False)
-        # Save the predicted classes to a CSV file
-        predicted_classes.to_csv(f'{self.predictionsDir}/shortstop_classifications.csv', index=False)
-
-        for class_name in ['prisms', 'sam_intracellular', 'sam_secreted']:
-            class_data = predicted_classes[predicted_classes['classification'] == class_name]
-            class_data.to_csv(f'{self.predictionsDir}/{class_name}.csv', index=False)
-        
-    
+
+    def write_classifications(self, predicted_classes):
+        write_classifications(predicted_classes, self.predictionsDir)
+
+
     def __scaler(self):
-        self.scaler = joblib.load(self.args.model_scaler)
-        
         self.__aa_split()
         self.__dna_split()
-        
+
         #print(f"Number of DNA features being used to predict: {self.dna_data.shape[1]}")
         #print(f"Number of AA features being used to predict: {self.aa_data.shape[1]}")
-        
+
         self.data = np.concatenate((self.dna_data, self.aa_data), axis=1)
-        
+        self.featureNames = self.dnaNames + self.aaNames
+
         self.data =self.scaler.transform(self.data)
-        
+
     def __dna_split(self):
         self.dna_data = self.orfs_to_be_predicted.loc[:, self.orfs_to_be_predicted.columns.str.startswith('5_prime') | self.orfs_to_be_predicted.columns.str.startswith('3_prime') | self.orfs_to_be_predicted.columns.str.startswith('kozak') | self.orfs_to_be_predicted.columns.str.startswith('first_50')]
+        self.dnaNames = list(self.dna_data.columns)
         self.dna_data = self.dna_data.to_numpy()
-        
+
     def __aa_split(self):
         self.aa_data = self.orfs_to_be_predicted.drop(self.orfs_to_be_predicted .filter(regex='3_prime').columns, axis=1)
         self.aa_data = self.aa_data.drop(self.aa_data.filter(regex='5_prime').columns, axis=1)
@@ -110,4 +259,5 @@ class smORFPredictor(PipelineStructure):
         self.aa_data = self.aa_data.drop(self.aa_data.filter(regex='type').columns, axis=1)
         self.aa_data = self.aa_data.drop(self.aa_data.filter(regex='orf_id').columns, axis=1)
         self.aa_data = self.aa_data.drop(self.aa_data.filter(regex='local').columns, axis=1)
-        self.aa_data = self.aa_data.to_numpy()
\ No newline at end of file
+        self.aaNames = list(self.aa_data.columns)
+        self.aa_data = self.aa_data.to_numpy()
@@ -0,0 +1,195 @@
+import os
+import time
+import hashlib
+import sqlite3
+import numpy as np
+import pandas as pd
+
+# SQLite caps the number of bound parameters per statement
+QUERY_BATCH = 500
+
+
+class PredictionCache:
+    """
+    On-disk cache of class probabilities shared across runs and samples.
+
+    Entries are keyed by the content key of an ORF's feature inputs (see utils.content_keys) and by
+    a hash of the model bundle (model, scaler, training feature columns, utr_length and kmer), so a
+    new model or featurisation setting never reuses stale predictions. The least recently used
+    entries are evicted once the cache holds more than max_entries, except those used since the
+    cache was opened: the hits of the current run are also kept in memory until it completes.
+    """
+
+    def __init__(self, cache_file, model_key, max_entries=5000000):
+        self.cacheFile = cache_file
+        self.modelKey = model_key
+        self.maxEntries = int(max_entries)
+        os.makedirs(os.path.dirname(os.path.abspath(cache_file)), exist_ok=True)
+        self.connection = sqlite3.connect(cache_file, timeout=600)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS predictions ("
+            "content_key TEXT NOT NULL, model_key TEXT NOT NULL, "
+            "prism REAL, intracellular REAL, secreted REAL, last_used REAL, "
+            "PRIMARY KEY (content_key, model_key))"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS predictions_last_used ON predictions (last_used)")
+        self.connection.commit()
+        self.runStart = time.time()
+        self.cached = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def enabled(args):
+
+        """Returns whether the predict mode arguments turn the cache on."""
+
+        if args.mode != 'predict' or getattr(args, 'no_cache', True):
+            return False
+        if getattr(args, 'explain', False):
+            # Cached ORFs are not featurised, so they could not be explained
+            return False
+        if getattr(args, 'cascade', False):
+            # Cached probabilities come from the full model only; the cascade records which tier decided each call
+            return False
+        return True
+
+    @classmethod
+    def from_args(cls, args):
+
+        """Returns the cache configured by the predict mode arguments, or None when caching is off."""
+
+        if not cls.enabled(args):
+            return None
+        return cls(os.path.join(os.path.expanduser(args.cache_dir), 'predictions.sqlite'), cls.model_key_from_args(args),
+                   max_entries=args.cache_max_entries)
+
+    @classmethod
+    def model_key_from_args(cls, args):
+
+        """Returns the model bundle hash of the predict mode arguments."""
+
+        return cls.model_bundle_hash(args.model, args.model_scaler, args.orfs_features_in_train_model,
+                                     utr_length=int(args.utr_length), kmer=int(args.kmer))
+
+    @staticmethod
+    def model_bundle_hash(*files, **params):
+
+        """Hashes the content of the model bundle files together with the featurisation parameters."""
+
+        digest = hashlib.sha256()
+        for path in files:
+            with open(path, 'rb') as handle:
+                for block in iter(lambda: handle.read(1 << 20), b''):
+                    digest.update(block)
+        for name in sorted(params):
+            digest.update(f'{name}={params[name]};'.encode())
+        return digest.hexdigest()
+
+    def lookup(self, keys):
+
+        """
+        Returns the cached probabilities of the given content keys as a dict of key -> (prism,
+        intracellular, secreted), and marks the hits as recently used.
+        """
+
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        for start in range(0, len(keys), QUERY_BATCH):
+            batch = keys[start:start + QUERY_BATCH]
+            rows = self.connection.execute(
+                f"SELECT content_key, prism, intracellular, secreted FROM predictions "
+                f"WHERE model_key = ? AND content_key IN ({','.join('?' * len(batch))})",
+                [self.modelKey] + batch,
+            ).fetchall()
+            found.update({row[0]: row[1:] for row in rows})
+
+        now = time.time()
+        self.connection.executemany(
+            "UPDATE predictions SET last_used = ? WHERE content_key = ? AND model_key = ?",
+            [(now, key, self.modelKey) for key in found],
+        )
+        self.connection.commit()
+        return found
+
+    def drop_cached(self, unique_smorfs):
+
+        """
+        Returns the rows of unique_smorfs whose content_key is not in the cache yet. The cached
+        probabilities of the others are kept in memory for complete().
+        """
+
+        cached = self.lookup(unique_smorfs['content_key'].tolist())
+        self.cached.update(cached)
+        self.hits += len(cached)
+        self.misses += len(unique_smorfs) - len(cached)
+        return unique_smorfs[~unique_smorfs['content_key'].isin(cached.keys())]
+
+    def save_hits(self, path):
+
+        """Writes the cached probabilities found by drop_cached, so a later stage can complete the run."""
+
+        hits = pd.DataFrame([(key, *p) for key, p in self.cached.items()],
+                            columns=['content_key', 'prism', 'intracellular', 'secreted'])
+        hits.to_csv(path, index=False)
+
+    def load_hits(self, path):
+
+        """Reads back the cached probabilities written by save_hits."""
+
+        hits = pd.read_csv(path, dtype={'content_key': str})
+        self.cached.update(zip(hits['content_key'], hits[['prism', 'intracellular', 'secreted']].itertuples(index=False, name=None)))
+
+    def store(self, keys, predictions):
+
+        """
+        Stores freshly computed probabilities, then evicts the least recently used entries beyond
+        max_entries. Entries used since the cache was opened are never evicted, so a run may leave the
+        cache above max_entries until the next one.
+        """
+
+        now = time.time()
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?, ?, ?)",
+            [(key, self.modelKey, float(p[0]), float(p[1]), float(p[2]), now) for key, p in zip(keys, predictions)],
+        )
+        n_entries = self.connection.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+        if n_entries > self.maxEntries:
+            self.connection.execute(
+                "DELETE FROM predictions WHERE rowid IN "
+                "(SELECT rowid FROM predictions WHERE last_used < ? ORDER BY last_used LIMIT ?)",
+                (self.runStart, n_entries - self.maxEntries),
+            )
+        self.connection.commit()
+
+    def complete(self, representative_ids, predictions, orf_map):
+
+        """
+        Stores the probabilities just computed for representative_ids and appends the cached ones of
+        the remaining representatives of orf_map, as found by drop_cached, so every representative has
+        a prediction.
+
+        Returns:
+            tuple: The representative orf_ids (pandas.Series) and their class probabilities.
+        """
+
+        representatives = orf_map.drop_duplicates('representative_id').set_index('representative_id')['content_key']
+        self.store(representatives.loc[representative_ids].values, predictions)
+
+        missing = representatives[~representatives.index.isin(representative_ids)]
+        unscored = missing[~missing.isin(self.cached.keys())]
+        if len(unscored) > 0:
+            raise ValueError(f"🚨 {len(unscored)} ORFs, e.g. {unscored.index[0]}, were neither predicted nor found in the "
+                             f"prediction cache; rerun without --resume or with --no_cache.")
+        cached_predictions = np.array([self.cached[key] for key in missing], dtype=float).reshape(-1, 3)
+
+        return (pd.concat([pd.Series(representative_ids.values), pd.Series(missing.index.values)], ignore_index=True),
+                np.concatenate([predictions, cached_predictions]))
+
+    def report(self):
+        total = self.hits + self.misses
+        if total:
+            print(f"     Prediction cache: {self.hits} of {total} unique ORFs reused from {self.cacheFile}.")
+
+    def close(self):
+        self.connection.close()
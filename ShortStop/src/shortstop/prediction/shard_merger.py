@@ -0,0 +1,81 @@
+import glob
+import os
+import re
+import pandas as pd
+
+from ..pipeline import PipelineStructure
+from .predict_smorfs import write_classifications
+
+
+class ShardMerger(PipelineStructure):
+    def __init__(self, args):
+        super().__init__(args=args)
+        self.set_prediction_attributes()
+        self.shardDirs = self.__find_shards()
+
+    def __find_shards(self):
+        
+        """
+        Finds the shard_<i>_of_<N> directories written by `shortstop predict --shard i/N` under outdir,
+        and checks that every shard of the run is present.
+        """
+        
+        shards = {}
+        for shard_dir in glob.glob(f'{self.outdir}/shard_*_of_*'):
+            match = re.fullmatch(r'shard_(\d+)_of_(\d+)', os.path.basename(shard_dir))
+            if match:
+                shards[(int(match.group(1)), int(match.group(2)))] = shard_dir
+
+        if not shards:
+            raise FileNotFoundError(f"No shard_<i>_of_<N> directories found in: {self.outdir}")
+        n_shards = {n for _, n in shards}
+        if len(n_shards) != 1:
+            raise ValueError(f"Shards from runs with different numbers of shards found in {self.outdir}: {sorted(n_shards)}")
+        n_shards = n_shards.pop()
+        missing = [i for i in range(1, n_shards + 1) if (i, n_shards) not in shards]
+        if missing:
+            raise FileNotFoundError(f"Missing shards {missing} of {n_shards} in: {self.outdir}")
+
+        print(f"     Merging {n_shards} shards from {self.outdir}")
+        return [shards[(i, n_shards)] for i in range(1, n_shards + 1)]
+
+    @staticmethod
+    def __unsharded_order(table, sequences):
+        
+        """
+        Orders rows as an unsharded run does: sequence extraction emits the + strand ORFs first and
+        the - strand ORFs second, each sorted by orf_id.
+        """
+        
+        strands = sequences.drop_duplicates('orf_id').set_index('orf_id')['cds_strand']
+        order_key = table['orf_id'].map(strands).ne('+')
+        table = table.assign(minus_strand=order_key.values)
+        table = table.sort_values(['minus_strand', 'orf_id'], kind='stable')
+        return table.drop(columns='minus_strand').reset_index(drop=True)
+
+    def merge(self):
+        
+        """
+        Combines the predictions and unknown sequences of every shard into the standard outdir files:
+        sequences/unknown_sequences.csv, predictions/sams.csv, predictions/shortstop_classifications.csv
+        and the per-class CSVs (and explanations.csv of --explain runs), ordered as in an unsharded run.
+        """
+        
+        sequences = pd.concat([pd.read_csv(f'{shard_dir}/sequences/unknown_sequences.csv') for shard_dir in self.shardDirs], ignore_index=True)
+        sams = pd.concat([pd.read_csv(f'{shard_dir}/predictions/sams.csv') for shard_dir in self.shardDirs], ignore_index=True)
+        classifications = pd.concat([pd.read_csv(f'{shard_dir}/predictions/shortstop_classifications.csv') for shard_dir in self.shardDirs], ignore_index=True)
+
+        sequences = self.__unsharded_order(sequences, sequences)
+        sams = self.__unsharded_order(sams, sequences)
+        sequences.to_csv(self.unknown_sequences, index=False)
+        sams.to_csv(f'{self.predictionsDir}/sams.csv', index=False)
+
+        # Classifications are sorted by probability starting from the sams.csv order, exactly as dansby does
+        classifications = classifications.set_index('orf_id').loc[sams['orf_id']].reset_index()
+        write_classifications(classifications, self.predictionsDir)
+
+        explanation_files = [f'{shard_dir}/predictions/explanations.csv' for shard_dir in self.shardDirs]
+        if all(os.path.exists(path) for path in explanation_files):
+            explanations = pd.concat([pd.read_csv(path) for path in explanation_files], ignore_index=True)
+            self.__unsharded_order(explanations, sequences).to_csv(f'{self.predictionsDir}/explanations.csv', index=False)
+        print(f"     {len(sams)} ORF predictions merged.")
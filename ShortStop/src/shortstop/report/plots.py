@@ -0,0 +1,145 @@
+"""
+Each plot reads the data artefacts written by a pipeline stage and returns the figures it wrote, or an empty
+list when its artefacts do not exist (e.g. the stage was skipped). Plotting libraries are imported here only,
+so that the compute stages never load them.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+# Resolution of the figures; enough to read on screen, a fraction of the size and drawing time of 300 dpi
+DPI = 120
+
+
+def _pyplot():
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def plot_sequence_lengths(combined_database, plots_dir):
+
+    """Boxplot of the protein lengths of each ORF type (positives, unknown ORFs, decoys)."""
+
+    if not os.path.exists(combined_database):
+        return []
+    plt = _pyplot()
+    import seaborn as sns
+    lengths = pd.read_csv(combined_database, usecols=['type', 'length'])
+    lengths['length'] = pd.to_numeric(lengths['length'], errors='coerce')
+
+    sns.set(style="whitegrid")
+    fig, ax = plt.subplots(figsize=(11.7, 8.27))
+    sns.boxplot(x="type", y="length", data=lengths, ax=ax)
+    path = f'{plots_dir}/database_sequence_length_distribution.png'
+    fig.savefig(path, dpi=DPI)
+    plt.close(fig)
+    return [path]
+
+
+def plot_umap(umap_table, umap_html):
+
+    """Interactive 3D scatter of the UMAP embedding, coloured by label. plotly.js is loaded from its CDN."""
+
+    if not os.path.exists(umap_table):
+        return []
+    import plotly.express as px
+    reduced_features = pd.read_csv(umap_table)
+    fig = px.scatter_3d(reduced_features, x="umap_0", y="umap_1", z="umap_2", color="local",
+                        color_discrete_map={"Cytoplasm": "yellow", "Secreted": "blue", "Random": "black",
+                                            "ToBePredicted": "red"})
+    fig.update_traces(marker={'size': 3, 'opacity': 1})
+    fig.update_layout(hovermode="y")
+    fig.write_html(umap_html, include_plotlyjs='cdn', full_html=True)
+    return [umap_html]
+
+
+def plot_training_history(history_csv, plots_dir):
+
+    """Accuracy and loss per epoch of the best neural network."""
+
+    if not os.path.exists(history_csv):
+        return []
+    plt = _pyplot()
+    history = pd.read_csv(history_csv)
+    fig, ax = plt.subplots()
+    for column, label in [('accuracy', 'train accuracy'), ('val_accuracy', 'val accuracy'),
+                          ('loss', 'train loss'), ('val_loss', 'val loss')]:
+        ax.plot(history[column], label=label)
+    ax.set_title('Model accuracy and loss')
+    ax.set_xlabel('Epoch')
+    ax.set_ylabel('Accuracy/Loss')
+    ax.legend(loc='best')
+    path = f"{plots_dir}/nnet_model_accuracy.png"
+    fig.savefig(path, dpi=DPI)
+    plt.close(fig)
+    return [path]
+
+
+def plot_nn_architecture(nn_model, plots_dir):
+
+    """Diagram of the layers of the best neural network (needs pydot and graphviz)."""
+
+    if not os.path.exists(nn_model):
+        return []
+    import tensorflow as tf
+    path = f"{plots_dir}/nnet_model_architecture.png"
+    tf.keras.utils.plot_model(tf.keras.models.load_model(nn_model), show_shapes=True, to_file=path)
+    return [path] if os.path.exists(path) else []
+
+
+def plot_roc(roc_csv, plots_dir):
+
+    """ROC curve of each class for each model, from the curves saved by TrainModel.test_model."""
+
+    if not os.path.exists(roc_csv):
+        return []
+    plt = _pyplot()
+    roc = pd.read_csv(roc_csv)
+    linestyles = {'nn': '-', 'xgb': '--', 'rf': ':'}
+    colors = ['aqua', 'darkorange', 'cornflowerblue']
+
+    fig, ax = plt.subplots()
+    for (model, class_name), curve in roc.groupby(['model', 'class'], sort=False):
+        class_auc = np.trapz(curve['tpr'], curve['fpr'])
+        ax.plot(curve['fpr'], curve['tpr'], color=colors[int(class_name.split('_')[-1]) % len(colors)],
+                linestyle=linestyles.get(model, '-'),
+                label=f'{model.upper()} Class {class_name.split("_")[-1]} (AUC = {class_auc:0.2f})')
+    ax.plot([0, 1], [0, 1], 'k--', lw=2)
+    ax.set_xlim([0.0, 1.0])
+    ax.set_ylim([0.0, 1.05])
+    ax.set_xlabel('False Positive Rate')
+    ax.set_ylabel('True Positive Rate')
+    ax.set_title('Multi-class ROC Comparison')
+    ax.legend(loc="lower right")
+    path = f"{plots_dir}/roc_curve_comparison.png"
+    fig.savefig(path, dpi=DPI)
+    plt.close(fig)
+    return [path]
+
+
+def plot_feature_importance(models_dir, plots_dir):
+
+    """Bar chart of the 20 most important features of the best tree model."""
+
+    paths = []
+    for model, title in [('xgb', 'XGBoost'), ('rf', 'Random Forest')]:
+        importances_csv = f"{models_dir}/{model}_feature_importances.csv"
+        if not os.path.exists(importances_csv):
+            continue
+        plt = _pyplot()
+        feature_importances = pd.read_csv(importances_csv, index_col=0).head(20)
+        fig, ax = plt.subplots()
+        ax.bar(feature_importances.index, feature_importances['importance'])
+        ax.tick_params(axis='x', labelrotation=90)
+        ax.set_title(f'{title} Feature Importance')
+        ax.set_xlabel('Feature')
+        ax.set_ylabel('Importance')
+        fig.tight_layout()
+        path = f"{plots_dir}/{model}_feature_importance.png"
+        fig.savefig(path, dpi=DPI)
+        plt.close(fig)
+        paths.append(path)
+    return paths
@@ -0,0 +1,110 @@
+import os
+import time
+import base64
+import html
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+from ..pipeline import PipelineStructure
+from ..utils import RUN_REPORT
+from . import plots
+
+
+class Report(PipelineStructure):
+    """
+    Draws the figures of a run from the data artefacts its stages saved, off the critical path: each section
+    is submitted once its artefacts are written and drawn in a background process while the next stages
+    compute. finish() waits for the figures and optionally bundles them, with the metric tables, into a
+    single HTML report. With --no-plots nothing is drawn and no plotting library is imported.
+    """
+
+    def __init__(self, args):
+        super().__init__(args=args)
+        self.set_train_attributes()
+        self.enabled = not getattr(args, 'no_plots', False)
+        self.executor = None
+        self.futures = {}
+        self.start = None
+
+    def sections(self):
+
+        """Returns section name -> (plot function, arguments), in the order of the HTML report."""
+
+        return {
+            'sequence_lengths': (plots.plot_sequence_lengths, (self.combinedDatabaseDF, self.plotsDir)),
+            'umap': (plots.plot_umap, (self.umapDF, self.umapHtml)),
+            'training_history': (plots.plot_training_history, (f"{self.modelsDir}/model_history.csv", self.plotsDir)),
+            'nn_architecture': (plots.plot_nn_architecture, (f"{self.modelsDir}/best_nn_model.h5", self.plotsDir)),
+            'roc': (plots.plot_roc, (f"{self.modelsDir}/roc_data.csv", self.plotsDir)),
+            'feature_importance': (plots.plot_feature_importance, (self.modelsDir, self.plotsDir)),
+        }
+
+    def submit(self, *sections):
+
+        """Queues the sections, whose artefacts must already be written, for drawing in the background."""
+
+        if not self.enabled:
+            return
+        if self.executor is None:
+            # A single worker: figures are cheap next to the compute stages, and drawn in submission order
+            self.executor = ProcessPoolExecutor(max_workers=1)
+            self.start = time.perf_counter()
+        available = self.sections()
+        for section in sections:
+            function, arguments = available[section]
+            self.futures[section] = self.executor.submit(function, *arguments)
+
+    def finish(self, html_report=False):
+
+        """
+        Waits for the submitted figures and writes <outdir>/plots/report.html if html_report.
+
+        Returns:
+            dict: Section -> figures written. A section that failed is reported and left out.
+        """
+
+        if not self.enabled or self.executor is None:
+            return {}
+        figures = {}
+        for section, future in self.futures.items():
+            try:
+                figures[section] = future.result()
+            except Exception as error:
+                print(f"🚨 The {section} figure could not be drawn: {error}")
+        self.executor.shutdown()
+        self.executor = None
+        RUN_REPORT.add('report', time.perf_counter() - self.start)
+
+        if html_report:
+            self.write_html(figures)
+        n_figures = sum(len(paths) for paths in figures.values())
+        print(f"✅ {n_figures} figures written to {self.plotsDir}.")
+        return figures
+
+    def write_html(self, figures):
+
+        """Writes the figures (PNGs inline, interactive plots linked) and the metric tables into one HTML file."""
+
+        path = f"{self.plotsDir}/report.html"
+        parts = [f"<html><head><meta charset='utf-8'><title>ShortStop report</title></head><body>",
+                 f"<h1>ShortStop report: {html.escape(os.path.abspath(self.outdir))}</h1>"]
+        for section, paths in figures.items():
+            for figure in paths:
+                parts.append(f"<h2>{html.escape(section.replace('_', ' ').capitalize())}</h2>")
+                if figure.endswith('.png'):
+                    with open(figure, 'rb') as handle:
+                        encoded = base64.b64encode(handle.read()).decode()
+                    parts.append(f"<img src='data:image/png;base64,{encoded}' style='max-width:100%'>")
+                else:
+                    parts.append(f"<p><a href='{html.escape(os.path.relpath(figure, self.plotsDir))}'>{html.escape(os.path.basename(figure))}</a></p>")
+
+        for title, table in [('Metrics', f"{self.modelsDir}/metrics.csv"), ('Macro-average ROC AUC', f"{self.modelsDir}/macro_auc.csv"),
+                             ('Retrained model comparison', f"{self.modelsDir}/retrain_comparison.csv")]:
+            if os.path.exists(table):
+                parts.append(f"<h2>{title}</h2>")
+                parts.append(pd.read_csv(table).to_html(index=False, float_format=lambda value: f'{value:.4g}'))
+        parts.append("</body></html>")
+
+        with open(path, 'w') as handle:
+            handle.write('\n'.join(parts))
+        print(f"     HTML report written to {path}")
@@ -1,8 +1,7 @@
 import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
 
 from ..pipeline import PipelineStructure
+from ..report.plots import plot_sequence_lengths
 
 
 class DatabaseCombiner(PipelineStructure):
@@ -22,7 +21,4 @@ class DatabaseCombiner(PipelineStructure):
 
     def plot_sequence_length_distribution(self):
         print("Plotting sequence length distribution.\n")
-        sns.set(style="whitegrid")
-        sns.set(rc={'figure.figsize': (11.7, 8.27)})
-        ax = sns.boxplot(x="type", y="length", data=self.combinedDatabase)
-        plt.savefig(f'{self.plotsDir}/database_sequence_length_distribution.png', dpi=300)
+        plot_sequence_lengths(self.combinedDatabaseDF, self.plotsDir)
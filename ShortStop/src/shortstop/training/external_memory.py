@@ -0,0 +1,135 @@
+import os
+import glob
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from sklearn.preprocessing import StandardScaler
+
+from ..utils import measure, LABEL_ENCODING
+
+# Rows of the feature table read, split and written per block; sets the peak memory of the streaming pass
+BLOCK_ROWS = 100000
+DNA_PREFIXES = ('5_prime', '3_prime', 'kozak', 'first_50')
+# Columns of the feature table that are not features
+NON_FEATURE_PATTERNS = ('label', 'orf_id', 'cds', 'type', 'local', 'umap_0', 'umap_1', 'umap_2')
+
+
+def feature_columns(columns):
+
+    """Returns the DNA and amino acid feature columns of a feature table, in the order the models use."""
+
+    dna_columns = [col for col in columns if col.startswith(DNA_PREFIXES)]
+    aa_columns = [col for col in columns if not any(pattern in col for pattern in DNA_PREFIXES + NON_FEATURE_PATTERNS)]
+    return dna_columns, aa_columns
+
+
+class FeatureBlocks:
+    """
+    The labelled rows of a feature table, written in one streaming pass as on-disk float32 blocks of each split
+    (train, validation for early stopping, test), while the scaler is fitted on the training rows.
+
+    Rows are assigned to the splits at random, with the same seed giving the same split, so the split is
+    stratified in expectation rather than exactly as with train_test_split.
+    """
+
+    SPLITS = ['train', 'validation', 'test']
+
+    def __init__(self, blocks_dir, block_rows=BLOCK_ROWS, test_size=0.2, validation_size=0.1, seed=None):
+
+        """
+        Args:
+            blocks_dir (str): Directory the blocks are written to.
+            block_rows (int): Rows of the feature table read at a time.
+            test_size (float): Fraction of the rows held out for testing.
+            validation_size (float): Fraction of the remaining rows held out for early stopping.
+            seed (int): Seed of the split.
+        """
+
+        self.blocksDir = blocks_dir
+        self.blockRows = int(block_rows)
+        self.testSize = test_size
+        self.validationSize = validation_size
+        self.seed = seed
+        self.scaler = None
+        self.dnaColumns = None
+        self.aaColumns = None
+
+    def write(self, features_csv):
+
+        """
+        Streams features_csv into blocks and fits the scaler on the training rows.
+
+        Returns:
+            StandardScaler: The scaler, fitted on every training row.
+        """
+
+        os.makedirs(self.blocksDir, exist_ok=True)
+        for path in glob.glob(f'{self.blocksDir}/*.npy'):
+            os.remove(path)
+
+        rng = np.random.default_rng(self.seed)
+        self.scaler = StandardScaler()
+        counts = dict.fromkeys(self.SPLITS, 0)
+        for n, chunk in enumerate(pd.read_csv(features_csv, chunksize=self.blockRows)):
+            with measure('feature_blocks', rows=len(chunk)):
+                if self.dnaColumns is None:
+                    self.dnaColumns, self.aaColumns = feature_columns(chunk.columns)
+                chunk = chunk[chunk['local'].isin(LABEL_ENCODING)]
+                data = chunk[self.dnaColumns + self.aaColumns].to_numpy(dtype=np.float32)
+                labels = chunk['local'].map(LABEL_ENCODING).to_numpy(dtype=np.int8)
+
+                draws = rng.random(len(chunk))
+                test = draws < self.testSize
+                validation = ~test & (draws < self.testSize + (1 - self.testSize) * self.validationSize)
+                for split, rows in zip(self.SPLITS, [~test & ~validation, validation, test]):
+                    if not rows.any():
+                        continue
+                    np.save(f'{self.blocksDir}/{split}_{n:05d}_data.npy', data[rows])
+                    np.save(f'{self.blocksDir}/{split}_{n:05d}_labels.npy', labels[rows])
+                    np.save(f'{self.blocksDir}/{split}_{n:05d}_ids.npy', chunk['orf_id'].to_numpy().astype(str)[rows])
+                    counts[split] += int(rows.sum())
+                if (~test & ~validation).any():
+                    self.scaler.partial_fit(data[~test & ~validation])
+
+        print(f"     Feature blocks written: {', '.join(f'{count} {split}' for split, count in counts.items())} ORFs.")
+        return self.scaler
+
+    def blocks(self, split):
+
+        """Returns the (data, labels, ids) files of every block of a split, in order."""
+
+        return [(data_file, data_file.replace('_data.npy', '_labels.npy'), data_file.replace('_data.npy', '_ids.npy'))
+                for data_file in sorted(glob.glob(f'{self.blocksDir}/{split}_*_data.npy'))]
+
+    def ids_and_labels(self, split):
+
+        """Returns the ORF IDs and labels of every block of a split, without loading the features."""
+
+        blocks = self.blocks(split)
+        ids = np.concatenate([np.load(ids_file) for _, _, ids_file in blocks] or [np.empty(0, dtype=str)])
+        labels = np.concatenate([np.load(labels_file) for _, labels_file, _ in blocks] or [np.empty(0, dtype=np.int8)])
+        return ids, labels
+
+
+class BlockIter(xgb.DataIter):
+    """
+    Feeds the blocks of a split to XGBoost one at a time, scaled on the fly, to build an external-memory DMatrix.
+    XGBoost pages the quantised blocks to cache files under cache_prefix rather than holding the split in memory.
+    """
+
+    def __init__(self, blocks, scaler, cache_prefix):
+        self.blockFiles = blocks
+        self.scaler = scaler
+        self.position = 0
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data):
+        if self.position == len(self.blockFiles):
+            return 0
+        data_file, labels_file, _ = self.blockFiles[self.position]
+        input_data(data=self.scaler.transform(np.load(data_file)).astype(np.float32), label=np.load(labels_file))
+        self.position += 1
+        return 1
+
+    def reset(self):
+        self.position = 0
@@ -0,0 +1,165 @@
+import os
+import sys
+import json
+import pandas as pd
+
+from ..pipeline import PipelineStructure
+from ..converters import FeatureExtraction
+from ..utils import collapse_identical_orfs, measure
+from ..utils.orf_dedup import content_keys
+
+class FeatureExtractor(PipelineStructure):
+    def __init__(self, args):
+        super().__init__(args=args)
+        self.set_train_attributes()
+
+    def extract_features(self):
+        if self.args.mode == "train" or self.args.mode == "demo" or self.args.mode == "feature_extract" or self.args.mode == "retrain":
+            positive_unknown_decoy_sequences = pd.read_csv(self.combinedDatabaseDF)
+
+            reused_features = None
+            if self.args.mode == "retrain":
+                reused_features, positive_unknown_decoy_sequences = self.__reuse_previous_features(positive_unknown_decoy_sequences)
+
+            # remove seq in smorfs not in seq
+            ids = positive_unknown_decoy_sequences["orf_id"].values.tolist()
+            aa_seqs = positive_unknown_decoy_sequences['aa_seq'].values.tolist()
+            cds_seqs = positive_unknown_decoy_sequences['cds_seq'].values.tolist()
+            upstream_seqs = positive_unknown_decoy_sequences['utr_5'].tolist()
+            downstream_seqs = positive_unknown_decoy_sequences['utr_3'].tolist()
+
+            type = positive_unknown_decoy_sequences["type"].values.tolist()  # This is to append the type to the features
+            local = positive_unknown_decoy_sequences["local"].values.tolist()  # This is to append the cc to the features
+
+             # Are all the lists the same length?
+            if len(ids) == len(aa_seqs) == len(cds_seqs) == len(upstream_seqs) == len(downstream_seqs) == len(type) == len(
+                    local):
+                print("There are " + str(len(ids)) + " short protein-coding genes being considered for training.")
+            else:
+                print("You are missing ids, aa_seqs, cds_seqs, upstream_seqsm, downstream_seqs, type, or local data.")
+
+            #Extract features
+            utr_length = self.args.utr_length
+            utr_length = int(utr_length)
+            k = self.args.kmer
+            k = int(k)
+
+            if len(ids) > 0:
+                features_instance = FeatureExtraction(ids, type, local, aa_seqs, cds_seqs, upstream_seqs, downstream_seqs, utr_length = utr_length, k = k)
+                orfs_features = features_instance.feature_extraction()
+
+                orfs_features['type'] = type
+                orfs_features['local'] = local
+                orfs_features.index = positive_unknown_decoy_sequences.index
+            else:
+                orfs_features = None
+
+            if reused_features is not None:
+                # Back in the order of the combined database, with the columns of the previous run
+                orfs_features = pd.concat([reused_features, orfs_features]).sort_index()[reused_features.columns].reset_index(drop=True)
+                # k-mer columns only exist for the k-mers seen, so the new sequences lack some of the previous
+                # run's; they count 0, as in a from-scratch run
+                feature_columns = orfs_features.columns.difference(['orf_id', 'label', 'type', 'local'])
+                orfs_features[feature_columns] = orfs_features[feature_columns].fillna(0)
+
+            print(orfs_features.groupby(['label']).size().reset_index(name='counts'))
+
+            with measure('output_writing', rows=len(orfs_features)):
+                orfs_features.to_csv(self.orfsFeatures, index=False)
+                orfs_features.to_csv(self.orfs_features_in_train_model, index=False)
+            print("Feature extraction completed.")
+        else:
+            unknown_smorfs = pd.read_csv(self.unknown_sequences)
+            # Featurise each distinct (CDS, aa_seq, UTR flanks) once; predictions are broadcast back by orf_id
+            unique_smorfs, orf_map = collapse_identical_orfs(unknown_smorfs)
+            orf_map.to_csv(self.orfDedupMap, index=False)
+
+            # ORFs already scored by the same model in an earlier run or sample are not featurised again
+            from ..prediction.prediction_cache import PredictionCache
+            cache = PredictionCache.from_args(self.args)
+            if cache is not None:
+                unique_smorfs = cache.drop_cached(unique_smorfs)
+                cache.save_hits(self.cachedPredictions)
+                cache.report()
+                cache.close()
+
+            if len(unique_smorfs) == 0:
+                pd.DataFrame(columns=['orf_id']).to_csv(self.orfsFeatures, index=False)
+                return
+            orfs_features = self.extract_unknown_features(unique_smorfs)
+
+            with measure('output_writing', rows=len(orfs_features)):
+                orfs_features.to_csv(self.orfsFeatures, index=False)
+
+    def extract_unknown_features(self, unknown_smorfs):
+
+        """
+        Extracts the features of the ORFs to be predicted.
+
+        Args:
+            unknown_smorfs (pandas.DataFrame): Sequences with orf_id, aa_seq, cds_seq, utr_5 and utr_3 columns.
+
+        Returns:
+            pandas.DataFrame: The extracted features, one row per ORF.
+        """
+
+        unknown_smorfs['type'] = 'unknown_orfs'
+        unknown_smorfs['local'] = 'ToBePredicted'
+
+        ids = unknown_smorfs["orf_id"].values.tolist()
+        aa_seqs = unknown_smorfs['aa_seq'].values.tolist()
+        cds_seqs = unknown_smorfs['cds_seq'].values.tolist()
+        upstream_seqs = unknown_smorfs['utr_5'].tolist()
+        downstream_seqs = unknown_smorfs['utr_3'].tolist()
+        type = unknown_smorfs["type"].values.tolist()
+        local = unknown_smorfs["local"].values.tolist()
+
+        #Extract features
+        utr_length = self.args.utr_length
+        utr_length = int(utr_length)
+        k = self.args.kmer
+        k = int(k)
+
+        features_instance = FeatureExtraction(ids, type, local, aa_seqs, cds_seqs, upstream_seqs, downstream_seqs, utr_length = utr_length, k = k)
+        return features_instance.feature_extraction()
+
+    def __reuse_previous_features(self, sequences):
+
+        """
+        Looks the sequences up in the features of the training run being updated, by their feature inputs
+        (protein, CDS and UTR flanks), so that only sequences new to this run are featurised.
+
+        Args:
+            sequences (pandas.DataFrame): Combined database of this run.
+
+        Returns:
+            tuple: The reused feature rows (relabelled with this run's orf_id, type and local, and indexed like
+                sequences), or None if the previous features cannot be reused; and the sequences left to featurise.
+        """
+
+        params = {'utr_length': str(self.args.utr_length), 'kmer': str(self.args.kmer)}
+        if os.path.exists(self.previousManifest):
+            with open(self.previousManifest) as handle:
+                previous_params = json.load(handle)['stages'].get('features', {}).get('params', {})
+            if any(previous_params.get(name, value) != value for name, value in params.items()):
+                print(f"🚨 {self.previousOutdir} was featurised with {previous_params}; all sequences will be featurised again.")
+                return None, sequences
+
+        previous_sequences = pd.read_csv(self.previousCombinedDatabaseDF)
+        previous_keys = pd.DataFrame({'orf_id': previous_sequences['orf_id'], 'content_key': content_keys(previous_sequences.fillna('X'))})
+        previous_features = pd.read_csv(self.previousOrfsFeatures)
+        columns = previous_features.columns
+        previous_features = previous_features.merge(previous_keys.drop_duplicates('orf_id'), on='orf_id')
+        previous_features = previous_features.drop_duplicates('content_key').set_index('content_key')
+
+        keys = content_keys(sequences.fillna('X'))
+        cached = keys.isin(previous_features.index).values
+        reused = previous_features.loc[keys[cached].values].drop(columns=['orf_id', 'label', 'type', 'local'])
+        reused.index = sequences.index[cached]
+        reused.insert(0, 'orf_id', sequences['orf_id'].values[cached])
+        reused['label'] = sequences['local'].values[cached]
+        reused['type'] = sequences['type'].values[cached]
+        reused['local'] = sequences['local'].values[cached]
+
+        print(f"     Reusing the features of {cached.sum()} sequences from {self.previousOutdir}; {(~cached).sum()} sequences are new.")
+        return reused[columns], sequences[~cached]
@@ -0,0 +1,256 @@
+import sys
+import pandas as pd
+import numpy as np
+from joblib import Parallel, delayed
+
+from ..pipeline import PipelineStructure
+from ..converters import FeatureExtraction
+from ..utils.decoy_generator import DecoyGenerator, AMINO_ACIDS, NUCLEOTIDES, DECOY_BATCH
+
+# Longest X run told apart at either end of a UTR
+MAX_X_RUN = 24
+
+
+class NegativeSet(PipelineStructure):
+    def __init__(self, args):
+        super().__init__(args=args)
+        self.set_train_attributes()
+        self.__get_smorfs_metrics()
+        self.codonTable = self.__get_codon_table()
+        self.decoyGenerator = self.__get_decoy_generator()
+        self.insilicoSequences = []
+        self.insilicoDF = None
+        self.uniprot_smorfs_insilico = None
+
+    def __get_smorfs_metrics(self):
+
+        unknown_sequences = pd.read_csv(self.positive_and_unknown_sequences)
+        unknown_sequences = unknown_sequences.fillna('X')
+        self.unknown_sequences = unknown_sequences
+
+        # Calculate mean and standard deviation of length of utr_5
+        self.mean_5 = unknown_sequences['utr_5'].apply(len).mean()
+        self.std_5 = unknown_sequences['utr_5'].apply(len).std()
+
+        # Calculate mean and standard deviation of length of utr_3
+        self.mean_3 = unknown_sequences['utr_3'].apply(len).mean()
+        self.std_3 = unknown_sequences['utr_3'].apply(len).std()
+
+        # Calculate mean and standard deviation of length of aa
+        self.mean_aa = unknown_sequences['aa_seq'].apply(len).mean()
+        self.std_aa = unknown_sequences['aa_seq'].apply(len).std()*1.25
+        self.unknown_orfsAASeq = unknown_sequences['aa_seq'].tolist()
+        self.aaProbabilities = self.amino_acid_probabilities(self.unknown_orfsAASeq)
+
+        # Print mean and standard deviation of length of utr_5, utr_3, and aa for type 'unknown_orfs
+        print("     Here is the average length and standard deviation of your smORFs that the insilico/decoy generator is using:")
+        print("         -- Mean length of amino acid sequence: ", self.mean_aa)
+        print("         -- 1.25 Standard deviation of length of amino acid sequence: ", self.std_aa)
+
+
+    @staticmethod
+    def __get_codon_table():
+        codon_table = {'A': ['GCT', 'GCC', 'GCA', 'GCG'],
+                       'R': ['CGT', 'CGC', 'CGA', 'CGG', 'AGA', 'AGG'],
+                       'N': ['AAT', 'AAC'],
+                       'D': ['GAT', 'GAC'],
+                       'C': ['TGT', 'TGC'],
+                       'Q': ['CAA', 'CAG'],
+                       'E': ['GAA', 'GAG'],
+                       'G': ['GGT', 'GGC', 'GGA', 'GGG'],
+                       'H': ['CAT', 'CAC'],
+                       'I': ['ATT', 'ATC', 'ATA'],
+                       'L': ['TTA', 'TTG', 'CTT', 'CTC', 'CTA', 'CTG'],
+                       'K': ['AAA', 'AAG'],
+                       'M': ['ATG'],
+                       'F': ['TTT', 'TTC'],
+                       'P': ['CCT', 'CCC', 'CCA', 'CCG'],
+                       'S': ['TCT', 'TCC', 'TCA', 'TCG', 'AGT', 'AGC'],
+                       'T': ['ACT', 'ACC', 'ACA', 'ACG'],
+                       'W': ['TGG'],
+                       'Y': ['TAT', 'TAC'],
+                       'V': ['GTT', 'GTC', 'GTA', 'GTG'],
+                       '*': ['TAA', 'TAG', 'TGA']}
+        return codon_table
+
+    def __get_decoy_generator(self):
+
+        """Computes the distributions the decoys are drawn from, once, from the putative smORFs."""
+
+        utr_5_list = self.unknown_sequences['utr_5'].tolist()
+        utr_3_list = self.unknown_sequences['utr_3'].tolist()
+        return DecoyGenerator(self.aaProbabilities, self.mean_aa, self.std_aa, self.codonTable,
+                              utr_5=(self.letter_probabilities(utr_5_list, NUCLEOTIDES),
+                                     list(self.calculate_x_ending_probabilities(utr_5_list).values())),
+                              utr_3=(self.letter_probabilities(utr_3_list, NUCLEOTIDES),
+                                     list(self.calculate_x_starting_probabilities(utr_3_list).values())))
+
+    @staticmethod
+    def letter_probabilities(sequences, letters):
+
+        """
+        Args:
+            sequences (list): Sequences to count the letters in.
+            letters (list): Single-character letters, e.g. AMINO_ACIDS or NUCLEOTIDES.
+
+        Returns:
+            np.ndarray: Frequency of each letter over all the sequences, summing to 1.
+        """
+
+        counts = np.bincount(np.frombuffer(''.join(sequences).encode(), dtype=np.uint8), minlength=256)
+        counts = counts[[ord(letter) for letter in letters]]
+        return counts / counts.sum()
+
+    @staticmethod
+    def amino_acid_probabilities(protein_list):
+        return NegativeSet.letter_probabilities(protein_list, AMINO_ACIDS)
+
+    @staticmethod
+    def x_run_counts(utr_list, at_start):
+
+        """Counts the UTRs by the length of their run of X at the start or end, capped at MAX_X_RUN."""
+
+        stripped = [utr.lstrip('X') if at_start else utr.rstrip('X') for utr in utr_list]
+        runs = np.minimum([len(utr) - len(kept) for utr, kept in zip(utr_list, stripped)], MAX_X_RUN)
+        return np.bincount(np.asarray(runs, dtype=np.int64), minlength=MAX_X_RUN + 1)
+
+    def calculate_x_starting_probabilities(self, utr_list):
+        x_startings_counts = self.x_run_counts(utr_list, at_start=True)
+        total_count = x_startings_counts.sum()
+        if total_count > 0:
+            return {i: count / total_count for i, count in enumerate(x_startings_counts)}
+        else:
+            return {i: 0 for i in range(0, 25)}  # Provide a default value in case of no data
+
+    def calculate_x_ending_probabilities(self, utr_list):
+        x_endings_counts = self.x_run_counts(utr_list, at_start=False)
+        total_count = x_endings_counts.sum()
+        if total_count > 0:
+            return {i: count / total_count for i, count in enumerate(x_endings_counts)}
+        else:
+            return {i: 0 for i in range(0, 25)}  # Provide a default value in case of no data
+
+    def generate_decoys(self, n):
+
+        """
+        Generates n decoys in batches of DECOY_BATCH, across --threads worker processes. Each batch has its
+        own random stream spawned from --seed, so the decoys are identical for any number of threads.
+
+        Returns:
+            tuple: Lists of the amino acid sequences, CDS, 5' UTRs and 3' UTRs.
+        """
+
+        seed = getattr(self.args, 'seed', None)
+        seed_sequence = np.random.SeedSequence(seed)
+        if seed is None:
+            print(f"     No --seed given; rerun with --seed {seed_sequence.entropy} to reproduce these decoys.")
+        batch_sizes = [min(DECOY_BATCH, n - start) for start in range(0, n, DECOY_BATCH)]
+        batch_seeds = seed_sequence.spawn(len(batch_sizes))
+
+        threads = min(int(getattr(self.args, 'threads', 1) or 1), len(batch_sizes))
+        if threads > 1:
+            batches = Parallel(n_jobs=threads)(delayed(self.decoyGenerator.batch)(batch_seed, size)
+                                               for batch_seed, size in zip(batch_seeds, batch_sizes))
+        else:
+            batches = [self.decoyGenerator.batch(batch_seed, size) for batch_seed, size in zip(batch_seeds, batch_sizes)]
+        return tuple([sequence for batch in batches for sequence in batch[column]] for column in range(4))
+
+    def turn_two(self):
+        n_insilico_smORFs = self.args.n_insilico_smORFs = int(self.args.n_insilico_smORFs)
+        insilico_aa_seq, insilico_cds_seq, insilico_utr_5, insilico_utr_3 = self.generate_decoys(n_insilico_smORFs)
+        insilico_aa_length = [len(i) for i in insilico_aa_seq]
+
+        # Create a 'type' column
+        insilico_type = 'insilico'
+
+        # Create a 'local' column
+        insilico_local = 'insilico'
+
+        # Make a dataframe of the insilico sequences with IDs
+        insilico_df = pd.DataFrame({'orf_id': ['insilico_' + str(i) for i in range(n_insilico_smORFs)],
+                                  'type': "insilico",
+                                  'aa_seq': insilico_aa_seq,
+                                  'cds_seq': insilico_cds_seq,
+                                  'utr_5': insilico_utr_5,
+                                  'utr_3': insilico_utr_3,
+                                  'length': insilico_aa_length,
+                                  'type': insilico_type,
+                                  'local': insilico_local})
+
+        # Filter by length of aa_seq
+        insilico_df = insilico_df[insilico_df['length'] >= 9]
+        self.insilicoDF = insilico_df[insilico_df['length'] <= 150]
+
+    def reuse_decoys(self):
+
+        """
+        Takes the decoys of the training run being updated instead of generating new ones, so a retrained
+        model sees the same negative set as the model it continues from.
+        """
+
+        previous_sequences = pd.read_csv(self.previousCombinedDatabaseDF)
+        insilico_df = previous_sequences[previous_sequences['type'] == 'insilico']
+        self.insilicoDF = insilico_df[['orf_id', 'type', 'aa_seq', 'cds_seq', 'utr_5', 'utr_3', 'length', 'local']]
+        print(f"     Reusing {len(self.insilicoDF)} decoy sequences from {self.previousOutdir}.")
+
+    def combine_databases(self):
+
+        if self.args.mode == "pseudo":
+
+            # Append the insilico sequences to the smorfs dataframe
+            smorfs_insilico = pd.concat([self.unknown_sequences, self.insilicoDF], ignore_index=True)
+            print(smorfs_insilico.shape)
+
+            # Calculate length of utr_5, utr_3
+            smorfs_insilico['utr_5_length'] = smorfs_insilico['utr_5'].apply(len)
+            smorfs_insilico['utr_3_length'] = smorfs_insilico['utr_3'].apply(len)
+
+            # save to csv
+            smorfs_insilico.to_csv(self.combinedDatabaseDF,
+                index=False)
+        else:
+            self.positive_and_unknown_sequences = pd.read_csv(self.sequencesWithFunctions)
+            uniprot_smorfs_insilico = pd.concat([self.positive_and_unknown_sequences, self.insilicoDF], ignore_index=True)
+            print(uniprot_smorfs_insilico.shape)
+
+            # Calculate length of utr_5, utr_3
+            uniprot_smorfs_insilico['utr_5_length'] = uniprot_smorfs_insilico['utr_5'].apply(len)
+            uniprot_smorfs_insilico['utr_3_length'] = uniprot_smorfs_insilico['utr_3'].apply(len)
+            uniprot_smorfs_insilico['length'] = pd.to_numeric(uniprot_smorfs_insilico['length'], errors='coerce')
+
+            # save to csv
+            uniprot_smorfs_insilico.to_csv(self.combinedDatabaseDF,
+                index=False)
+            self.uniprot_smorfs_insilico = uniprot_smorfs_insilico
+
+    def reduce_protein_features(self):
+
+        # Prepare data for feature extraction
+        ids = self.uniprot_smorfs_insilico["orf_id"].values.tolist()
+        aa_seqs = self.uniprot_smorfs_insilico['aa_seq'].values.tolist()
+        cds_seqs = self.uniprot_smorfs_insilico['cds_seq'].values.tolist()
+        upstream_seqs = self.uniprot_smorfs_insilico['utr_5'].tolist()
+        downstream_seqs = self.uniprot_smorfs_insilico['utr_3'].tolist()
+        type = self.uniprot_smorfs_insilico["type"].values.tolist()
+        local = self.uniprot_smorfs_insilico["local"].values.tolist()
+
+        # Are all the lists the same length?
+        if len(ids) == len(aa_seqs) == len(cds_seqs) == len(upstream_seqs) == len(downstream_seqs) == len(type) == len(
+                local):
+            print("... " + str(len(ids)) + ".")
+        else:
+            print("You are missing either aa_seq, cds_seq, upstream_seqs, downstream_seqs, type, or local in your data. Please check your data.")
+
+        # Extract features
+        utr_length = self.args.utr_length
+        utr_length = int(utr_length)
+        k = self.args.kmer
+        k = int(k)
+        normalize = self.args.normalization
+
+        features_instance = FeatureExtraction(ids, type, local, aa_seqs, cds_seqs, upstream_seqs, downstream_seqs,
+                                              utr_length=utr_length, normalize=normalize, k=k)
+
+        orfs_features = features_instance.feature_extraction()
+        print(orfs_features.head())
+        print(orfs_features.groupby(['label']).size().reset_index(name='counts'))
@@ -1,17 +1,20 @@
 import sys
 import re
+import shutil
 import pandas as pd
 from Bio import SeqIO
 
 from ..utils import check_dir
 from ..pipeline import PipelineStructure
-from ..converters import GTFtoSeq
+from ..converters import GTFtoSeq, Regions, open_indexed_genome, split_gtf_by_orf, read_gtf, read_sequence_table
 
 
 class SequenceExtractor(PipelineStructure):
     def __init__(self, args):
         super().__init__(args)
         self.set_train_attributes()
+        # --regions / --regions_bed: only the ORFs overlapping them are extracted
+        self.regions = Regions.from_args(args)
 
     def create_positive_gtf(self):
         
@@ -46,15 +49,15 @@ class SequenceExtractor(PipelineStructure):
         # Split each element in gene_list using space character as delimiter and keep only the first part
         gene_list = [x.split(" ")[0] for x in gene_list]
         # Load GTF positive_orfs file into a pandas dataframe
-        gtf_positive_orfs = pd.read_csv(self.positiveGTF, sep="\t", header=None)
+        gtf_positive_orfs = read_gtf(self.positiveGTF)
         # Filter gtf by gene_list
-        gtf_positive_orfs = gtf_positive_orfs[gtf_positive_orfs[8].str.contains('|'.join(gene_list))]
+        gtf_positive_orfs = gtf_positive_orfs[gtf_positive_orfs['attribute'].str.contains('|'.join(gene_list))]
         # Change gene_id to gene_name
-        gtf_positive_orfs[8] = gtf_positive_orfs[8].str.replace("gene_id", "gene_name_id")
+        gtf_positive_orfs['attribute'] = gtf_positive_orfs['attribute'].str.replace("gene_id", "gene_name_id")
         # Change transcript_id to gene_id
-        gtf_positive_orfs[8] = gtf_positive_orfs[8].str.replace("transcript_id", "gene_id")
+        gtf_positive_orfs['attribute'] = gtf_positive_orfs['attribute'].str.replace("transcript_id", "gene_id")
         # Change gene_name_id to transcript_id
-        gtf_positive_orfs[8] = gtf_positive_orfs[8].str.replace("gene_name_id", "transcript_id")
+        gtf_positive_orfs['attribute'] = gtf_positive_orfs['attribute'].str.replace("gene_name_id", "transcript_id")
         # Save GTF
         gtf_positive_orfs.to_csv(self.positiveMicroproteinsGTF, sep="\t", header=False, index=False)
     
@@ -64,23 +67,71 @@ class SequenceExtractor(PipelineStructure):
         Extracts unknown sequences from the given GTF and FASTA files.
         
         """
-        unknown_orfs = GTFtoSeq(gtf_file=self.toBePredictedGTF, fasta_file=self.genome, cds_order="Last", utr_length=self.args.utr_length)
-        unknown_orfs_df = unknown_orfs.extract_sequences()
+        unknown_orfs = GTFtoSeq(gtf_file=self.toBePredictedGTF, fasta_file=self.genome, cds_order="Last", utr_length=self.args.utr_length, shard=getattr(self.args, 'shard', None), regions=self.regions)
+        unknown_orfs_df = self.__filter_unknown_sequences(unknown_orfs.extract_sequences())
+        unknown_orfs_df.to_csv(self.unknown_sequences, index=False)
+
+    def load_unknown_sequences(self):
+
+        """
+        Loads pre-extracted sequences (--sequences) as the unknown sequences, without a genome or a GTF.
+        """
+
+        unknown_orfs_df = read_sequence_table(self.args.sequences, utr_length=self.args.utr_length, shard=getattr(self.args, 'shard', None))
+        unknown_orfs_df = self.__filter_unknown_sequences(unknown_orfs_df)
+        print(f"     {len(unknown_orfs_df)} ORFs of 9 to 150 amino acids loaded from {self.args.sequences}.")
+        unknown_orfs_df.to_csv(self.unknown_sequences, index=False)
+
+    def iter_unknown_sequences(self, chunk_size):
+        
+        """
+        Extracts unknown sequences chunk by chunk, keeping every row of an ORF in the same chunk.
+
+        The putative GTF is split on disk into ORF-complete chunks and the genome is read through
+        an index, so memory is bounded by the chunk size instead of the input size. Each chunk is
+        appended to the unknown sequences CSV before it is yielded.
+
+        Args:
+            chunk_size (int): Number of ORFs per chunk.
+
+        Yields:
+            pandas.DataFrame: The filtered unknown sequences of one chunk.
+        """
+        
+        chunk_dir = f'{self.databaseDir}/gtf_chunks'
+        chunk_files = split_gtf_by_orf(self.toBePredictedGTF, chunk_size, chunk_dir, shard=getattr(self.args, 'shard', None))
+        # Every chunk reads only the bases of its ORFs through the FASTA index, whatever their chromosome order
+        genome = open_indexed_genome(self.genome)
+        write_header = True
+        try:
+            for chunk_file in chunk_files:
+                unknown_orfs = GTFtoSeq(gtf_file=chunk_file, fasta_dict=genome, cds_order="Last", utr_length=self.args.utr_length, regions=self.regions)
+                unknown_orfs_df = self.__filter_unknown_sequences(unknown_orfs.extract_sequences())
+                unknown_orfs_df.to_csv(self.unknown_sequences, index=False, mode='w' if write_header else 'a', header=write_header)
+                write_header = False
+                yield unknown_orfs_df
+        finally:
+            if hasattr(genome, 'close'):
+                genome.close()
+            shutil.rmtree(chunk_dir, ignore_errors=True)
+
+    @staticmethod
+    def __filter_unknown_sequences(unknown_orfs_df):
         unknown_orfs_df['length'] = unknown_orfs_df['aa_seq'].str.len()
         unknown_orfs_df = unknown_orfs_df[unknown_orfs_df['length'] >= 9]
         unknown_orfs_df = unknown_orfs_df[unknown_orfs_df['length'] <= 150]
         unknown_orfs_df['type'] = 'unknown_orfs'
-        unknown_orfs_df.to_csv(self.unknown_sequences, index=False)
+        return unknown_orfs_df
 
     def extract_sequences(self):
    
-        unknown_orfs = GTFtoSeq(gtf_file=self.toBePredictedGTF, fasta_file=self.genome, cds_order="Last", utr_length=self.args.utr_length)
+        unknown_orfs = GTFtoSeq(gtf_file=self.toBePredictedGTF, fasta_file=self.genome, cds_order="Last", utr_length=self.args.utr_length, regions=self.regions)
         unknown_orfs_df = unknown_orfs.extract_sequences()
         unknown_orfs_df['type'] = 'unknown_orfs'
         unknown_orfs_df["transcript_id"] = unknown_orfs_df["orf_id"]
         unknown_orfs_df.to_csv(self.unknown_sequences, index=False)
 
-        positive_orfs = GTFtoSeq(gtf_file=self.positiveMicroproteinsGTF, fasta_file=self.genome, cds_order='First', utr_length=self.args.utr_length)
+        positive_orfs = GTFtoSeq(gtf_file=self.positiveMicroproteinsGTF, fasta_file=self.genome, cds_order='First', utr_length=self.args.utr_length, regions=self.regions)
         positive_orfs_df = positive_orfs.extract_sequences()
         positive_orfs_df['type'] = 'positive_orfs'
 
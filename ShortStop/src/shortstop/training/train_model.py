@@ -1,27 +1,43 @@
+import os
+import time
+import shutil
+import warnings
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 import joblib
 import xgboost as xgb
 import tensorflow as tf
 from tensorflow.keras.models import Model, Sequential, load_model
 from tensorflow.keras.layers import Input, Dense, Concatenate, BatchNormalization, Activation, Dropout
-from tensorflow.keras.utils import to_categorical, plot_model
+from tensorflow.keras.utils import to_categorical
 from tensorflow.keras.optimizers import Adam
 from tensorflow.keras.callbacks import EarlyStopping
 from keras.wrappers.scikit_learn import KerasClassifier, KerasRegressor
 from sklearn.model_selection import train_test_split, GridSearchCV
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401  Enables HalvingGridSearchCV
+from sklearn.model_selection import HalvingGridSearchCV, ParameterGrid
 from sklearn.preprocessing import StandardScaler, label_binarize
 from sklearn.metrics import (
     confusion_matrix, precision_score, recall_score, f1_score,
     roc_curve, auc, roc_auc_score, accuracy_score
 )
-import eli5
-from eli5.sklearn import PermutationImportance
-from itertools import cycle
 from sklearn.ensemble import RandomForestClassifier
 
 from ..pipeline import PipelineStructure
+from .training_scheduler import TrainingScheduler
+from .external_memory import FeatureBlocks, BlockIter
+from ..utils import save_split, load_split, LABEL_ENCODING
+
+SEARCH_MODES = ['exhaustive', 'halving']
+# Candidates kept after each round of successive halving is 1 / HALVING_FACTOR
+HALVING_FACTOR = 3
+# Boosting rounds without improvement on the validation fold after which an XGBoost fit stops
+EARLY_STOPPING_ROUNDS = 20
+# XGBoost configuration of the external-memory path, which is too large to search: the grid's deeper trees and
+# faster learning rate, with boosting stopped early on the validation blocks
+EXTERNAL_MEMORY_PARAMS = {'objective': 'multi:softprob', 'num_class': 3, 'tree_method': 'hist', 'max_depth': 10,
+                          'learning_rate': 0.1, 'subsample': 1.0, 'colsample_bytree': 0.5, 'eval_metric': 'mlogloss'}
+EXTERNAL_MEMORY_ROUNDS = 500
 
 class TrainModel(PipelineStructure):
     def __init__(self, args):
@@ -41,6 +57,8 @@ class TrainModel(PipelineStructure):
         self.history = None
         self.best_model = None
         self.scaler = None
+        self.search = getattr(args, 'search', 'exhaustive')
+        self.seed = getattr(args, 'seed', None)
 
     def fit_transform_scaler(self, train_data):
         
@@ -65,11 +83,16 @@ class TrainModel(PipelineStructure):
         features = features[features.local != 'Unknown']
         features = features.drop(features.filter(regex='cds|local|type').columns, axis=1)
 
-        labels = pd.read_csv(self.umapDF)
+        # The labels come with the features, so training does not wait for the UMAP diagnostic
+        labels = pd.read_csv(self.orfsFeatures, usecols=['orf_id', 'local'])
         labels = labels[labels.local != 'ToBePredicted']
         labels = labels[labels.local != 'Missing']
 
         df = pd.merge(features, labels, on='orf_id')
+        # Only rows of a training class are kept, before any matrix is taken, so data and labels line up
+        df['label_encoded'] = df['local'].map(LABEL_ENCODING)
+        df = df.dropna(subset=['label_encoded'])
+        self.labels = df['label_encoded'].values
 
         self.dnaData = df.loc[:, df.columns.str.startswith(('5_prime', '3_prime', 'kozak', 'first_50'))].to_numpy()
         np.savetxt(f"{self.modelsDir}/dna_columns.txt", df.loc[:, df.columns.str.startswith(('5_prime', '3_prime', 'kozak', 'first_50'))].columns, fmt='%s')
@@ -81,11 +104,6 @@ class TrainModel(PipelineStructure):
         dna_names = df.loc[:, df.columns.str.startswith(('5_prime', '3_prime', 'kozak', 'first_50'))].columns
         aa_names = df[aa_columns].columns
         self.dna_aa_names = np.concatenate((dna_names, aa_names))
-
-        mapping = {"Random": 0, "Cytoplasm": 1, "Secreted": 2}
-        df['label_encoded'] = df['local'].map(mapping)
-        df = df.dropna(subset=['label_encoded'])  # adjust the column name as necessary
-        self.labels = df['label_encoded'].values
         print(len(self.dnaData), len(self.aaData), len(self.labels), len(self.orfIds))
 
     def a2000(self):
@@ -95,24 +113,257 @@ class TrainModel(PipelineStructure):
         transform the data using a scaler, and save the scaler object.
         """
         
+        if self.args.mode == 'retrain':
+            return self.__extend_previous_split()
+
         dna_train, self.dnaTest, aa_train, self.aaTest, self.labelTrain, self.labelTest, self.orfTrain, self.orfTest = train_test_split(
             self.dnaData, self.aaData, self.labels, self.orfIds, test_size=0.2, stratify=self.labels)
 
         train_data = np.concatenate((dna_train, aa_train), axis=1)
         
-        # Save training data
-        np.savetxt(f"{self.modelsDir}/train_data.txt", train_data)
+        # Save both sides of the split, unscaled, so they can be reloaded with load_split
+        save_split(self.modelsDir, 'train', train_data, self.orfTrain, self.labelTrain)
+        save_split(self.modelsDir, 'test', np.concatenate((self.dnaTest, self.aaTest), axis=1), self.orfTest, self.labelTest)
         
         print(f"Number of DNA features: {dna_train.shape[1]}")
         print(f"Number of AA features: {aa_train.shape[1]}")
         self.data = self.fit_transform_scaler(train_data)
         joblib.dump(self.scaler, f"{self.modelsDir}/scaler.save")
 
+    def __extend_previous_split(self):
+
+        """
+        Split for retraining: the ORFs the previous model was trained on stay in training and its test ORFs
+        stay held out, so both models can be compared on ORFs neither was fitted on. ORFs new to this run are
+        split 80/20. The previous scaler is kept, so the new trees see features on the scale of the old ones.
+        """
+
+        for columns_file in ('dna_columns.txt', 'aa_columns.txt'):
+            with open(f"{self.previousModelsDir}/{columns_file}") as previous, open(f"{self.modelsDir}/{columns_file}") as current:
+                if previous.read() != current.read():
+                    raise ValueError(f"🚨 The features of this run differ from {self.previousModelsDir}/{columns_file}; "
+                                     "the previous model cannot be retrained on them.")
+
+        labels = self.labels.astype(int)
+        orf_ids = self.orfIds.astype(str)
+        _, previous_train_ids, _ = load_split(self.previousModelsDir, 'train')
+        _, self.previousTestIds, _ = load_split(self.previousModelsDir, 'test')
+        in_test = np.isin(orf_ids, self.previousTestIds)
+        new = np.flatnonzero(~in_test & ~np.isin(orf_ids, previous_train_ids))
+
+        new_test = np.array([], dtype=int)
+        if len(new) >= 5:
+            _, class_counts = np.unique(labels[new], return_counts=True)
+            stratify = labels[new] if class_counts.min() >= 2 else None
+            _, new_test = train_test_split(new, test_size=0.2, stratify=stratify, random_state=self.seed)
+        test = np.isin(np.arange(len(labels)), new_test) | in_test
+        print(f"     {len(new)} ORFs are new to this run, {len(new_test)} of them held out for testing.")
+
+        dna_train, self.dnaTest = self.dnaData[~test], self.dnaData[test]
+        aa_train, self.aaTest = self.aaData[~test], self.aaData[test]
+        self.labelTrain, self.labelTest = labels[~test], labels[test]
+        self.orfTrain, self.orfTest = self.orfIds[~test], self.orfIds[test]
+
+        train_data = np.concatenate((dna_train, aa_train), axis=1)
+        save_split(self.modelsDir, 'train', train_data, self.orfTrain, self.labelTrain)
+        save_split(self.modelsDir, 'test', np.concatenate((self.dnaTest, self.aaTest), axis=1), self.orfTest, self.labelTest)
+
+        self.scaler = joblib.load(f"{self.previousModelsDir}/scaler.save")
+        self.data = self.transform_data(train_data)
+        joblib.dump(self.scaler, f"{self.modelsDir}/scaler.save")
+
+    def retrain_xgb(self):
+
+        """
+        Continues boosting the XGBoost model of the previous run on the extended training set, with its
+        hyperparameters, for --boost_rounds more rounds, then compares both models on the test set.
+        """
+
+        previous_model = xgb.XGBClassifier()
+        previous_model.load_model(f"{self.previousModelsDir}/best_xgb_model.model")
+        booster = previous_model.get_booster()
+        best_iteration = getattr(previous_model, 'best_iteration', None)
+        if best_iteration is not None:
+            # Trees grown after the early-stopping optimum are not part of the model that was selected
+            booster = booster[:best_iteration + 1]
+
+        params = previous_model.get_params()
+        params.update(n_estimators=int(self.args.boost_rounds), n_jobs=int(self.args.threads), early_stopping_rounds=None)
+        self.xgb_best_model = xgb.XGBClassifier(**params)
+
+        start = time.time()
+        self.xgb_best_model.fit(self.data, self.labelTrain, xgb_model=booster)
+        print(f"     Boosted {self.args.boost_rounds} rounds on {len(self.labelTrain)} ORFs in {time.time() - start:.1f} s.")
+        self.xgb_best_model.save_model(f"{self.modelsDir}/best_xgb_model.model")
+
+        self.__compare_retrained(previous_model)
+
+    def __compare_retrained(self, previous_model):
+
+        """
+        Writes the macro ROC AUC, accuracy and macro F1 of the previous and retrained XGBoost models on the
+        test set, and on the test ORFs of the previous run alone, to retrain_comparison.csv.
+        """
+
+        test_data = self.transform_data(np.concatenate((self.dnaTest, self.aaTest), axis=1))
+        test_sets = {'all': np.ones(len(self.labelTest), dtype=bool),
+                     'previous_test': np.isin(self.orfTest.astype(str), self.previousTestIds)}
+
+        rows = []
+        for model_name, model in [('previous', previous_model), ('retrained', self.xgb_best_model)]:
+            probs = model.predict_proba(test_data)
+            for test_set, rows_mask in test_sets.items():
+                labels, set_probs = self.labelTest[rows_mask], probs[rows_mask]
+                if len(labels) == 0:
+                    continue
+                predicted = set_probs.argmax(axis=1)
+                roc_auc = roc_auc_score(labels, set_probs, multi_class='ovr', average='macro', labels=[0, 1, 2]) if len(np.unique(labels)) == 3 else np.nan
+                rows.append({'model': model_name, 'test_set': test_set, 'n_orfs': len(labels), 'roc_auc': roc_auc,
+                             'accuracy': accuracy_score(labels, predicted),
+                             'f1_macro': f1_score(labels, predicted, average='macro')})
+
+        comparison = pd.DataFrame(rows)
+        comparison.to_csv(f"{self.modelsDir}/retrain_comparison.csv", index=False)
+        print(comparison.to_string(index=False))
+
+    def train_external_memory(self):
+
+        """
+        Trains the XGBoost model without loading the feature table into memory. The table is streamed once into
+        on-disk blocks of each split while the scaler is fitted, and XGBoost builds its hist trees from
+        external-memory matrices fed block by block. Replaces clean_data, a2000, tune_hyperparameters and test_model.
+        """
+
+        blocks = FeatureBlocks(f"{self.modelsDir}/feature_blocks", block_rows=self.args.block_rows, seed=self.seed)
+        self.scaler = blocks.write(self.orfsFeatures)
+        joblib.dump(self.scaler, f"{self.modelsDir}/scaler.save")
+        np.savetxt(f"{self.modelsDir}/dna_columns.txt", blocks.dnaColumns, fmt='%s')
+        np.savetxt(f"{self.modelsDir}/aa_columns.txt", blocks.aaColumns, fmt='%s')
+        self.dna_aa_names = np.array(blocks.dnaColumns + blocks.aaColumns)
+        print(f"Number of DNA features: {len(blocks.dnaColumns)}")
+        print(f"Number of AA features: {len(blocks.aaColumns)}")
+
+        cache_dir = f"{self.modelsDir}/feature_blocks/cache"
+        os.makedirs(cache_dir, exist_ok=True)
+        train_matrix = xgb.DMatrix(BlockIter(blocks.blocks('train'), self.scaler, f"{cache_dir}/train"))
+        validation_matrix = xgb.DMatrix(BlockIter(blocks.blocks('validation'), self.scaler, f"{cache_dir}/validation"))
+
+        params = dict(EXTERNAL_MEMORY_PARAMS, nthread=int(self.args.threads))
+        if self.seed is not None:
+            params['seed'] = self.seed
+        start = time.time()
+        booster = xgb.train(params, train_matrix, num_boost_round=EXTERNAL_MEMORY_ROUNDS,
+                            evals=[(validation_matrix, 'validation')], early_stopping_rounds=EARLY_STOPPING_ROUNDS,
+                            verbose_eval=False)
+        print(f"XGBoost - {booster.best_iteration + 1} rounds kept, trained in {time.time() - start:.1f} s")
+        del train_matrix, validation_matrix
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+        # Saved with the scikit-learn metadata that predict mode and feature_importance load the model with
+        self.best_model_path = f"{self.modelsDir}/best_xgb_model.model"
+        booster.save_model(self.best_model_path)
+        self.xgb_best_model = xgb.XGBClassifier()
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', UserWarning)
+            self.xgb_best_model.load_model(self.best_model_path)
+        self.xgb_best_model.n_classes_ = 3
+        self.xgb_best_model.classes_ = np.arange(3)
+        self.xgb_best_model.save_model(self.best_model_path)
+
+        # The test blocks are scored one at a time; only their probabilities are kept in memory
+        probs, labels = [], []
+        for data_file, labels_file, _ in blocks.blocks('test'):
+            test_matrix = xgb.DMatrix(self.scaler.transform(np.load(data_file)))
+            probs.append(booster.predict(test_matrix, iteration_range=(0, booster.best_iteration + 1)))
+            labels.append(np.load(labels_file))
+        probs, labels = np.concatenate(probs), np.concatenate(labels)
+        predictions = probs.argmax(axis=1)
+
+        xgb_macro_auc = roc_auc_score(labels, probs, multi_class='ovr', average='macro', labels=[0, 1, 2]) if len(np.unique(labels)) == 3 else np.nan
+        print(f'XGBoost Macro-Average ROC AUC: {xgb_macro_auc}')
+        pd.DataFrame({'model': ['xgboost'], 'macro_auc': [xgb_macro_auc]}).to_csv(f"{self.modelsDir}/macro_auc.csv", index=False)
+        pd.DataFrame(confusion_matrix(labels, predictions)).to_csv(f"{self.modelsDir}/confusion_matrix.csv", index=False)
+        metrics_df = pd.DataFrame({'f1': [f1_score(labels, predictions, average='macro')],
+                                   'precision': [precision_score(labels, predictions, average='macro')],
+                                   'recall': [recall_score(labels, predictions, average='macro')],
+                                   'accuracy': [accuracy_score(labels, predictions)]})
+        metrics_df.to_csv(f"{self.modelsDir}/metrics.csv", index=False)
+
+    def search_hyperparameters(self, name, estimator, param_grid, data, labels, resource='n_samples', fit_params=None, n_jobs=-1):
+
+        """
+        Searches param_grid with 3-fold CV, exhaustively with GridSearchCV or by successive halving, where every
+        round gives the best 1/HALVING_FACTOR of the candidates HALVING_FACTOR times more of the resource.
+        The wall time of the search and the fit time and score of every configuration are logged, the latter
+        to <models>/<name>_search_results.csv.
+
+        Args:
+            name (str): Short model name used in the log and file names.
+            estimator: scikit-learn compatible estimator.
+            param_grid (dict): Hyperparameters to search.
+            data (np.ndarray): Training data.
+            labels (np.ndarray): Training labels.
+            resource (str): What halving allocates: 'n_samples', or an estimator parameter such as 'n_estimators'.
+                That parameter is then taken out of the grid and its largest value used as the maximum resource.
+            fit_params (dict): Extra arguments of the estimator's fit.
+            n_jobs (int): Number of fits run in parallel.
+
+        Returns:
+            The fitted search, refit on all of data with the best parameters.
+        """
+
+        exhaustive_fits = len(ParameterGrid(param_grid)) * 3
+        param_grid = dict(param_grid)
+        if self.search == 'halving':
+            search_kwargs = {'factor': HALVING_FACTOR, 'min_resources': 'exhaust', 'random_state': self.seed}
+            if resource != 'n_samples':
+                search_kwargs['max_resources'] = max(param_grid.pop(resource))
+            grid = HalvingGridSearchCV(estimator=estimator, param_grid=param_grid, resource=resource, n_jobs=n_jobs, cv=3, **search_kwargs)
+        else:
+            grid = GridSearchCV(estimator=estimator, param_grid=param_grid, n_jobs=n_jobs, cv=3)
+
+        start = time.perf_counter()
+        grid.fit(data, labels, **(fit_params or {}))
+        elapsed = time.perf_counter() - start
+
+        results = pd.DataFrame(grid.cv_results_)
+        columns = [column for column in ('iter', 'n_resources') if column in results] + ['params', 'mean_fit_time', 'mean_score_time', 'mean_test_score', 'rank_test_score']
+        results[columns].to_csv(f"{self.modelsDir}/{name}_search_results.csv", index=False)
+        print(f"     {name} {self.search} search: {len(results) * grid.n_splits_} fits in {elapsed:.1f} s, slowest configuration "
+              f"{results['mean_fit_time'].max():.1f} s per fit (the exhaustive grid is {exhaustive_fits} fits at full size)")
+        return grid
+
     def tune_hyperparameters(self):
         
         """
-        Train a neural network and tune hyperparameters using GridSearchCV.
+        Train a neural network, XGBoost and a random forest, tuning their hyperparameters with exhaustive grid
+        search or successive halving (--search). The three searches share the --threads cores through a
+        TrainingScheduler, and run concurrently when there are enough of them.
         """
+
+        search_start = time.perf_counter()
+
+        # CV workers read the scaled training matrix from a memory-mapped file instead of each receiving a pickled copy
+        shared_data_file = f"{self.modelsDir}/.scaled_train_data.npy"
+        np.save(shared_data_file, self.data)
+        data = np.load(shared_data_file, mmap_mode='r')
+        scheduler = TrainingScheduler(getattr(self.args, 'threads', 1), ['nn', 'xgb', 'rf'])
+        try:
+            grids = scheduler.run({
+                'nn': lambda cv_jobs, estimator_threads: self.__search_nn(data, cv_jobs),
+                'xgb': lambda cv_jobs, estimator_threads: self.__search_xgb(data, cv_jobs, estimator_threads),
+                'rf': lambda cv_jobs, estimator_threads: self.__search_rf(data, cv_jobs, estimator_threads),
+            })
+        finally:
+            del data
+            os.remove(shared_data_file)
+
+        self.__save_nn(grids['nn'])
+        self.__save_xgb(grids['xgb'])
+        self.__save_rf(grids['rf'])
+        print(f"     Hyperparameter search ({self.search}) took {time.perf_counter() - search_start:.1f} s in total.")
+
+    def __search_nn(self, data, n_jobs):
         
         # Define the model and the hyperparameters to tune
         def create_model(data_shape):
@@ -127,7 +378,7 @@ class TrainModel(PipelineStructure):
                 return model
             return model_fn
 
-        model = KerasClassifier(build_fn=create_model(self.data.shape[1]), verbose=0)
+        model = KerasClassifier(build_fn=create_model(data.shape[1]), verbose=0)
         param_grid = {
             'nodes_layer_one': [256, 512],
             'nodes_layer_two': [0],
@@ -140,9 +391,10 @@ class TrainModel(PipelineStructure):
         }
         
         # Tune hyperparameters
-        grid = GridSearchCV(estimator=model, param_grid=param_grid, n_jobs=-1, cv=3)
         labels_encoded = to_categorical(self.labelTrain)
-        grid_result_nn = grid.fit(self.data, labels_encoded)
+        return self.search_hyperparameters('nn', model, param_grid, data, labels_encoded, n_jobs=n_jobs)
+
+    def __save_nn(self, grid_result_nn):
         
         # Get the best model
         nn_best_score = grid_result_nn.best_score_
@@ -154,34 +406,29 @@ class TrainModel(PipelineStructure):
         self.history = pd.DataFrame(nn_best_model.history.history)
         self.history.to_csv(f"{self.modelsDir}/model_history.csv", index=False)
 
-        # Plot the model architecture
-        self.modelArchitecturePlot = f"{self.plotsDir}/nnet_model_architecture.png"
-        plot_model(nn_best_model, show_shapes=True, to_file=self.modelArchitecturePlot)
-
-        # Plot the training metrics
-        self.modelAccuracyPlot = f"{self.plotsDir}/nnet_model_accuracy.png"
-        plt.clf()
-        plt.plot(self.history['accuracy'], label='train accuracy')
-        plt.plot(self.history['val_accuracy'], label='val accuracy')
-        plt.plot(self.history['loss'], label='train loss')
-        plt.plot(self.history['val_loss'], label='val loss')
-        plt.title('Model accuracy and loss')
-        plt.xlabel('Epoch')
-        plt.ylabel('Accuracy/Loss')
-        plt.legend(loc='best')
-        plt.savefig(self.modelAccuracyPlot, dpi=300)
-        
         # Save nn_best_model
         nn_best_model.save(f"{self.modelsDir}/best_nn_model.h5")
         self.nn_best_model = nn_best_model
-        
+
+    def __search_xgb(self, data, n_jobs, estimator_threads):
         
         """
         Tune a XGBoost model using GridSearchCV 
         """
         
         # Define the model and the hyperparameters to tune
-        xgb_model = xgb.XGBClassifier(objective='multi:softprob', num_class=3, use_label_encoder=False)
+        if self.search == 'halving':
+            # Trees are the resource; each fit also stops early on a validation fold held out of the search
+            data, val_data, labels, val_labels = train_test_split(data, self.labelTrain, test_size=0.1,
+                                                                  stratify=self.labelTrain, random_state=self.seed)
+            xgb_model = xgb.XGBClassifier(objective='multi:softprob', num_class=3, use_label_encoder=False,
+                                          early_stopping_rounds=EARLY_STOPPING_ROUNDS, n_jobs=estimator_threads)
+            fit_params = {'eval_set': [(val_data, val_labels)], 'verbose': False}
+        else:
+            labels = self.labelTrain
+            xgb_model = xgb.XGBClassifier(objective='multi:softprob', num_class=3, use_label_encoder=False,
+                                          n_jobs=estimator_threads)
+            fit_params = None
         
         param_grid = {
         'n_estimators': [250, 500],
@@ -192,8 +439,10 @@ class TrainModel(PipelineStructure):
         }
 
         # Tune hyperparameters
-        grid = GridSearchCV(estimator=xgb_model, param_grid=param_grid, n_jobs=-1, cv=3)
-        grid_result_xgb = grid.fit(self.data, self.labelTrain)
+        return self.search_hyperparameters('xgb', xgb_model, param_grid, data, labels, resource='n_estimators',
+                                           fit_params=fit_params, n_jobs=n_jobs)
+
+    def __save_xgb(self, grid_result_xgb):
         
         # Get the best model
         xgb_best_score = grid_result_xgb.best_score_
@@ -204,12 +453,14 @@ class TrainModel(PipelineStructure):
         # Save best XGB model
         xgb_best_model.save_model(f"{self.modelsDir}/best_xgb_model.model")
         self.xgb_best_model = xgb_best_model 
+
+    def __search_rf(self, data, n_jobs, estimator_threads):
         
         """
         Tune a Random Forest using GridSearchCV 
         """
         
-        rf_model = RandomForestClassifier()
+        rf_model = RandomForestClassifier(n_jobs=estimator_threads)
         
         param_grid = {
             'n_estimators': [100, 250],
@@ -219,8 +470,9 @@ class TrainModel(PipelineStructure):
             'bootstrap': [True]
         }
         
-        grid = GridSearchCV(estimator=rf_model, param_grid=param_grid, n_jobs=-1, cv=3)
-        grid_result_rf = grid.fit(self.data, self.labelTrain)
+        return self.search_hyperparameters('rf', rf_model, param_grid, data, self.labelTrain, resource='n_estimators', n_jobs=n_jobs)
+
+    def __save_rf(self, grid_result_rf):
         
         # Get the best model
         rf_best_score = grid_result_rf.best_score_
@@ -239,9 +491,6 @@ class TrainModel(PipelineStructure):
         test_data = np.concatenate((self.dnaTest, self.aaTest), axis=1)
         test_data = self.transform_data(test_data)
         self.test_data = test_data
-        
-        # Save test data
-        np.savetxt(f"{self.modelsDir}/test_data.txt", test_data)
 
         # Binarize the labels for multi-class ROC curve
         n_classes = 3
@@ -262,24 +511,19 @@ class TrainModel(PipelineStructure):
         xgb_data = {}
         rf_data = {}
 
-        plt.figure()
-        colors = cycle(['aqua', 'darkorange', 'cornflowerblue'])
-        for i, color in zip(range(n_classes), colors):
+        for i in range(n_classes):
             fpr, tpr, _ = roc_curve(self.labelTest[:, i], nn_probs[:, i])
             nn_auc.append(auc(fpr, tpr))
             nn_data[f'Class_{i}'] = {'fpr': fpr, 'tpr': tpr}
-            plt.plot(fpr, tpr, color=color, linestyle='-', label=f'NN Class {i} (AUC = {nn_auc[-1]:0.2f})')
         
 
             fpr, tpr, _ = roc_curve(self.labelTest[:, i], xgb_probs[:, i])
             xgb_auc.append(auc(fpr, tpr))
             xgb_data[f'Class_{i}'] = {'fpr': fpr, 'tpr': tpr}
-            plt.plot(fpr, tpr, color=color, linestyle='--', label=f'XGB Class {i} (AUC = {xgb_auc[-1]:0.2f})')
 
             fpr, tpr, _ = roc_curve(self.labelTest[:, i], rf_probs[:, i]) 
             rf_auc.append(auc(fpr, tpr))
             rf_data[f'Class_{i}'] = {'fpr': fpr, 'tpr': tpr}
-            plt.plot(fpr, tpr, color=color, linestyle=':', label=f'RF Class {i} (AUC = {rf_auc[-1]:0.2f})')
 
        # Function to save raw data to CSV file
         def save_roc_data(clf_name, clf_data):
@@ -327,16 +571,6 @@ class TrainModel(PipelineStructure):
         print(f'The best model is: {best_model_path}')
         
         
-        # Plot the ROC curve
-        plt.plot([0, 1], [0, 1], 'k--', lw=2)
-        plt.xlim([0.0, 1.0])
-        plt.ylim([0.0, 1.05])
-        plt.xlabel('False Positive Rate')
-        plt.ylabel('True Positive Rate')
-        plt.title('Multi-class ROC Comparison')
-        plt.legend(loc="lower right")
-        plt.savefig(f"{self.plotsDir}/roc_curve_comparison.png", dpi=300)
-        
         # Get F1 score, precision, recall, and accuracy
         if best_model_path.endswith('.model'):
             model = xgb.XGBClassifier()
@@ -375,15 +609,6 @@ class TrainModel(PipelineStructure):
             feature_importances = pd.DataFrame(importances, index=feature_names, columns=['importance'])
             feature_importances = feature_importances.sort_values(by='importance', ascending=False)
             feature_importances.to_csv(f"{self.modelsDir}/xgb_feature_importances.csv")
-            # Plot the first 20 features
-            plt.figure()
-            plt.bar(feature_importances.index[:20], feature_importances['importance'][:20])
-            plt.xticks(rotation=90)
-            plt.title('XGBoost Feature Importance')
-            plt.xlabel('Feature')
-            plt.ylabel('Importance')
-            plt.tight_layout()
-            plt.savefig(f"{self.plotsDir}/xgb_feature_importance.png", dpi=300)
             
         else:
             model = joblib.load(self.best_model_path)
@@ -392,12 +617,27 @@ class TrainModel(PipelineStructure):
             feature_importances = pd.DataFrame(importances, index=feature_names, columns=['importance'])
             feature_importances = feature_importances.sort_values(by='importance', ascending=False)
             feature_importances.to_csv(f"{self.modelsDir}/rf_feature_importances.csv")
-            # Plot the first 20 features
-            plt.figure()
-            plt.bar(feature_importances.index[:20], feature_importances['importance'][:20])
-            plt.xticks(rotation=90)
-            plt.title('Random Forest Feature Importance')
-            plt.xlabel('Feature')
-            plt.ylabel('Importance')
-            plt.tight_layout()
-            plt.savefig(f"{self.plotsDir}/rf_feature_importance.png", dpi=300)
\ No newline at end of file
+
+    def train_first_tier(self):
+
+        """
+        Trains the first tier of the cascade predictor (predict --cascade) on the cheap features of the
+        training split, next to the full model, and prints its accuracy on the test split. External-memory
+        runs read the split from their feature blocks.
+        """
+
+        from ..prediction.cascade import FIRST_TIER_MODEL, first_tier_features, train_first_tier
+        sequences = pd.read_csv(self.combinedDatabaseDF, usecols=['orf_id', 'aa_seq', 'cds_seq', 'utr_5'])
+        sequences = sequences.drop_duplicates('orf_id').set_index('orf_id', drop=False)
+        if getattr(self.args, 'external_memory', False):
+            blocks = FeatureBlocks(f"{self.modelsDir}/feature_blocks")
+            train_ids, train_labels = blocks.ids_and_labels('train')
+            test_ids, test_labels = blocks.ids_and_labels('test')
+        else:
+            _, train_ids, train_labels = load_split(self.modelsDir, 'train')
+            _, test_ids, test_labels = load_split(self.modelsDir, 'test')
+
+        classifier = train_first_tier(sequences.loc[train_ids], train_labels, f"{self.modelsDir}/{FIRST_TIER_MODEL}",
+                                      seed=self.seed, threads=self.args.threads)
+        predictions = classifier.predict(first_tier_features(sequences.loc[test_ids]).to_numpy())
+        print(f"     First-tier model accuracy on the test set: {accuracy_score(test_labels, predictions):.3f}")
@@ -0,0 +1,113 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from joblib import parallel_backend
+
+from ..utils import RUN_REPORT
+
+# Parallel backend of the CV fits of each model family. XGBoost and scikit-learn forests release the GIL,
+# so their fits run in threads that share the training matrix; Keras/TensorFlow fits need their own processes.
+FAMILY_BACKENDS = {'nn': 'loky', 'xgb': 'threading', 'rf': 'threading'}
+# Share of the cores each family gets when they are tuned concurrently; XGBoost has the most expensive grid
+FAMILY_WEIGHTS = {'nn': 1, 'xgb': 2, 'rf': 1}
+# Folds of the cross-validation, the number of fits that always run side by side when the cores allow it
+CV_FOLDS = 3
+
+
+class TrainingScheduler:
+    """
+    Splits a budget of cores between the model families being tuned and, within each family, between
+    parallel CV fits and the threads of each estimator, so that their product never exceeds the budget.
+
+    With fewer cores than families, the families are tuned one after another with the whole budget.
+    Otherwise they are tuned concurrently, each with its share of the cores.
+    """
+
+    def __init__(self, threads, families):
+
+        """
+        Args:
+            threads (int): Number of cores to use in total.
+            families (list): Model families to tune, keys of FAMILY_BACKENDS.
+        """
+
+        self.threads = max(1, int(threads or 1))
+        self.families = list(families)
+        self.concurrent = len(self.families) > 1 and self.threads >= len(self.families)
+        self.plan = {family: self.__split(budget) for family, budget in self.__budgets().items()}
+        self.wallTimes = {}
+
+    def __budgets(self):
+        if not self.concurrent:
+            return {family: self.threads for family in self.families}
+        weights = [FAMILY_WEIGHTS.get(family, 1) for family in self.families]
+        budgets = {family: max(1, self.threads * weight // sum(weights)) for family, weight in zip(self.families, weights)}
+        # Cores lost to rounding go to the family with the largest share
+        largest = max(self.families, key=lambda family: FAMILY_WEIGHTS.get(family, 1))
+        budgets[largest] += self.threads - sum(budgets.values())
+        return budgets
+
+    @staticmethod
+    def __split(budget):
+
+        """
+        Returns (parallel CV fits, threads per estimator) for a budget of cores: estimators get the cores
+        left over once every fold can run at once, and the remainder runs more candidate fits side by side.
+        """
+
+        estimator_threads = max(1, budget // CV_FOLDS)
+        return budget // estimator_threads, estimator_threads
+
+    def describe(self):
+        mode = 'concurrently' if self.concurrent else 'one after another'
+        allocations = ', '.join(f'{family}: {cv_jobs} CV fits x {estimator_threads} threads'
+                                for family, (cv_jobs, estimator_threads) in self.plan.items())
+        return f"Tuning {', '.join(self.families)} {mode} on {self.threads} cores ({allocations})"
+
+    def run(self, tasks):
+
+        """
+        Runs the search of each family with its share of the cores.
+
+        Args:
+            tasks (dict): Family -> callable taking (cv_jobs, estimator_threads) and returning the fitted search.
+
+        Returns:
+            dict: Family -> the value returned by its task.
+        """
+
+        print(f"     {self.describe()}")
+        if self.concurrent:
+            with ThreadPoolExecutor(max_workers=len(tasks)) as executor:
+                futures = {family: executor.submit(self.__run_family, family, task) for family, task in tasks.items()}
+                results = {family: future.result() for family, future in futures.items()}
+        else:
+            results = {family: self.__run_family(family, task) for family, task in tasks.items()}
+
+        for family in tasks:
+            print(f"     {family} search wall time: {self.wallTimes[family]:.1f} s")
+        return results
+
+    def __run_family(self, family, task):
+        cv_jobs, estimator_threads = self.plan[family]
+        backend = FAMILY_BACKENDS.get(family, 'loky')
+        backend_kwargs = {'inner_max_num_threads': estimator_threads} if backend == 'loky' else {}
+        # Read by TensorFlow when the worker processes start, which inherit them from this process; restored
+        # afterwards so that they do not apply to TensorFlow in this process (e.g. predictions, UMAP)
+        tf_threads = {'TF_NUM_INTRAOP_THREADS': str(estimator_threads), 'TF_NUM_INTEROP_THREADS': '1'} if backend == 'loky' else {}
+        previous_env = {name: os.environ.get(name) for name in tf_threads}
+        os.environ.update(tf_threads)
+
+        start = time.perf_counter()
+        try:
+            with parallel_backend(backend, n_jobs=cv_jobs, **backend_kwargs):
+                result = task(cv_jobs, estimator_threads)
+        finally:
+            for name, value in previous_env.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+        self.wallTimes[family] = time.perf_counter() - start
+        RUN_REPORT.add(f'{family}_search', self.wallTimes[family])
+        return result
@@ -1,9 +1,9 @@
 import time
 from collections import Counter
+import numpy as np
 import pandas as pd
 from sklearn.preprocessing import StandardScaler
-import plotly.express as px
-import matplotlib.pyplot as plt
+from sklearn.decomposition import PCA
 import umap
 
 from ..pipeline import PipelineStructure
@@ -19,7 +19,11 @@ class UMAPVisualizer(PipelineStructure):
     def reduce_features(self):
         
             """
-            Reduces the features using UMAP algorithm and stores the reduced features in self.reducedFeatures.
+            Reduces the features to 3 UMAP components and stores them in self.reducedFeatures.
+
+            UMAP is fitted on a subsample of at most --umap_sample ORFs, stratified by label, optionally after a
+            PCA pre-reduction to --umap_pca components; every other ORF is then projected onto the fitted
+            embedding with transform, --umap_batch ORFs at a time.
             """
             
             features = pd.read_csv(self.orfsFeatures)
@@ -36,11 +40,29 @@ class UMAPVisualizer(PipelineStructure):
             features = features.loc[:, ~features.columns.str.startswith('cds')]
 
             scaler = StandardScaler()
-            scaled_features = scaler.fit_transform(features)
+            scaled_features = scaler.fit_transform(features.to_numpy(dtype=np.float32))
 
             time_start = time.time()
-            umap_model = umap.UMAP(n_components=3, n_neighbors= 100)  # Specify the desired number of components as 3 for 3D
-            umap_result = umap_model.fit_transform(scaled_features)
+            sample = self.__stratified_sample(local.values, int(self.args.umap_sample))
+            n_components = min(int(self.args.umap_pca), *scaled_features.shape) if self.args.umap_pca else 0
+            if n_components:
+                pca = PCA(n_components=n_components, random_state=self.args.seed).fit(scaled_features[sample])
+                print(f"     PCA to {n_components} components keeps {pca.explained_variance_ratio_.sum():.0%} of the variance.")
+                reduce = pca.transform
+            else:
+                reduce = lambda rows: rows
+
+            # Specify the desired number of components as 3 for 3D
+            umap_model = umap.UMAP(n_components=3, n_neighbors=min(100, len(sample) - 1), random_state=self.args.seed)
+            umap_result = np.empty((len(scaled_features), 3), dtype=np.float32)
+            umap_result[sample] = umap_model.fit_transform(reduce(scaled_features[sample]))
+
+            projected = np.setdiff1d(np.arange(len(scaled_features)), sample)
+            batch = int(self.args.umap_batch)
+            for start in range(0, len(projected), batch):
+                rows = projected[start:start + batch]
+                umap_result[rows] = umap_model.transform(reduce(scaled_features[rows]))
+            print(f"     UMAP fitted on {len(sample)} ORFs, {len(projected)} more projected onto the embedding.")
 
             reduced_features = pd.DataFrame(umap_result)
             reduced_features['orf_id'] = orf_id
@@ -53,13 +75,22 @@ class UMAPVisualizer(PipelineStructure):
 
             print(f"UMAP took {time.time() - time_start:.2f} seconds")
 
-    def plot_3d_scatter(self):
-        fig = px.scatter_3d(self.reducedFeatures, x="umap_0", y="umap_1", z="umap_2", color="local",
-                            color_discrete_map={"Cytoplasm": "yellow", "Secreted": "blue", "Random": "black",
-                                                "ToBePredicted": "red"})
-        fig.update_traces(marker={'size': 3, 'opacity': 1})
-        fig.update_layout(hovermode="y")
-        fig.write_html(self.umapHtml, include_plotlyjs=True, full_html=True)
+    def __stratified_sample(self, labels, max_rows):
+
+        """
+        Returns the sorted positions of at most max_rows rows, each label keeping its share of the rows and at
+        least one row. All rows are returned when there are no more than max_rows.
+        """
+
+        if len(labels) <= max_rows:
+            return np.arange(len(labels))
+        rng = np.random.default_rng(self.args.seed)
+        classes, inverse, counts = np.unique(labels, return_inverse=True, return_counts=True)
+        sample = []
+        for n, count in enumerate(counts):
+            rows = np.flatnonzero(inverse == n)
+            sample.append(rng.choice(rows, size=max(1, round(max_rows * count / len(labels))), replace=False))
+        return np.sort(np.concatenate(sample))
 
     def create_original_data_frame(self):
         df = self.reducedFeatures
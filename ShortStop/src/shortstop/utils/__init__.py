@@ -1 +1,6 @@
 from .dirtools import check_dir, check_multi_dirs
+from .orf_dedup import collapse_identical_orfs, broadcast_to_orfs
+from .instrumentation import RUN_REPORT, measure
+from .progress import PROGRESS, PROGRESS_BATCH
+from .decoy_generator import DecoyGenerator
+from .training_split import save_split, load_split, LABEL_ENCODING
@@ -0,0 +1,138 @@
+import numpy as np
+
+AMINO_ACIDS = ['A', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'K', 'L', 'M', 'N', 'P', 'Q', 'R', 'S', 'T', 'V', 'W', 'Y']
+NUCLEOTIDES = ['A', 'C', 'G', 'T']
+
+# Decoys are generated in batches of this size, each from its own random stream, so the decoys only
+# depend on the seed and never on how the batches are spread over workers
+DECOY_BATCH = 10000
+
+
+class DecoyGenerator:
+    """
+    Draws decoy smORFs (protein, CDS and UTRs) from distributions fitted to the putative smORFs.
+
+    Holds only the distributions, so it is cheap to send to worker processes. batch() derives all
+    of its randomness from the SeedSequence it is given.
+    """
+
+    def __init__(self, aa_probabilities, mean_aa, std_aa, codon_table, utr_5, utr_3, utr_length=25):
+
+        """
+        Args:
+            aa_probabilities (np.ndarray): Frequency of each of AMINO_ACIDS.
+            mean_aa (float): Mean protein length.
+            std_aa (float): Standard deviation of the protein length.
+            codon_table (dict): Codons of each amino acid.
+            utr_5 (tuple): Nucleotide frequencies and X-run length frequencies (X at the end) of the 5' UTRs.
+            utr_3 (tuple): Nucleotide frequencies and X-run length frequencies (X at the start) of the 3' UTRs.
+            utr_length (int): Length of the decoy UTRs.
+        """
+
+        self.aaProbabilities = aa_probabilities
+        self.meanAA = mean_aa
+        self.stdAA = std_aa
+        self.utr5 = utr_5
+        self.utr3 = utr_3
+        self.utrLength = utr_length
+
+        # NumPy form of the codon table: the codons of each amino acid indexed by its byte value
+        self.codonLookup = np.zeros((256, max(len(codons) for codons in codon_table.values()), 3), dtype=np.uint8)
+        self.codonCounts = np.zeros(256, dtype=np.int64)
+        for acid, codons in codon_table.items():
+            self.codonLookup[ord(acid), :len(codons)] = np.frombuffer(''.join(codons).encode(), dtype=np.uint8).reshape(-1, 3)
+            self.codonCounts[ord(acid)] = len(codons)
+
+    def batch(self, seed_sequence, n):
+
+        """
+        Generates n decoys from the random stream of seed_sequence.
+
+        Returns:
+            tuple: Lists of the amino acid sequences, CDS, 5' UTRs and 3' UTRs.
+        """
+
+        rng = np.random.default_rng(seed_sequence)
+        proteins = self.proteins(rng, n)
+        utr_5 = self.sample_utrs(rng, n, self.utrLength, *self.utr5, x_at_start=False)
+        utr_3 = self.sample_utrs(rng, n, self.utrLength, *self.utr3, x_at_start=True)
+        return proteins, self.back_translate(rng, proteins), utr_5, utr_3
+
+    @staticmethod
+    def positive_lengths(rng, n, mean, std):
+
+        """Draws n lengths from a normal distribution, truncated to integers, keeping only the positive ones."""
+
+        lengths = np.empty(0, dtype=np.int64)
+        while len(lengths) < n:
+            draws = rng.normal(mean, std, n - len(lengths)).astype(np.int64)
+            lengths = np.concatenate([lengths, draws[draws > 0]])
+        return lengths
+
+    def proteins(self, rng, n):
+
+        """
+        Generates n decoy proteins with the amino acid composition of the putative smORFs and lengths from
+        a normal distribution around theirs. All residues are drawn at once into a padded matrix, and proteins
+        that do not start with M get one prepended.
+
+        Returns:
+            list: The decoy amino acid sequences.
+        """
+
+        if n == 0:
+            return []
+        lengths = self.positive_lengths(rng, n, self.meanAA, self.stdAA)
+        codes = np.frombuffer(''.join(AMINO_ACIDS).encode(), dtype=np.uint8)
+        residues = codes[rng.choice(len(AMINO_ACIDS), size=int(lengths.sum()), p=self.aaProbabilities)]
+
+        # Column 0 holds the prepended M, padding is NUL which the fixed-width bytes view drops
+        matrix = np.zeros((n, int(lengths.max()) + 1), dtype=np.uint8)
+        matrix[:, 0] = ord('M')
+        matrix[:, 1:][np.arange(lengths.max()) < lengths[:, None]] = residues
+        starts_with_m = matrix[:, 1] == ord('M')
+        matrix[starts_with_m, :-1] = matrix[starts_with_m, 1:]
+        matrix[starts_with_m, -1] = 0
+        return [protein.decode() for protein in matrix.view(f'S{matrix.shape[1]}').ravel()]
+
+    @staticmethod
+    def sample_utrs(rng, n, target_length, nucleotide_probabilities, x_run_probabilities, x_at_start):
+
+        """
+        Generates n UTRs with the given nucleotide composition and runs of X (missing sequence beyond the
+        transcript) whose lengths follow x_run_probabilities: at the end for 5' UTRs, at the start for 3' UTRs.
+        All UTRs are drawn in one batch.
+
+        Returns:
+            list: The decoy UTR sequences.
+        """
+
+        if n == 0:
+            return []
+        x_weights = np.asarray(x_run_probabilities, dtype=float)
+        num_xs = rng.choice(len(x_weights), size=n, p=x_weights / x_weights.sum())
+
+        codes = np.frombuffer(''.join(NUCLEOTIDES).encode(), dtype=np.uint8)
+        utrs = codes[rng.choice(len(NUCLEOTIDES), size=(n, target_length), p=nucleotide_probabilities)]
+        positions = np.arange(target_length)
+        if x_at_start:
+            utrs[positions < num_xs[:, None]] = ord('X')
+        else:
+            utrs[positions >= target_length - num_xs[:, None]] = ord('X')
+        return [utr.decode() for utr in utrs.view(f'S{target_length}').ravel()]
+
+    def back_translate(self, rng, proteins):
+
+        """
+        Converts proteins to DNA by picking one of the codons of each amino acid uniformly at random, so the
+        CDS is not biased by codon usage. Codons are looked up for all residues at once.
+
+        Returns:
+            list: The CDS of each protein.
+        """
+
+        residues = np.frombuffer(''.join(proteins).encode(), dtype=np.uint8)
+        codon_index = (rng.random(len(residues)) * self.codonCounts[residues]).astype(np.int64)
+        dna = self.codonLookup[residues, codon_index].tobytes().decode()
+        offsets = np.concatenate([[0], np.cumsum([3 * len(protein) for protein in proteins])])
+        return [dna[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
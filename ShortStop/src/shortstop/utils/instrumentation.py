@@ -0,0 +1,167 @@
+import os
+import csv
+import json
+import time
+import cProfile
+import resource
+import threading
+from contextlib import contextmanager
+
+REPORT_COLUMNS = ['stage', 'calls', 'wall_s', 'cpu_s', 'peak_rss_mb', 'rows', 'rows_per_s']
+
+
+def current_peak_rss_mb():
+
+    """Returns the peak resident set size of the process since it was last reset, in MB."""
+
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kB on Linux and in bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024) if os.uname().sysname == 'Darwin' else maxrss / 1024
+
+
+def reset_peak_rss():
+
+    """Resets the peak RSS high-water mark where the kernel allows it (Linux), so each stage gets its own peak."""
+
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        pass
+
+
+class Measurement:
+    """Open measurement of one stage. Set rows to the number of rows the stage processed."""
+
+    def __init__(self, name, rows=None):
+        self.name = name
+        self.rows = rows
+        self.peakRss = 0.0
+
+
+class RunReport:
+    """
+    Collects wall time, CPU time, peak RSS and rows processed for nested pipeline stages and
+    writes them to <outdir>/run_report.json and run_report.csv.
+
+    Stages are named by their nesting (e.g. prediction/features/ctdd). A stage entered several
+    times, such as once per chunk, is aggregated into one row. With profiling on, the cProfile
+    stats of every top-level stage are dumped to <outdir>/profiles/<stage>.prof.
+    """
+
+    def __init__(self):
+        self.records = {}
+        self.stack = []
+        self.reportDir = None
+        self.profile = False
+        self.lock = threading.Lock()
+
+    def configure(self, report_dir, profile=False):
+        self.records = {}
+        self.stack = []
+        self.reportDir = report_dir
+        self.profile = profile
+
+    @contextmanager
+    def measure(self, name, rows=None):
+
+        """
+        Measures the enclosed block as a stage nested in the currently open ones.
+
+        Args:
+            name (str): Stage name.
+            rows (int): Number of rows processed, if known up front.
+
+        Yields:
+            Measurement: Set its rows attribute once the number of rows is known.
+        """
+
+        measurement = Measurement(name, rows)
+        self.__update_peaks(current_peak_rss_mb())
+        reset_peak_rss()
+        profiler = None
+        if self.profile and not self.stack and self.reportDir:
+            profiler = cProfile.Profile()
+        self.stack.append(measurement)
+        # Registered on entry so that stages are reported before their sub-stages
+        path = '/'.join(open_measurement.name for open_measurement in self.stack)
+        self.records.setdefault(path, {'stage': path, 'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0, 'peak_rss_mb': 0.0, 'rows': None, 'rows_per_s': None})
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield measurement
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+            self.__update_peaks(current_peak_rss_mb())
+            self.stack.pop()
+            self.__add(self.records[path], wall, cpu, measurement)
+            if profiler is not None:
+                os.makedirs(f'{self.reportDir}/profiles', exist_ok=True)
+                profiler.dump_stats(f'{self.reportDir}/profiles/{name}.prof')
+
+    def add(self, name, wall, rows=None):
+
+        """
+        Adds a sub-stage timed by the caller, e.g. in a worker thread where measure() cannot be nested.
+        Only its wall time and rows are recorded. Safe to call from several threads.
+        """
+
+        with self.lock:
+            path = '/'.join([open_measurement.name for open_measurement in self.stack] + [name])
+            record = self.records.setdefault(path, {'stage': path, 'calls': 0, 'wall_s': 0.0, 'cpu_s': None, 'peak_rss_mb': None, 'rows': None, 'rows_per_s': None})
+            record['calls'] += 1
+            record['wall_s'] += wall
+            if rows is not None:
+                record['rows'] = (record['rows'] or 0) + int(rows)
+            record['rows_per_s'] = record['rows'] / record['wall_s'] if record['rows'] and record['wall_s'] > 0 else None
+
+    def __update_peaks(self, peak_rss):
+        for open_measurement in self.stack:
+            open_measurement.peakRss = max(open_measurement.peakRss, peak_rss)
+
+    @staticmethod
+    def __add(record, wall, cpu, measurement):
+        record['calls'] += 1
+        record['wall_s'] += wall
+        record['cpu_s'] += cpu
+        record['peak_rss_mb'] = max(record['peak_rss_mb'], measurement.peakRss)
+        if measurement.rows is not None:
+            record['rows'] = (record['rows'] or 0) + int(measurement.rows)
+        record['rows_per_s'] = record['rows'] / record['wall_s'] if record['rows'] and record['wall_s'] > 0 else None
+
+    def write(self):
+
+        """Writes the report, if a report directory was configured and any stage was measured."""
+
+        if not self.reportDir or not self.records:
+            return
+        records = [{column: round(value, 4) if isinstance(value, float) else value for column, value in record.items()}
+                   for record in self.records.values() if record['calls']]
+        with open(f'{self.reportDir}/run_report.json', 'w') as handle:
+            json.dump({'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'stages': records}, handle, indent=2)
+        with open(f'{self.reportDir}/run_report.csv', 'w', newline='') as handle:
+            writer = csv.DictWriter(handle, fieldnames=REPORT_COLUMNS)
+            writer.writeheader()
+            writer.writerows(records)
+        print(f"     Run report with per-stage timing and memory written to {self.reportDir}/run_report.csv")
+
+
+# Process-wide report, so converters and predictors deep in a stage can add sub-stages without plumbing
+RUN_REPORT = RunReport()
+
+
+def measure(name, rows=None):
+
+    """Measures the enclosed block as a sub-stage of the open stages. See RunReport.measure."""
+
+    return RUN_REPORT.measure(name, rows)
@@ -0,0 +1,72 @@
+import hashlib
+import numpy as np
+import pandas as pd
+
+# Everything FeatureExtraction looks at: ORFs sharing these have identical features and predictions
+FEATURE_INPUT_COLUMNS = ['aa_seq', 'cds_seq', 'utr_5', 'utr_3']
+
+
+def content_keys(smorfs):
+
+    """
+    Hashes the feature inputs of each ORF (upper-cased, as FeatureExtraction sees them) into a hex key.
+    ORFs with the same key have identical features, whatever their orf_id or sample.
+    """
+
+    inputs = smorfs[FEATURE_INPUT_COLUMNS].astype(str)
+    joined = inputs['aa_seq'].str.upper()
+    for column in FEATURE_INPUT_COLUMNS[1:]:
+        joined = joined + '|' + inputs[column].str.upper()
+    return joined.map(lambda value: hashlib.sha1(value.encode()).hexdigest())
+
+
+def collapse_identical_orfs(unknown_smorfs):
+
+    """
+    Collapses ORFs with identical feature inputs (CDS, amino acid sequence and UTR flanks) to one
+    representative each, e.g. isoforms that share their coding region and flanks.
+
+    Args:
+        unknown_smorfs (pandas.DataFrame): Extracted sequences with orf_id and FEATURE_INPUT_COLUMNS.
+
+    Returns:
+        tuple: The unique sequences (keyed by the orf_id of the first ORF of each group, with a
+            content_key column) and the orf_id -> representative_id, content_key map, in the input order.
+    """
+
+    keys = content_keys(unknown_smorfs)
+    representative = ~keys.duplicated(keep='first')
+
+    unique_smorfs = unknown_smorfs[representative.values].assign(content_key=keys[representative].values)
+    representative_ids = pd.Series(unique_smorfs['orf_id'].values, index=unique_smorfs['content_key'].values)
+    orf_map = pd.DataFrame({
+        'orf_id': unknown_smorfs['orf_id'].values,
+        'representative_id': representative_ids.loc[keys.values].values,
+        'content_key': keys.values,
+    })
+
+    n_orfs, n_unique = len(unknown_smorfs), len(unique_smorfs)
+    if n_orfs > 0:
+        print(f"     {n_orfs} ORFs collapsed to {n_unique} unique feature inputs "
+              f"(dedup ratio {n_unique / n_orfs:.2f}, {n_orfs - n_unique} featurisations saved).")
+    return unique_smorfs, orf_map
+
+
+def broadcast_to_orfs(representative_ids, predictions, orf_map):
+
+    """
+    Broadcasts predictions made for the representatives back to every ORF of the map.
+
+    Args:
+        representative_ids (pandas.Series): orf_id of each predicted row.
+        predictions (numpy.ndarray): Class probabilities, one row per representative.
+        orf_map (pandas.DataFrame): orf_id -> representative_id map from collapse_identical_orfs.
+
+    Returns:
+        tuple: The orf_ids (pandas.Series) and their class probabilities, in the map order.
+    """
+
+    position = pd.Series(np.arange(len(representative_ids)), index=representative_ids.values)
+    orf_map = orf_map[orf_map['representative_id'].isin(position.index)]
+    rows = position.loc[orf_map['representative_id']].values
+    return orf_map['orf_id'].reset_index(drop=True), predictions[rows]
@@ -1,34 +1,146 @@
 import os
+import sys
+import json
 import time
-#TODO: make this a class that can be called from the pipeline
+
+# Hot loops report their position once every PROGRESS_BATCH items, never per item
+PROGRESS_BATCH = 1024
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    return f'{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}'
+
+
+class ProgressTask:
+    """
+    Progress of one stage or loop with a known or unknown number of items.
+
+    update/advance only do work when the throttle interval has passed, so they can be called from
+    loops once per batch of items. Use as a context manager so the task is closed on exit.
+    """
+
+    def __init__(self, progress, name, total=None, unit='items'):
+        self.progress = progress
+        self.name = name
+        self.total = total
+        self.unit = unit
+        self.done = 0
+        self.startTime = time.monotonic()
+        self.lastReport = 0.0
+        self.progress.emit('task_started', task=name, total=total, unit=unit)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def advance(self, n=1):
+        self.update(self.done + n)
+
+    def update(self, done):
+
+        """Sets the number of items done, reporting it if the throttle interval has passed."""
+
+        self.done = done
+        now = time.monotonic()
+        if now - self.lastReport >= self.progress.minInterval:
+            self.lastReport = now
+            self.__report(now)
+
+    def rate(self, now=None):
+        elapsed = (now or time.monotonic()) - self.startTime
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def eta(self, now=None):
+
+        """Returns the estimated seconds left from the throughput so far, or None if it cannot be estimated."""
+
+        rate = self.rate(now)
+        if not self.total or rate <= 0:
+            return None
+        return max(self.total - self.done, 0) / rate
+
+    def __report(self, now):
+        rate, eta = self.rate(now), self.eta(now)
+        self.progress.emit('task_progress', task=self.name, done=self.done, total=self.total,
+                           rate=round(rate, 2), eta_s=None if eta is None else round(eta, 1))
+        self.progress.draw(self, rate, eta)
+
+    def close(self):
+        now = time.monotonic()
+        if self.total is not None:
+            self.done = max(self.done, self.total)
+        self.progress.draw(self, self.rate(now), 0, final=True)
+        self.progress.emit('task_finished', task=self.name, done=self.done,
+                           elapsed_s=round(now - self.startTime, 3))
+
 
 class PipelineProgress:
-    def __init__(self):
-        self.progress = "___SequenceExtractor___NegativeSet___DatabaseCombiner___FeatureExtractor___LabelPropagator"""
-        self.maxSteps = len(self.progress.split("___"))+1
-        self.step = 1
-        self.updated = None
+    """
+    Progress reporting for the pipeline: stage start/finish, and per-task progress bars with
+    item counts, throughput and ETA.
+
+    Bars are drawn on stderr when it is a terminal. Every event can also be written as one JSON
+    object per line to a file or an inherited file descriptor ("fd:N"), so workflow managers and
+    cluster wrappers can follow long runs.
+    """
+
+    def __init__(self, min_interval=0.5):
+        self.minInterval = min_interval
+        self.stream = sys.stderr
+        self.bars = self.stream.isatty()
+        self.events = None
+
+    def configure(self, events=None, bars=None):
+
+        """
+        Args:
+            events (str): File path, or "fd:N" for an open file descriptor, to write JSON-lines events to.
+            bars (bool): Whether to draw progress bars. Defaults to whether stderr is a terminal.
+        """
+
+        self.close()
+        self.bars = self.stream.isatty() if bars is None else bars
+        if events:
+            if events.startswith('fd:'):
+                self.events = os.fdopen(int(events[3:]), 'w', buffering=1, closefd=False)
+            else:
+                self.events = open(events, 'a', buffering=1)
+
+    def emit(self, event, **fields):
+        if self.events is not None:
+            self.events.write(json.dumps({'time': round(time.time(), 3), 'event': event, **fields}) + '\n')
 
-    def next_step(self):
-        steps = self.progress.split("___")
-        # print(steps)
-        progress = '==='.join(steps[:self.step])
-        progress += f"___{'___'.join(steps[self.step:])}"
-        self.updated = progress
-        if self.step < self.maxSteps:
-            self.step += 1
+    def stage_started(self, stage):
+        self.emit('stage_started', stage=stage)
 
-    def run(self):
-        for i in range(self.maxSteps):
-            print(self.updated, end='\r')
-            time.sleep(1)
+    def stage_finished(self, stage, skipped=False):
+        self.emit('stage_finished', stage=stage, skipped=skipped)
 
-            self.next_step()
-        print("\n")
+    def task(self, name, total=None, unit='items'):
+        return ProgressTask(self, name, total=total, unit=unit)
 
+    def draw(self, task, rate, eta, final=False):
+        if not self.bars:
+            return
+        if task.total:
+            filled = int(30 * min(task.done / task.total, 1))
+            line = f"     {task.name:<16} [{'=' * filled}{' ' * (30 - filled)}] {task.done}/{task.total} {task.unit}"
+        else:
+            line = f"     {task.name:<16} {task.done} {task.unit}"
+        line += f" | {rate:,.0f}/s"
+        if eta is not None and not final:
+            line += f" | ETA {format_duration(eta)}"
+        self.stream.write(f"\r{line:<100}" + ('\n' if final else ''))
+        self.stream.flush()
 
+    def close(self):
+        if self.events is not None:
+            self.events.close()
+            self.events = None
 
 
-if __name__ == '__main__':
-    pipe = PipelineProgress()
-    pipe.run()
\ No newline at end of file
+# Process-wide progress, so the loops deep in a stage can report without plumbing
+PROGRESS = PipelineProgress()
@@ -0,0 +1,60 @@
+import os
+import numpy as np
+
+SPLITS = ['train', 'test']
+# Encoding of the 'local' labels of the training classes. Decoys are labelled insilico when generated by
+# NegativeSet, Random in older databases; rows with any other label (e.g. ToBePredicted) are not trained on.
+LABEL_ENCODING = {"Random": 0, "insilico": 0, "Cytoplasm": 1, "Secreted": 2}
+
+
+def split_files(models_dir, split):
+
+    """Returns the paths of the feature matrix, ORF IDs and labels of a split in models_dir."""
+
+    return (f'{models_dir}/{split}_data.npy', f'{models_dir}/{split}_ids.npy', f'{models_dir}/{split}_labels.npy')
+
+
+def save_split(models_dir, split, data, ids, labels):
+
+    """
+    Saves one side of the train/test split as binary arrays: the unscaled feature matrix as float32, and the
+    ORF IDs and encoded labels of its rows alongside.
+
+    Args:
+        models_dir (str): Models directory of the training run.
+        split (str): 'train' or 'test'.
+        data (np.ndarray): Feature matrix, DNA feature columns then amino acid feature columns.
+        ids (np.ndarray): ORF ID of each row.
+        labels (np.ndarray): Encoded label of each row (LABEL_ENCODING: 0 decoy, 1 Cytoplasm, 2 Secreted).
+    """
+
+    data_file, ids_file, labels_file = split_files(models_dir, split)
+    np.save(data_file, np.ascontiguousarray(data, dtype=np.float32))
+    np.save(ids_file, np.asarray(ids).astype(str))
+    np.save(labels_file, np.asarray(labels).astype(np.int8))
+
+
+def load_split(models_dir, split, scaler=None, mmap=True):
+
+    """
+    Loads a split saved by a training run, to retrain or evaluate without extracting the features again.
+
+    Args:
+        models_dir (str): Models directory of the training run.
+        split (str): 'train' or 'test'.
+        scaler: Fitted scaler (e.g. joblib.load(f'{models_dir}/scaler.save')) to apply to the matrix. The matrix
+            is returned unscaled if None.
+        mmap (bool): Memory-map the matrix instead of reading it into memory. Ignored when scaling.
+
+    Returns:
+        tuple: (data, ids, labels) arrays.
+    """
+
+    data_file, ids_file, labels_file = split_files(models_dir, split)
+    for path in (data_file, ids_file, labels_file):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"🚨 {path} not found. Was {models_dir} written by a training run of this version?")
+    data = np.load(data_file, mmap_mode='r' if mmap and scaler is None else None)
+    if scaler is not None:
+        data = scaler.transform(data)
+    return data, np.load(ids_file), np.load(labels_file)
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+Times and memory-profiles the heavy steps of ShortStop and of the Snakemake helper scripts on
+deterministic synthetic data (see synthetic.py).
+
+Every (benchmark, scale) pair runs in a fresh Python process, so peak RSS is not inherited from
+earlier cases. Inputs are generated once per scale and are not part of the timings. Everything runs
+offline and on CPU.
+
+Usage:
+    # Measure the current checkout and save it as a baseline
+    python benchmarks/run_benchmarks.py --scales 1000 10000 --output benchmarks/baseline.json
+
+    # Measure again (e.g. on another commit) and compare against the baseline
+    python benchmarks/run_benchmarks.py --scales 1000 10000 --output results.json \\
+        --baseline benchmarks/baseline.json --fail-on-regression
+
+    # Smoke test: every benchmark and the whole demo once, on the miniature reference bundled for the demo
+    python benchmarks/run_benchmarks.py --smoke
+"""
+
+import os
+import sys
+import json
+import time
+import runpy
+import shutil
+import argparse
+import platform
+import subprocess
+import contextlib
+from pathlib import Path
+from argparse import Namespace
+
+import numpy as np
+import pandas as pd
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+REPO_DIR = BENCHMARKS_DIR.parent
+SHORTSTOP_SRC = REPO_DIR / 'ShortStop' / 'src'
+SNAKEMAKE_DIR = REPO_DIR / 'Snakemake'
+MODEL_DIR = SHORTSTOP_SRC / 'shortstop' / 'standard_prediction_model'
+
+sys.path.insert(0, str(BENCHMARKS_DIR))
+from synthetic import SyntheticDataset  # noqa: E402
+
+N_SAMPLES = 4  # Samples simulated for the merge/aggregate scripts
+DEMO_SCALE = 'demo'  # Scale of the bundled miniature reference (SyntheticDataset.demo)
+
+
+def load_shortstop():
+
+    """Imports the ShortStop package of this checkout (not an installed one) in dependency order."""
+
+    sys.path.insert(0, str(SHORTSTOP_SRC))
+    import shortstop.pipeline  # noqa: F401  The package must be initialised through the pipeline
+    import shortstop.utils.instrumentation as instrumentation
+    return instrumentation
+
+
+def run_script(script, *args):
+
+    """Runs a standalone script in this process, as if from the command line."""
+
+    argv = sys.argv
+    sys.argv = [str(script)] + [str(arg) for arg in args]
+    try:
+        runpy.run_path(str(script), run_name='__main__')
+    finally:
+        sys.argv = argv
+
+
+# --- Benchmarks. Each takes (dataset, workdir) and returns (call to time, rows processed) ---
+
+def bench_gtf_to_seq(dataset, workdir):
+    from shortstop.converters import GTFtoSeq
+
+    def run():
+        GTFtoSeq(gtf_file=dataset.smorfsGtf, fasta_file=dataset.genomeFasta, cds_order='Last', utr_length=25).extract_sequences()
+    return run, dataset.nOrfs
+
+
+def bench_feature_extraction(dataset, workdir):
+    from shortstop.converters import FeatureExtraction
+    sequences = pd.read_csv(dataset.sequencesCsv)
+
+    def run():
+        FeatureExtraction(sequences['orf_id'].tolist(), sequences['type'].tolist(), sequences['local'].tolist(),
+                          sequences['aa_seq'].tolist(), sequences['cds_seq'].tolist(), sequences['utr_5'].tolist(),
+                          sequences['utr_3'].tolist(), utr_length=25, k=4).feature_extraction()
+    return run, len(sequences)
+
+
+def bench_negative_set_turn_two(dataset, workdir):
+    from shortstop.training import NegativeSet
+    os.makedirs(f'{workdir}/sequences', exist_ok=True)
+    shutil.copy(dataset.sequencesCsv, f'{workdir}/sequences/positive_and_unknown_sequences.csv')
+    args = Namespace(mode='insilico', outdir=workdir, threads=1, seed=0, positive_functions=None, positive_ids=None,
+                     positive_gtf=None, putative_smorfs_gtf=None, genome=None, utr_length=25, kmer=4,
+                     n_insilico_smORFs=dataset.nOrfs)
+    decoy = NegativeSet(args=args)
+    return decoy.turn_two, dataset.nOrfs
+
+
+def bench_smorf_predictor_dansby(dataset, workdir):
+    from shortstop.prediction import smORFPredictor
+    # Prediction cost depends on the number of rows, not on the feature values: use random features
+    train_columns = pd.read_csv(MODEL_DIR / 'orfs_features_in_train_model.csv', nrows=0).columns
+    feature_columns = [column for column in train_columns if column not in ('orf_id', 'label', 'type', 'local')]
+    rng = np.random.default_rng(0)
+    features = pd.DataFrame(rng.random((dataset.nOrfs, len(feature_columns))), columns=feature_columns)
+    features.insert(0, 'orf_id', [f'synthetic_{n + 1}' for n in range(dataset.nOrfs)])
+    features_csv = f'{workdir}/features.csv'
+    features.to_csv(features_csv, index=False)
+    args = Namespace(mode='predict', outdir=workdir, threads=1, genome=None, putative_smorfs_gtf=None,
+                     utr_length=25, kmer=4, orfs_features_in_train_model=str(MODEL_DIR / 'orfs_features_in_train_model.csv'),
+                     orfs_to_be_predicted=features_csv, model_scaler=str(MODEL_DIR / 'scaler.save'),
+                     model=str(MODEL_DIR / 'best_xgb_model.model'), shard=None, chunk_size=None, no_cache=True)
+
+    def run():
+        smORFPredictor(args=args).dansby()
+    return run, dataset.nOrfs
+
+
+def bench_snakemake_liftover(dataset, workdir):
+    def run():
+        run_script(SNAKEMAKE_DIR / 'smorfs_transcript_to_genome_gtf.py', '--merged_gtf', dataset.transcriptsGtf,
+                   '--smorfs_gff3', dataset.smorfsGff3, '--out_gtf', f'{workdir}/smorfs_genomic.gtf')
+    return run, dataset.nOrfs
+
+
+def write_shortstop_samples(dataset, root):
+
+    """Per-sample ShortStop outputs, each predicting an overlapping random 80% of the ORFs."""
+
+    sequences = pd.read_csv(dataset.sequencesCsv)
+    rng = np.random.default_rng(0)
+    sequences['cds_chr'] = 'chr' + pd.Series(rng.integers(1, 23, len(sequences))).astype(str)
+    sequences['cds_starts'] = rng.integers(1, 10 ** 8, len(sequences))
+    sequences['cds_ends'] = sequences['cds_starts'] + sequences['cds_seq'].str.len() - 1
+    sequences['cds_strand'] = np.where(rng.random(len(sequences)) < 0.5, '+', '-')
+    for n in range(N_SAMPLES):
+        sample = sequences[rng.random(len(sequences)) < 0.8]
+        output_dir = Path(root) / f'sample{n + 1}' / 'shortstop' / 'shortstop_output'
+        os.makedirs(output_dir / 'predictions', exist_ok=True)
+        os.makedirs(output_dir / 'sequences', exist_ok=True)
+        prism_probability = rng.random(len(sample))
+        pd.DataFrame({'orf_id': '"' + sample['orf_id'] + '"', 'prism_probability': prism_probability,
+                      'sam_probability': 1 - prism_probability}).to_csv(output_dir / 'predictions' / 'sams.csv', index=False)
+        sample.to_csv(output_dir / 'sequences' / 'unknown_sequences.csv', index=False)
+    return len(sequences) * N_SAMPLES
+
+
+def bench_merge_shortstop_output(dataset, workdir):
+    rows = write_shortstop_samples(dataset, f'{workdir}/results')
+
+    def run():
+        run_script(SNAKEMAKE_DIR / 'merge_shortstop_output.py', '--root', f'{workdir}/results', '--outdir', f'{workdir}/merged')
+    return run, rows
+
+
+def bench_aggregate_smorfs_by_locus(dataset, workdir):
+    rows = write_shortstop_samples(dataset, f'{workdir}/results')
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        run_script(SNAKEMAKE_DIR / 'merge_shortstop_output.py', '--root', f'{workdir}/results', '--outdir', f'{workdir}/merged')
+
+    def run():
+        run_script(SNAKEMAKE_DIR / 'aggregate_smorfs_by_locus.py', '--merged_dir', f'{workdir}/merged',
+                   '--out_prefix', f'{workdir}/cohort')
+    return run, rows
+
+
+def bench_demo(dataset, workdir):
+    from shortstop.ShortStop import ShortStop
+    argv = ['shortstop', 'demo', '--outdir', f'{workdir}/demo', '--seed', '0', '--positive_gtf', dataset.referenceGtf,
+            '--positive_ids', dataset.uniprotIds, '--positive_functions', dataset.functionsCsv,
+            '--genome', dataset.genomeFasta, '--putative_smorfs_gtf', dataset.smorfsGtf]
+
+    def run():
+        saved_argv = sys.argv
+        sys.argv = argv
+        try:
+            ShortStop().execute()
+        finally:
+            sys.argv = saved_argv
+    return run, dataset.nOrfs + dataset.nPositives
+
+
+BENCHMARKS = {
+    'gtf_to_seq': bench_gtf_to_seq,
+    'feature_extraction': bench_feature_extraction,
+    'negative_set_turn_two': bench_negative_set_turn_two,
+    'smorf_predictor_dansby': bench_smorf_predictor_dansby,
+    'snakemake_liftover': bench_snakemake_liftover,
+    'merge_shortstop_output': bench_merge_shortstop_output,
+    'aggregate_smorfs_by_locus': bench_aggregate_smorfs_by_locus,
+}
+# Whole-pipeline cases, which need the annotated positives of the miniature reference
+SMOKE_BENCHMARKS = {
+    'demo': bench_demo,
+}
+
+
+def dataset_for(scale, data_dir):
+    if scale == DEMO_SCALE:
+        return SyntheticDataset.demo()
+    return SyntheticDataset(int(scale), os.path.join(data_dir, str(scale)))
+
+
+def run_worker(name, scale, data_dir, workdir):
+
+    """Runs one benchmark in this (fresh) process and prints its measurements as JSON."""
+
+    instrumentation = load_shortstop()
+    dataset = dataset_for(scale, data_dir)
+    shutil.rmtree(workdir, ignore_errors=True)
+    os.makedirs(workdir)
+
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        run, rows = {**BENCHMARKS, **SMOKE_BENCHMARKS}[name](dataset, workdir)
+        rss_before = instrumentation.current_peak_rss_mb()
+        instrumentation.reset_peak_rss()
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        run()
+        wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+        peak_rss = instrumentation.current_peak_rss_mb()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps({'benchmark': name, 'scale': scale, 'rows': rows, 'wall_s': round(wall, 4), 'cpu_s': round(cpu, 4),
+                      'peak_rss_mb': round(peak_rss, 1), 'rss_before_mb': round(rss_before, 1),
+                      'rows_per_s': round(rows / wall, 1) if wall > 0 else None}))
+
+
+def run_case(name, scale, data_dir, timeout):
+    workdir = os.path.join(data_dir, 'work', f'{name}_{scale}')
+    command = [sys.executable, __file__, '--worker', name, str(scale), '--data-dir', data_dir, '--workdir', workdir]
+    try:
+        completed = subprocess.run(command, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return {'benchmark': name, 'scale': scale, 'error': f'timed out after {timeout} s'}
+    if completed.returncode != 0:
+        return {'benchmark': name, 'scale': scale, 'error': completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else 'failed'}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(results, baseline, tolerance):
+
+    """Prints the wall time and peak RSS ratios against a baseline and returns the regressed cases."""
+
+    regressions = []
+    print(f"\n{'benchmark':<28}{'scale':>9}{'wall base':>12}{'wall now':>12}{'ratio':>8}{'rss ratio':>11}")
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None or 'error' in result or 'error' in base:
+            continue
+        ratio = result['wall_s'] / base['wall_s'] if base['wall_s'] > 0 else float('inf')
+        rss_ratio = result['peak_rss_mb'] / base['peak_rss_mb'] if base['peak_rss_mb'] > 0 else float('inf')
+        flag = '  << slower' if ratio > tolerance else ''
+        print(f"{result['benchmark']:<28}{result['scale']:>9}{base['wall_s']:>12.3f}{result['wall_s']:>12.3f}{ratio:>8.2f}{rss_ratio:>11.2f}{flag}")
+        if ratio > tolerance:
+            regressions.append(key)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ShortStop and the Snakemake helper scripts on synthetic data.")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1000, 10000],
+                        help="Numbers of ORFs to benchmark, e.g. 1000 10000 100000 1000000 (default: 1000 10000)")
+    parser.add_argument("--benchmarks", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS),
+                        help="Benchmarks to run (default: all)")
+    parser.add_argument("--data-dir", default=str(BENCHMARKS_DIR / '.data'),
+                        help="Where synthetic inputs are generated and cached (default: benchmarks/.data)")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Baseline JSON from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=1.25,
+                        help="Wall-time ratio against the baseline above which a case counts as a regression (default: 1.25)")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 if any case regressed")
+    parser.add_argument("--timeout", type=int, default=3600, help="Seconds allowed per case (default: 3600)")
+    parser.add_argument("--smoke", action="store_true", help=(
+        "Run every benchmark and the whole demo once on the miniature reference bundled for `shortstop demo`, "
+        "instead of --scales, and exit with status 1 if any case fails"
+    ))
+    parser.add_argument("--worker", nargs=2, metavar=("BENCHMARK", "SCALE"), help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        scale = args.worker[1]
+        run_worker(args.worker[0], scale if scale == DEMO_SCALE else int(scale), args.data_dir, args.workdir)
+        return
+
+    scales = [DEMO_SCALE] if args.smoke else args.scales
+    benchmarks = args.benchmarks + list(SMOKE_BENCHMARKS) if args.smoke else args.benchmarks
+    results = {}
+    for scale in scales:
+        dataset = dataset_for(scale, args.data_dir)
+        print(f"⏳ Generating synthetic data for {dataset.nOrfs + dataset.nPositives} ORFs ({scale})...")
+        dataset.generate()
+        for name in benchmarks:
+            result = run_case(name, scale, args.data_dir, args.timeout)
+            results[f'{name}@{scale}'] = result
+            if 'error' in result:
+                print(f"🚨 {name} ({scale} ORFs): {result['error']}")
+            else:
+                print(f"     {name:<28}{scale:>9} ORFs {result['wall_s']:>10.3f} s {result['peak_rss_mb']:>9.1f} MB "
+                      f"{result['rows_per_s'] or 0:>12,.0f} rows/s")
+
+    report = {'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit': git_commit(), 'python': platform.python_version(),
+              'platform': platform.platform(), 'processor': platform.processor() or platform.machine(), 'results': results}
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(report, handle, indent=2)
+        print(f"✅ Results written to {args.output}")
+
+    failures = [key for key, result in results.items() if 'error' in result]
+    if args.smoke and failures:
+        print(f"🚨 {len(failures)} smoke case(s) failed: {', '.join(failures)}")
+        sys.exit(1)
+
+    if args.baseline:
+        with open(args.baseline) as handle:
+            baseline = json.load(handle)
+        print(f"Comparing against {args.baseline} (commit {baseline.get('commit')}):")
+        regressions = compare(results, baseline['results'], args.tolerance)
+        if regressions:
+            print(f"🚨 {len(regressions)} case(s) slower than {args.tolerance}x the baseline: {', '.join(regressions)}")
+            if args.fail_on_regression:
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
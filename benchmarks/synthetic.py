@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+Deterministic synthetic inputs for the ShortStop benchmarks.
+
+For a number of ORFs and a seed, SyntheticDataset writes:
+  - genome.fa          random genome, sized to the number of ORFs
+  - transcripts.gtf    StringTie-like transcript and exon models (1-3 exons, both strands)
+  - smorfs.gff3        TransDecoder-like CDS rows in transcript coordinates (input of the Snakemake liftover)
+  - smorfs.gtf         the same smORFs lifted over to genomic transcript/exon/CDS rows (input of predict mode)
+  - sequences.csv      extracted-sequence table (orf_id, aa_seq, cds_seq, utr_5, utr_3, ...) used by the
+                       featurisation and decoy benchmarks
+
+With n_positives, it also writes annotated microproteins, the positive set of train and demo runs:
+  - reference.gtf      GENCODE-like gene/transcript/exon/CDS rows with ENST transcript IDs
+  - uniprot_ids.csv    UniProt-like entry -> ENST mapping (--positive_ids)
+  - functions.csv      subcellular locations of the entries (--positive_functions); secreted ones carry
+                       a signal-peptide-like N-terminus, so the classes can be told apart
+
+Every CDS starts with ATG on its own strand, so the ORFs pass the start-codon filter of GTFtoSeq.
+The same (n_orfs, seed) always produces byte-identical files.
+
+Usage:
+    python benchmarks/synthetic.py --n_orfs 10000 --outdir benchmarks/.data/10000
+
+    # Rebuild the miniature reference bundled for `shortstop demo`
+    python benchmarks/synthetic.py --demo
+"""
+
+import os
+import argparse
+import numpy as np
+import pandas as pd
+
+NUCLEOTIDES = np.frombuffer(b'ACGT', dtype=np.uint8)
+# Amino-acid composition roughly following UniProt, for the sequence table
+AMINO_ACIDS = list('ACDEFGHIKLMNPQRSTVWY')
+AA_FREQUENCIES = np.array([8.3, 1.4, 5.5, 6.8, 3.9, 7.1, 2.3, 5.9, 5.8, 9.7, 2.4, 4.1, 4.7, 3.9, 5.5, 6.6, 5.3, 6.9, 1.1, 2.9])
+AA_FREQUENCIES = AA_FREQUENCIES / AA_FREQUENCIES.sum()
+CODONS = {
+    'A': ['GCT', 'GCC', 'GCA', 'GCG'], 'R': ['CGT', 'CGC', 'CGA', 'CGG', 'AGA', 'AGG'], 'N': ['AAT', 'AAC'],
+    'D': ['GAT', 'GAC'], 'C': ['TGT', 'TGC'], 'Q': ['CAA', 'CAG'], 'E': ['GAA', 'GAG'],
+    'G': ['GGT', 'GGC', 'GGA', 'GGG'], 'H': ['CAT', 'CAC'], 'I': ['ATT', 'ATC', 'ATA'],
+    'L': ['TTA', 'TTG', 'CTT', 'CTC', 'CTA', 'CTG'], 'K': ['AAA', 'AAG'], 'M': ['ATG'], 'F': ['TTT', 'TTC'],
+    'P': ['CCT', 'CCC', 'CCA', 'CCG'], 'S': ['TCT', 'TCC', 'TCA', 'TCG', 'AGT', 'AGC'],
+    'T': ['ACT', 'ACC', 'ACA', 'ACG'], 'W': ['TGG'], 'Y': ['TAT', 'TAC'], 'V': ['GTT', 'GTC', 'GTA', 'GTG'],
+}
+
+# Genomic span reserved per ORF locus; loci are laid out without overlaps
+LOCUS_SPAN = 2000
+
+# Annotated microproteins: 20-100 aa, and the locations their functions are written with
+POSITIVE_LENGTHS = (20, 101)
+INTRACELLULAR_LOCATIONS = ['Cytoplasm.', 'Nucleus.', 'Mitochondrion inner membrane.', 'Endoplasmic reticulum membrane.',
+                           'Golgi apparatus membrane.']
+HYDROPHOBIC = list('LLLAVIF')
+
+# Miniature reference bundled with ShortStop for `shortstop demo`, and fixture of the smoke benchmarks
+DEMO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ShortStop', 'src', 'shortstop', 'demo_data', 'synthetic')
+DEMO_ORFS = 150
+DEMO_POSITIVES = 300
+
+
+class SyntheticDataset:
+    def __init__(self, n_orfs, outdir, seed=0, n_chroms=None, minus_fraction=0.5, multi_exon_fraction=0.4, n_positives=0):
+
+        """
+        Args:
+            n_orfs (int): Number of smORFs.
+            outdir (str): Directory the files are written to.
+            seed (int): Seed of the generator; the files are a pure function of (n_orfs, n_positives, seed).
+            n_chroms (int): Number of chromosomes. Defaults to 1 per 50,000 loci, at least 2.
+            minus_fraction (float): Fraction of ORFs on the minus strand.
+            multi_exon_fraction (float): Fraction of transcripts with 2 or 3 exons.
+            n_positives (int): Number of annotated microproteins, half of them secreted.
+        """
+
+        self.nOrfs = int(n_orfs)
+        self.nPositives = int(n_positives)
+        self.outdir = outdir
+        self.seed = seed
+        self.nChroms = n_chroms or max(2, -(-(self.nOrfs + self.nPositives) // 50000))
+        self.minusFraction = minus_fraction
+        self.multiExonFraction = multi_exon_fraction
+        self.genomeFasta = os.path.join(outdir, 'genome.fa')
+        self.transcriptsGtf = os.path.join(outdir, 'transcripts.gtf')
+        self.smorfsGff3 = os.path.join(outdir, 'smorfs.gff3')
+        self.smorfsGtf = os.path.join(outdir, 'smorfs.gtf')
+        self.sequencesCsv = os.path.join(outdir, 'sequences.csv')
+        self.referenceGtf = os.path.join(outdir, 'reference.gtf')
+        self.uniprotIds = os.path.join(outdir, 'uniprot_ids.csv')
+        self.functionsCsv = os.path.join(outdir, 'functions.csv')
+
+    @classmethod
+    def demo(cls, outdir=DEMO_DIR):
+
+        """The miniature reference of `shortstop demo`."""
+
+        return cls(DEMO_ORFS, outdir, n_positives=DEMO_POSITIVES)
+
+    def files(self):
+        files = [self.genomeFasta, self.transcriptsGtf, self.smorfsGff3, self.smorfsGtf, self.sequencesCsv]
+        if self.nPositives:
+            files += [self.referenceGtf, self.uniprotIds, self.functionsCsv]
+        return files
+
+    def generate(self, force=False):
+
+        """Writes the dataset unless all of its files already exist."""
+
+        if not force and all(os.path.exists(path) for path in self.files()):
+            return self
+        os.makedirs(self.outdir, exist_ok=True)
+        rng = np.random.default_rng(self.seed)
+
+        loci_per_chrom = -(-(self.nOrfs + self.nPositives) // self.nChroms)
+        chrom_length = loci_per_chrom * LOCUS_SPAN + 1000
+        genome = {f'chr{i + 1}': NUCLEOTIDES[rng.integers(0, 4, chrom_length)].copy() for i in range(self.nChroms)}
+
+        with open(self.transcriptsGtf, 'w') as transcripts, open(self.smorfsGff3, 'w') as gff3, open(self.smorfsGtf, 'w') as gtf:
+            gff3.write('##gff-version 3\n')
+            for n in range(self.nOrfs):
+                chrom = f'chr{n % self.nChroms + 1}'
+                locus_start = (n // self.nChroms) * LOCUS_SPAN + 501
+                self.__write_locus(rng, n, chrom, locus_start, genome[chrom], transcripts, gff3, gtf)
+
+        if self.nPositives:
+            # Positive loci follow the smORF ones, so the smORF files do not depend on n_positives
+            # beyond the genome size
+            self.__write_positives(rng, genome)
+
+        with open(self.genomeFasta, 'w') as fasta:
+            for chrom, sequence in genome.items():
+                fasta.write(f'>{chrom}\n')
+                sequence = sequence.tobytes().decode()
+                fasta.write('\n'.join(sequence[i:i + 60] for i in range(0, len(sequence), 60)) + '\n')
+
+        self.__sequence_table(rng).to_csv(self.sequencesCsv, index=False)
+        return self
+
+    def __transcript_model(self, rng, locus_start):
+
+        """Strand, exons and start of the ORF in transcript coordinates of a locus."""
+
+        strand = '-' if rng.random() < self.minusFraction else '+'
+        n_exons = int(rng.integers(2, 4)) if rng.random() < self.multiExonFraction else 1
+
+        # Exons of 150-400 nt separated by introns of 80-300 nt, all inside the locus span
+        exons = []
+        position = locus_start
+        for _ in range(n_exons):
+            length = int(rng.integers(150, 401))
+            exons.append((position, position + length - 1))
+            position += length + int(rng.integers(80, 301))
+
+        # The ORF starts in the first exon (5' in transcript orientation)
+        first_exon = exons[0] if strand == '+' else exons[-1]
+        first_exon_length = first_exon[1] - first_exon[0] + 1
+        orf_start = int(rng.integers(1, first_exon_length - 30))
+        return strand, exons, orf_start
+
+    def __write_locus(self, rng, n, chrom, locus_start, chrom_seq, transcripts, gff3, gtf):
+        strand, exons, orf_start = self.__transcript_model(rng, locus_start)
+        tx_length = sum(end - start + 1 for start, end in exons)
+
+        # ORF in transcript coordinates: 10-100 codons
+        orf_length = 3 * int(rng.integers(10, 101))
+        orf_end = min(orf_start + orf_length - 1, tx_length - 3)
+        orf_end -= (orf_end - orf_start + 1) % 3
+
+        segments = map_orf_to_genome(exons, strand, orf_start, orf_end)
+        # Make the CDS start with ATG on its strand
+        if strand == '+':
+            start = segments[0][0]
+            chrom_seq[start - 1:start + 2] = np.frombuffer(b'ATG', dtype=np.uint8)
+        else:
+            end = segments[0][1]
+            chrom_seq[end - 3:end] = np.frombuffer(b'CAT', dtype=np.uint8)
+
+        tx_id = f'STRG.{n + 1}.1'
+        orf_id = f'cds.{tx_id}.p1'
+        attrs = f'gene_id "STRG.{n + 1}"; transcript_id "{tx_id}";'
+        transcripts.write(f'{chrom}\tStringTie\ttranscript\t{exons[0][0]}\t{exons[-1][1]}\t1000\t{strand}\t.\t{attrs}\n')
+        for start, end in exons:
+            transcripts.write(f'{chrom}\tStringTie\texon\t{start}\t{end}\t1000\t{strand}\t.\t{attrs}\n')
+
+        gff3.write(f'{tx_id}\ttransdecoder\tCDS\t{orf_start}\t{orf_end}\t.\t+\t0\tID={orf_id};Parent={tx_id}.p1\n')
+
+        orf_attrs = f'gene_id "{orf_id}"; transcript_id "{orf_id}";'
+        gtf.write(f'{chrom}\tsmORFmapper\ttranscript\t{exons[0][0]}\t{exons[-1][1]}\t.\t{strand}\t.\t{orf_attrs}\n')
+        for start, end in exons:
+            gtf.write(f'{chrom}\tsmORFmapper\texon\t{start}\t{end}\t.\t{strand}\t.\t{orf_attrs}\n')
+        for start, end in segments:
+            gtf.write(f'{chrom}\tsmORFmapper\tCDS\t{start}\t{end}\t.\t{strand}\t0\t{orf_attrs}\n')
+
+    def __write_positives(self, rng, genome):
+
+        """
+        Annotated microproteins with their CDS written into the genome: GENCODE-like GTF rows, UniProt-like
+        entries mapped to their transcripts, and their subcellular locations.
+        """
+
+        entries, functions = [], []
+        with open(self.referenceGtf, 'w') as reference:
+            reference.write('##description: synthetic reference annotation of the ShortStop demo\n##provider: ShortStop\n')
+            for n in range(self.nPositives):
+                locus = self.nOrfs + n
+                chrom = f'chr{locus % self.nChroms + 1}'
+                locus_start = (locus // self.nChroms) * LOCUS_SPAN + 501
+                strand, exons, orf_start = self.__transcript_model(rng, locus_start)
+                tx_length = sum(end - start + 1 for start, end in exons)
+
+                # The protein and its stop codon must fit in the transcript
+                max_length = (tx_length - orf_start + 1) // 3 - 1
+                secreted = n % 2 == 0
+                protein = positive_protein(rng, min(int(rng.integers(*POSITIVE_LENGTHS)), max_length), secreted)
+                cds = ''.join(CODONS[aa][int(i) % len(CODONS[aa])] for aa, i in zip(protein, rng.integers(0, 6, len(protein)))) + 'TAA'
+                segments = map_orf_to_genome(exons, strand, orf_start, orf_start + len(cds) - 1)
+                write_cds(genome[chrom], segments, strand, cds)
+
+                gene_id, tx_id = f'ENSG9{n + 1:010d}.1', f'ENST9{n + 1:010d}.1'
+                attrs = f'gene_id "{gene_id}"; transcript_id "{tx_id}"; gene_type "protein_coding";'
+                reference.write(f'{chrom}\tSYNTHETIC\tgene\t{exons[0][0]}\t{exons[-1][1]}\t.\t{strand}\t.\tgene_id "{gene_id}"; gene_type "protein_coding";\n')
+                reference.write(f'{chrom}\tSYNTHETIC\ttranscript\t{exons[0][0]}\t{exons[-1][1]}\t.\t{strand}\t.\t{attrs}\n')
+                for start, end in exons:
+                    reference.write(f'{chrom}\tSYNTHETIC\texon\t{start}\t{end}\t.\t{strand}\t.\t{attrs}\n')
+                for start, end in segments:
+                    reference.write(f'{chrom}\tSYNTHETIC\tCDS\t{start}\t{end}\t.\t{strand}\t0\t{attrs}\n')
+
+                entry = f'S9{n + 1:04d}'
+                entries.append({'orf_id': entry, 'Ensembl': f'{tx_id};'})
+                location = 'Secreted.' if secreted else INTRACELLULAR_LOCATIONS[int(rng.integers(0, len(INTRACELLULAR_LOCATIONS)))]
+                functions.append({'orf_id': entry, 'function': f'SUBCELLULAR LOCATION: {location}'})
+
+        pd.DataFrame(entries).to_csv(self.uniprotIds, index=False)
+        pd.DataFrame(functions).to_csv(self.functionsCsv, index=False)
+
+    def __sequence_table(self, rng):
+
+        """Extracted-sequence table with realistic lengths, flanks and some X-padded UTRs."""
+
+        lengths = rng.integers(10, 151, self.nOrfs)
+        residues = rng.choice(AMINO_ACIDS, size=int(lengths.sum()), p=AA_FREQUENCIES)
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        aa_seqs, cds_seqs = [], []
+        for n in range(self.nOrfs):
+            protein = 'M' + ''.join(residues[offsets[n] + 1:offsets[n + 1]])
+            codon_choices = rng.integers(0, 6, len(protein))
+            aa_seqs.append(protein)
+            cds_seqs.append(''.join(CODONS[aa][i % len(CODONS[aa])] for aa, i in zip(protein, codon_choices)) + 'TAA')
+
+        utrs = NUCLEOTIDES[rng.integers(0, 4, (2, self.nOrfs, 25))]
+        utrs = [[row.tobytes().decode() for row in side] for side in utrs]
+        x_runs = np.where(rng.random((2, self.nOrfs)) < 0.1, rng.integers(1, 25, (2, self.nOrfs)), 0)
+        utr_5 = ['X' * x + utr[x:] for utr, x in zip(utrs[0], x_runs[0])]
+        utr_3 = [utr[:25 - x] + 'X' * x for utr, x in zip(utrs[1], x_runs[1])]
+
+        return pd.DataFrame({
+            'orf_id': [f'synthetic_{n + 1}' for n in range(self.nOrfs)],
+            'aa_seq': aa_seqs,
+            'cds_seq': cds_seqs,
+            'utr_5': utr_5,
+            'utr_3': utr_3,
+            'length': lengths,
+            'type': 'unknown_orfs',
+            'local': 'ToBePredicted',
+        })
+
+
+def positive_protein(rng, length, secreted):
+
+    """
+    Protein of an annotated microprotein. Secreted ones start with a signal-peptide-like stretch: a charged
+    residue, a hydrophobic core of 8-14 residues and an A-x-A cleavage motif.
+    """
+
+    residues = list(rng.choice(AMINO_ACIDS, size=length - 1, p=AA_FREQUENCIES))
+    if secreted:
+        signal = [str(rng.choice(['K', 'R']))] + list(rng.choice(HYDROPHOBIC, size=int(rng.integers(8, 15)))) + ['A', 'S', 'A']
+        residues[:len(signal)] = signal[:len(residues)]
+    return 'M' + ''.join(residues)
+
+
+def write_cds(chrom_seq, segments, strand, cds):
+
+    """Writes a CDS (5' to 3' on its strand) over its genomic segments, as returned by map_orf_to_genome."""
+
+    if strand == '+':
+        positions = np.concatenate([np.arange(start, end + 1) for start, end in segments])
+        bases = cds.encode()
+    else:
+        positions = np.concatenate([np.arange(end, start - 1, -1) for start, end in segments])
+        bases = cds.translate(str.maketrans('ACGT', 'TGCA')).encode()
+    chrom_seq[positions - 1] = np.frombuffer(bases, dtype=np.uint8)
+
+
+def map_orf_to_genome(exons, strand, orf_start_tx, orf_end_tx):
+
+    """
+    Genomic (start, end) segments of an ORF given in transcript coordinates, ordered 5' to 3' on its
+    strand. Same convention as Snakemake/smorfs_transcript_to_genome_gtf.py.
+    """
+
+    ordered_exons = exons if strand == '+' else list(reversed(exons))
+    segments = []
+    tx_position = 1
+    for exon_start, exon_end in ordered_exons:
+        exon_tx_end = tx_position + exon_end - exon_start
+        overlap_start, overlap_end = max(orf_start_tx, tx_position), min(orf_end_tx, exon_tx_end)
+        if overlap_start <= overlap_end:
+            if strand == '+':
+                segments.append((exon_start + overlap_start - tx_position, exon_start + overlap_end - tx_position))
+            else:
+                segments.append((exon_end - (overlap_end - tx_position), exon_end - (overlap_start - tx_position)))
+        tx_position = exon_tx_end + 1
+        if tx_position > orf_end_tx:
+            break
+    return segments
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a deterministic synthetic genome, smORF GTF/GFF3 and sequence table.")
+    parser.add_argument("--n_orfs", "--n-orfs", type=int)
+    parser.add_argument("--n_positives", "--n-positives", type=int, default=0,
+                        help="Also write this many annotated microproteins (reference GTF, UniProt IDs and functions)")
+    parser.add_argument("--outdir")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--demo", action="store_true", help="Write the miniature reference bundled for `shortstop demo`")
+    parser.add_argument("--force", action="store_true", help="Regenerate even if the files exist")
+    args = parser.parse_args()
+
+    if args.demo:
+        dataset = SyntheticDataset.demo(args.outdir or DEMO_DIR)
+    elif args.n_orfs is None or args.outdir is None:
+        parser.error("--n_orfs and --outdir are required unless --demo is given")
+    else:
+        dataset = SyntheticDataset(args.n_orfs, args.outdir, seed=args.seed, n_positives=args.n_positives)
+    dataset.generate(force=args.force)
+    for path in dataset.files():
+        print(f"[OK] Wrote: {path}")
+
+
+if __name__ == "__main__":
+    main()